@@ -17,8 +17,9 @@ from io import BytesIO
 from streamlit.components.v1 import html
 
 from functions import (
-    hent_alle_wkt,
-    lag_felles_kart
+    hent_kartgeometri,
+    lag_kart_fra_geometri,
+    solhoyde_og_lyskategori_utm
 )
 
 st.set_page_config(
@@ -192,10 +193,18 @@ if not artsvalg:
 
 df_filt = df[df["Art"].isin(artsvalg)].copy()
 
+# Lysforhald no for kvar vegstrekning sin eigen posisjon (fell tilbake til Trøndelag-punktet)
+_, df_filt["lysforhold"] = solhoyde_og_lyskategori_utm(
+    datetime.now(tz=ZoneInfo("Europe/Oslo")),
+    df_filt["UTM33_øst_int_avg"],
+    df_filt["UTM_nord_int_avg"],
+)
+df_filt["lysforhold"] = df_filt["lysforhold"].fillna(LYSFORHOLD_NO)
+
 df_filt["predikert_risiko"] = (
     df_filt["frekvens"]
     * ARSTID_JUSTERING[DAGENS_ÅRSTID]
-    * LYS_JUSTERING[LYSFORHOLD_NO]
+    * df_filt["lysforhold"].map(LYS_JUSTERING).fillna(LYS_JUSTERING[LYSFORHOLD_NO])
 )
 
 if metric_choice == "Historisk frekvens":
@@ -473,7 +482,7 @@ if st.button("Vis kart"):
             .tolist()
         )
 
-        wkt_dict = asyncio.run(hent_alle_wkt(veg_ids))
+        geometri_dict = asyncio.run(hent_kartgeometri(veg_ids))
 
         risiko_dict = dict(
             zip(
@@ -483,8 +492,8 @@ if st.button("Vis kart"):
         )
 
         # LAG kartet og lagre i session_state
-        st.session_state.kart = lag_felles_kart(
-            wkt_dict,
+        st.session_state.kart = lag_kart_fra_geometri(
+            geometri_dict,
             risiko_dict
         )
 
@@ -1,27 +1,18 @@
 import csv
 import asyncio
-import httpx
 from tqdm import tqdm
 from typing import Dict, Tuple, Optional
 
+import nvdb_bulk
+import nvdb_klient
+
 # ---- Files ----
 # Use the output from your previous script as input here:
 input_file = 'Fallvilt_trdlag_2016-2026_vegobjekter.csv'
 output_file = 'Fallvilt_trdlag_2016-2026_adttotallengder.csv'
 
-# ---- NVDB headers (same style as before) ----
-headers = {
-    "Accept": "application/json",
-    "User-Agent": "fallvilt-posisjon-enricher/2.1-async",
-    "X-Client": "fallvilt-posisjon-enricher",
-}
-
 # ---- Controls ----
-MAX_CONCURRENCY = 16
-REQUEST_TIMEOUT = 20.0
-RETRY_BACKOFF = [0.5, 1.0, 2.0]
-
-sem = asyncio.Semaphore(MAX_CONCURRENCY)
+# Samtidigheit, takt og retry blir styrt i nvdb_klient.py
 
 # Simple cache: objekt-id (string) -> lengde (string)
 cache: Dict[str, str] = {}
@@ -32,13 +23,13 @@ LENGDE_COL_NAME = f"Vegobjekt_{VEGOBJEKT_TYPE_ID}_lengde"
 
 
 async def hent_lengde_for_objekt(
-    client: httpx.AsyncClient,
+    klient: nvdb_klient.NvdbKlient,
     objekt_id: str,
 ) -> str:
     """
     Henter 'lengde' for et spesifikt vegobjekt (type 540) ved å slå opp på /vegobjekter/540/{objekt_id}.
     Returnerer tom streng hvis ikke funnet.
-    Med enkel retry/backoff for 5xx/timeout.
+    Retry/backoff skjer i nvdb_klient.
     """
     if not objekt_id:
         return ""
@@ -46,40 +37,14 @@ async def hent_lengde_for_objekt(
     if objekt_id in cache:
         return cache[objekt_id]
 
-    url = f"https://nvdbapiles.atlas.vegvesen.no/vegobjekter/{VEGOBJEKT_TYPE_ID}/{objekt_id}"
-
-    attempts = len(RETRY_BACKOFF) + 1
-    for i in range(attempts):
-        try:
-            async with sem:
-                resp = await client.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-
-            if resp.status_code == 200:
-                data = resp.json()
-                lokasjon = data.get("lokasjon") or {}
-                lengde = lokasjon.get("lengde", data.get("lengde", ""))
-                # Behold som streng for CSV
-                val = "" if lengde is None else str(lengde)
-                cache[objekt_id] = val
-                return val
-
-            elif 500 <= resp.status_code < 600:
-                # Server-feil -> retry
-                if i < attempts - 1:
-                    await asyncio.sleep(RETRY_BACKOFF[i])
-                    continue
-                else:
-                    return ""
-            else:
-                # 4xx/annet -> ikke retry
-                return ""
-        except (httpx.HTTPError, asyncio.TimeoutError):
-            if i < attempts - 1:
-                await asyncio.sleep(RETRY_BACKOFF[i])
-                continue
-            return ""
+    data = await klient.get_json(f"/vegobjekter/{VEGOBJEKT_TYPE_ID}/{objekt_id}")
+    if data is None:
+        return ""
 
-    return ""
+    # Behold som streng for CSV
+    val = nvdb_bulk.lengde_fra_objekt(data)
+    cache[objekt_id] = val
+    return val
 
 
 async def prosesser():
@@ -109,7 +74,16 @@ async def prosesser():
         write_header.append(LENGDE_COL_NAME)
         add_new_col = True
 
-    async with httpx.AsyncClient() as client:
+    async with nvdb_klient.NvdbKlient() as klient:
+        # Hent lengde for alle unike id-ar i nokre få bulk-kall før radløkka
+        if add_new_col:
+            unike_ids = {row[id_idx].strip() for row in rows if id_idx < len(row)}
+            await nvdb_bulk.hent_vegobjekter_bulk(VEGOBJEKT_TYPE_ID, unike_ids, klient=klient)
+            for objekt_id in unike_ids:
+                nøkkel = nvdb_bulk.normaliser_id(objekt_id)
+                if nøkkel in nvdb_bulk.lengde_cache:
+                    cache[objekt_id] = nvdb_bulk.lengde_cache[nøkkel]
+
         pbar = tqdm(total=len(rows), desc="Fetching lengde for 540", unit="row")
 
         with open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
@@ -131,7 +105,7 @@ async def prosesser():
 
                 # When adding new column: fetch length if we have an id; else append ""
                 if objekt_id:
-                    lengde_val = await hent_lengde_for_objekt(client, objekt_id)
+                    lengde_val = await hent_lengde_for_objekt(klient, objekt_id)
                 else:
                     lengde_val = ""
 
@@ -140,6 +114,8 @@ async def prosesser():
 
         pbar.close()
 
+    klient.skriv_statistikk()
+
 
 if __name__ == "__main__":
     asyncio.run(prosesser())
\ No newline at end of file
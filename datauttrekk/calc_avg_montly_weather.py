@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
-import re
+
+import vaer_lager
+from fallvilt_lagring import VAER_EINING, tal_fra_eining
 
 # -------------------------------
 # 1. Les CSV
@@ -17,26 +19,40 @@ df["År"] = df["Dato"].dt.year
 df["Måned"] = df["Dato"].dt.month
 
 # -------------------------------
-# 3. Funksjon for å trekke ut tall fra verdier som "4 cm", "-3.8 degC", "6.4 m/s"
+# 3-4. Rense værkolonner
 # -------------------------------
 
-def extract_num(value):
-    if pd.isna(value):
-        return np.nan
-    # Finn første tall med optional minus og desimal
-    match = re.search(r"-?\d+[\.,]?\d*", str(value))
-    if match:
-        return float(match.group().replace(",", "."))
-    return np.nan
-
-# -------------------------------
-# 4. Rense værkolonner
-# -------------------------------
+# Værkolonnene er tall i einingane i VAER_EINING; eldre filer har strenger som
+# "4 cm", "-3.8 degC", "6.4 m/s", som tal_fra_eining tolker vektorisert
 
 weather_columns = ["snow_depth", "mean_temperature", "mean_wind_speed"]
 
+# Tal frå vêrlageret (vaer_lager.sqlite) for (weather_station_id, Dato) blir brukt først;
+# teksten i CSV-en er reserve for rader lageret ikkje har.
+# Snødybda kan kome frå ein annan stasjon enn weather_station_id, så ho blir lesen frå teksten.
+LAGER_ELEMENT = {
+    "snow_depth": [],
+    "mean_temperature": ["mean(air_temperature P1D)"],
+    "mean_wind_speed": ["mean(wind_speed P1D)"],
+}
+
+par = pd.DataFrame({
+    "station": df["weather_station_id"].fillna("").astype(str) if "weather_station_id" in df.columns else "",
+    "dato": df["Dato"].dt.strftime("%Y-%m-%d"),
+}, index=df.index)
+lager = vaer_lager.hent_observasjonar(
+    par[par["station"] != ""], [e for liste in LAGER_ELEMENT.values() for e in liste]
+)
+
 for col in weather_columns:
-    df[col] = df[col].apply(extract_num)
+    fra_tekst = tal_fra_eining(df[col], VAER_EINING[col])
+    element = LAGER_ELEMENT[col]
+    obs = lager[lager["element"].isin(element)]
+    obs = (obs.assign(prioritet=obs["element"].map({e: i for i, e in enumerate(element)}))
+              .sort_values("prioritet", kind="stable")
+              .drop_duplicates(["station", "dato"], keep="first")[["station", "dato", "verdi"]])
+    fra_lager = par.merge(obs, on=["station", "dato"], how="left")["verdi"].to_numpy(dtype=float)
+    df[col] = pd.Series(fra_lager, index=df.index).fillna(fra_tekst)
 
 # -------------------------------
 # 5. Ugyldige verdier → NaN
@@ -1,22 +1,16 @@
-import csv
-import time
-from concurrent.futures import ThreadPoolExecutor
-import requests
-from requests.exceptions import RequestException
-from tqdm import tqdm
-from typing import Dict, Tuple, Optional
+import asyncio
+import sys
+import pandas as pd
+from typing import Dict, List
+
+import nvdb_bulk
+import nvdb_klient
+import straum
 
 # ---- Files ----
 input_file = 'Fallvilt_nvdb_enriched.csv'
 final_output_file = 'Fallvilt_nvdb_adttotallengder.csv'
 
-# ---- NVDB headers ----
-headers = {
-    "Accept": "application/json",
-    "User-Agent": "fallvilt-posisjon-enricher/2.1-async",
-    "X-Client": "fallvilt-posisjon-enricher",
-}
-
 # ---- Vegobjekter to fetch ----
 vegobjekter = [
     {"id": 540, "navn": "ÅDT, total"},
@@ -24,86 +18,20 @@ vegobjekter = [
 ]
 
 # ---- Controls ----
+# Samtidigheit, takt og retry blir styrt i nvdb_klient.py
 
-MAX_CONCURRENCY = 16
-REQUEST_TIMEOUT = 20.0
-RETRY_BACKOFF = [0.5, 1.0, 2.0]
-
-# Caches
-egenskapverdi_cache: Dict[Tuple[str, int], Tuple[str, str]] = {}  # (vegsystemreferanse, obj_id) -> (verdi, objekt_id)
+# Caches (egenskapsverdiar per vegsystemreferanse: nvdb_bulk.vsr_cache)
 lengde_cache: Dict[str, str] = {}  # objekt_id -> lengde
 
 
-def hent_egenskapsverdi_for_vegobjekt(
-    vegsystemreferanse: str,
-    obj_id: int,
-    egenskapsnavn: str,
-    session: requests.Session,
-) -> Tuple[str, str]:
-    """
-    Henter verdien til egenskapsnavn for et gitt vegobjekt-type-id på vegsystemreferanse
-    OG id-en til selve objektinstansen (første objekt i svarlisten).
-    Returnerer (verdi_str, objekt_id_str), tomme strenger hvis ikke funnet.
-    Med enkel retry for transient 5xx/timeout.
-    """
-    cache_key = (vegsystemreferanse, obj_id)
-    if cache_key in egenskapverdi_cache:
-        return egenskapverdi_cache[cache_key]
-
-    url = f"https://nvdbapiles.atlas.vegvesen.no/vegobjekter/api/v4/vegobjekter/{obj_id}"
-    params = {"vegsystemreferanse": vegsystemreferanse, "inkluder": "egenskaper"}
-
-    attempts = len(RETRY_BACKOFF) + 1
-    for i in range(attempts):
-        try:
-            resp = session.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
-            if resp.status_code == 200:
-                data = resp.json()
-
-                objekter = data.get("objekter", [])
-                objekt_id_str = ""
-                if objekter:
-                    try:
-                        objekt_id_str = "" if objekter[0].get("id") is None else str(objekter[0].get("id"))
-                    except Exception:
-                        objekt_id_str = ""
-
-                verdi_str = ""
-                for obj in objekter:
-                    for e in obj.get("egenskaper", []):
-                        if e.get("navn") == egenskapsnavn:
-                            verdi_str = "" if e.get("verdi") is None else str(e.get("verdi"))
-                            egenskapverdi_cache[cache_key] = (verdi_str, objekt_id_str)
-                            return (verdi_str, objekt_id_str)
-
-                egenskapverdi_cache[cache_key] = (verdi_str, objekt_id_str)
-                return (verdi_str, objekt_id_str)
-
-            elif 500 <= resp.status_code < 600:
-                if i < attempts - 1:
-                    time.sleep(RETRY_BACKOFF[i])
-                    continue
-                else:
-                    return ("", "")
-            else:
-                return ("", "")
-        except RequestException:
-            if i < attempts - 1:
-                time.sleep(RETRY_BACKOFF[i])
-                continue
-            return ("", "")
-
-    return ("", "")
-
-
-def hent_lengde_for_objekt(
+async def hent_lengde_for_objekt(
+    klient: nvdb_klient.NvdbKlient,
     objekt_id: str,
-    session: requests.Session,
 ) -> str:
     """
     Henter 'lengde' for et spesifikt vegobjekt (type 540) ved å slå opp på /vegobjekter/540/{objekt_id}.
     Returnerer tom streng hvis ikke funnet.
-    Med enkel retry/backoff for 5xx/timeout.
+    Retry/backoff skjer i nvdb_klient.
     """
     if not objekt_id:
         return ""
@@ -111,117 +39,102 @@ def hent_lengde_for_objekt(
     if objekt_id in lengde_cache:
         return lengde_cache[objekt_id]
 
-    url = f"https://nvdbapiles.atlas.vegvesen.no/vegobjekter/540/{objekt_id}"
-
-    attempts = len(RETRY_BACKOFF) + 1
-    for i in range(attempts):
-        try:
-            resp = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-            if resp.status_code == 200:
-                data = resp.json()
-                lokasjon = data.get("lokasjon") or {}
-                lengde = lokasjon.get("lengde", data.get("lengde", ""))
-                val = "" if lengde is None else str(lengde)
-                lengde_cache[objekt_id] = val
-                return val
-
-            elif 500 <= resp.status_code < 600:
-                if i < attempts - 1:
-                    time.sleep(RETRY_BACKOFF[i])
-                    continue
-                else:
-                    return ""
-            else:
-                return ""
-        except RequestException:
-            if i < attempts - 1:
-                time.sleep(RETRY_BACKOFF[i])
-                continue
-            return ""
+    data = await klient.get_json(f"/vegobjekter/540/{objekt_id}")
+    if data is None:
+        return ""
 
-    return ""
+    val = nvdb_bulk.lengde_fra_objekt(data)
+    lengde_cache[objekt_id] = val
+    return val
 
 
-def prosesser():
-    # Read CSV header and rows
-    with open(input_file, mode='r', encoding='utf-8') as infile:
-        reader = csv.reader(infile, delimiter=';')
-        header = next(reader)
-        rows = list(reader)
+# Batchar i arbeid samtidig deler oppslag av same objekt-id
+_hent_lengde_delt = straum.del_samtidige(hent_lengde_for_objekt)
 
-    # Detect existing vegobjekt columns
-    existing_idx: Dict[str, int] = {col_name: i for i, col_name in enumerate(header)}
+# Add lengde column for vegobjekt 540
+lengde_col_name = "Vegobjekt_540_lengde"
+id_540_col = "Vegobjekt_540_id"
 
-    # Vegobjekter already present in the input
-    existing_vegobjekter = [vo for vo in vegobjekter if vo["navn"] in existing_idx]
-    missing_vegobjekter = [vo for vo in vegobjekter if vo["navn"] not in existing_idx]
 
-    # Build output header: original columns + new vegobjekt columns
+def nye_kolonner(columns) -> List[str]:
+    """Two columns (ID + value) per vegobjekt not already in the input."""
     new_columns = []
-    vegobjekt_540_id_column = None
-    for vo in missing_vegobjekter:
-        id_col = f"Vegobjekt_{vo['id']}_id"
-        new_columns.append(id_col)
-        new_columns.append(vo["navn"])
-        if vo['id'] == 540:
-            vegobjekt_540_id_column = id_col
-
-    # Add lengde column for vegobjekt 540
-    lengde_col_name = "Vegobjekt_540_lengde"
-    if lengde_col_name not in new_columns:
-        new_columns.append(lengde_col_name)
-
-    out_header = header + new_columns
-
-    pbar = tqdm(total=len(rows), desc="Processing rows", unit="row")
-
-    with requests.Session() as session:
-        session.headers.update(headers)
-        with open(final_output_file, mode='w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile, delimiter=';')
-            writer.writerow(out_header)
-
-            with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
-                for row in rows:
-                    vsr_index = existing_idx["vegsystemreferanse.kortform"]
-                    vegsystemreferanse = row[vsr_index]
-
-                    # Submit tasks for vegobjekter missing in header
-                    futures = [
-                        executor.submit(
-                            hent_egenskapsverdi_for_vegobjekt,
-                            vegsystemreferanse,
-                            vo["id"],
-                            vo["navn"],
-                            session,
-                        )
-                        for vo in missing_vegobjekter
-                    ]
-
-                    # Retrieve results in the same order as submissions
-                    results = [f.result() for f in futures]
-
-                    merged = []
-                    objekt_540_id = None
-                    for i, (value_str, objekt_id_str) in enumerate(results):
-                        merged.append(objekt_id_str)
-                        merged.append(value_str)
-                        if missing_vegobjekter[i]['id'] == 540:
-                            objekt_540_id = objekt_id_str
-
-                    # Fetch lengde for vegobjekt 540 if we have an ID
-                    if objekt_540_id:
-                        lengde_val = hent_lengde_for_objekt(objekt_540_id, session)
-                    else:
-                        lengde_val = ""
-
-                    merged.append(lengde_val)
-
-                    writer.writerow(row + merged)
-                    pbar.update(1)
-
-    pbar.close()
+    for vo in vegobjekter:
+        if vo["navn"] not in columns:
+            new_columns.append(f"Vegobjekt_{vo['id']}_id")
+            new_columns.append(vo["navn"])
+    return new_columns
+
+
+def ut_header(header: List[str]) -> List[str]:
+    return header + [c for c in nye_kolonner(header) + [lengde_col_name] if c not in header]
+
+
+async def berik(klient: nvdb_klient.NvdbKlient, df: pd.DataFrame, segment: bool = False) -> pd.DataFrame:
+    """Egenskapsverdiar, objekt-id-ar og 540-lengde for radene i df (same rekkjefølgje)."""
+    # Vegobjekter already present in the input
+    missing_vegobjekter = [vo for vo in vegobjekter if vo["navn"] not in df.columns]
+    new_columns = nye_kolonner(df.columns)
+
+    # Pass 1: egenskapsverdiar og objekt-id per rad
+    if missing_vegobjekter and segment:
+        # Segmentoppslag: objekta per veglenkesekvens, radene plasserte med intervallsøk
+        # (540-objekta kjem med lokasjon, så lengda ligg alt i cachen etterpå)
+        tabell = await nvdb_bulk.egenskapar_for_posisjonar(
+            klient, df[nvdb_bulk.VLS_KOLONNE], df[nvdb_bulk.POSISJON_KOLONNE], missing_vegobjekter
+        )
+        df[new_columns] = tabell[new_columns].to_numpy()
+    elif missing_vegobjekter:
+        # Éitt oppslag per unik (vegsystemreferanse, objekttype), alle samtidig,
+        # flett tilbake i éin merge (left join held rekkjefølgja til radene)
+        tabell = await nvdb_bulk.egenskapstabell(
+            klient, df[nvdb_bulk.VSR_KOLONNE], missing_vegobjekter
+        )
+        df = df.merge(tabell, on=nvdb_bulk.VSR_KOLONNE, how='left')
+        df[new_columns] = df[new_columns].fillna("")
+
+    # Pass 2: lengde for alle unike 540-id-ar i nokre få bulk-kall (ids=-filter)
+    if id_540_col in df.columns:
+        unike_540 = [oid for oid in df[id_540_col].unique() if oid and oid not in lengde_cache]
+        await nvdb_bulk.hent_vegobjekter_bulk(540, unike_540, klient=klient)
+        ikkje_funne = []
+        for objekt_id in unike_540:
+            nøkkel = nvdb_bulk.normaliser_id(objekt_id)
+            if nøkkel in nvdb_bulk.lengde_cache:
+                lengde_cache[objekt_id] = nvdb_bulk.lengde_cache[nøkkel]
+            else:
+                ikkje_funne.append(objekt_id)
+        # Enkeltoppslag (samtidig) for id-ar bulk-kallet ikkje fann
+        await asyncio.gather(*[_hent_lengde_delt(klient, oid) for oid in ikkje_funne])
+        df[lengde_col_name] = df[id_540_col].map(lengde_cache).fillna("")
+    else:
+        df[lengde_col_name] = ""
+    return df
+
+
+async def prosesser(segment: bool = False, strøym: bool = False):
+    async with nvdb_klient.NvdbKlient() as klient:
+        if strøym:
+            # Faste batchar som tekst, rekkjefølgja held ved like av omsorteringsbufferen i straum.py
+            async def _batch(header: List[str], rader: List[List[str]]) -> List[List[str]]:
+                df = await berik(klient, pd.DataFrame(rader, columns=header), segment)
+                return df[ut_header(header)].to_numpy().tolist()
+
+            antal = await straum.berik_straum(
+                input_file, final_output_file, _batch, ny_header=ut_header, desc="Vegobjekter",
+                linjeskift="\n",
+            )
+        else:
+            # Les alt som tekst, så verdiane blir skrivne ut att uendra
+            df = await berik(klient, pd.read_csv(input_file, sep=';', dtype=str, keep_default_na=False), segment)
+            df.to_csv(final_output_file, sep=';', index=False)
+            antal = len(df)
+
+    klient.skriv_statistikk()
+    print(f"{antal} rader skrivne til {final_output_file}")
 
 
 if __name__ == "__main__":
-    prosesser()
+    # --segment: oppslag per veglenkesekvens (krev veglenkesekvensid/relativPosisjon frå posisjon-steget)
+    # --straum : les og skriv i faste batchar (konstant minnebruk uansett filstorleik)
+    asyncio.run(prosesser(segment="--segment" in sys.argv[1:], strøym="--straum" in sys.argv[1:]))
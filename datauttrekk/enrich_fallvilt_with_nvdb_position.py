@@ -1,8 +1,21 @@
+import asyncio
 import csv
-from typing import Dict, Any, Tuple
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+import nvdb_klient
+import straum
+
 # --- Config (add these) ---
 X_CLIENT = "fallvilt-posisjon-enricher" 
 
@@ -12,6 +25,7 @@ OUTPUT_FILE = "Fallvilt_nvdb_enriched.csv"
 
 # NVDB posisjon endpoint (Les V4, produksjon)
 POSISJON_URL = "https://nvdbapiles.atlas.vegvesen.no/vegnett/api/v4/posisjon"
+POSISJON_STI = "/vegnett/api/v4/posisjon"   # relativt til nvdb_klient.NVDB_LES_URL
 
 # Max distance (meters) from the given point to the road network
 MAKS_AVSTAND = 200
@@ -20,7 +34,7 @@ MAKS_AVSTAND = 200
 TIMEOUT = 10.0        # seconds
 MAX_RETRIES = 3
 RETRY_BACKOFF = 1.5                  # seconds, exponential backoff base
-CONCURRENCY = 16                     # tune: 8–64; lower if you hit 429/5xx
+CONCURRENCY = 16                     # tune: 8–64; lower if you hit 429/5xx (semafor + tilkoplingspool)
 
 # Columns expected in input CSV (Norwegian headers, semicolon separated)
 COL_OST = "UTM33 øst"
@@ -95,13 +109,35 @@ def extract_fields(hit: Dict[str, Any]) -> Dict[str, Any]:
     result["avstand_vegnettet_m"] = hit.get("avstand", "")
     return result
 
-import math
+# --------------------------------------------------
+# Oppslag: felles parametrar og svarhandtering
+# --------------------------------------------------
 
-def posisjon_lookup(ost: float, nord: float, headers: dict) -> Dict[str, Any]:
-    """
-    Async call to NVDB posisjon. Returns flattened dict matching NEW_COLS.
-    Also logs the exact HTTP request and any error body on failure.
-    """
+# Koordinatar blir snappa til eit rutenett (meter), så posisjonar som ligg
+# nesten oppå kvarandre deler eitt oppslag. Oppslaget blir gjort med den første
+# faktiske koordinaten i fila for ruta, så avstand_vegnettet_m og
+# relativPosisjon er eksakte for han; andre rader i same rute arvar svaret
+# (maks om lag GRID_M * 0,71 m unna). 0 = eitt oppslag per eksakt koordinat.
+GRID_M = 5.0
+
+Nøkkel = Tuple[float, float]
+Punkt = Tuple[float, float]
+
+# Statuskodar det er verdt å prøve igjen
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def snap_key(ost: float, nord: float, grid_m: float = GRID_M) -> Nøkkel:
+    """Snapp (ost, nord) til midten av ruta i rutenettet. Nøkkel for cache og deduplisering."""
+    if not grid_m:
+        return (ost, nord)
+    return (
+        (math.floor(ost / grid_m) + 0.5) * grid_m,
+        (math.floor(nord / grid_m) + 0.5) * grid_m,
+    )
+
+
+def _params(ost: float, nord: float) -> Dict[str, Any]:
     params = {
         "maks_avstand": MAKS_AVSTAND,
         "nord": nord,
@@ -110,83 +146,326 @@ def posisjon_lookup(ost: float, nord: float, headers: dict) -> Dict[str, Any]:
         # "detaljerte_lenker": False,
         # "konnekteringslenker": False,
     }
-
     # Defensive: remove None/NaN values (these will yield 400s)
-    params = {k: v for k, v in params.items() if v is not None and not (isinstance(v, float) and math.isnan(v))}
+    return {k: v for k, v in params.items() if v is not None and not (isinstance(v, float) and math.isnan(v))}
+
+
+def _fra_svar(data: Any) -> Dict[str, Any]:
+    if isinstance(data, list) and data:
+        return extract_fields(data[0])  # take first hit
+    return blank_result()
+
+
+# --------------------------------------------------
+# httpx (async): delt nvdb_klient med pool, takt og retry
+# --------------------------------------------------
+
+
+async def posisjon_lookup_async(
+    klient: nvdb_klient.NvdbKlient,
+    ost: float,
+    nord: float,
+) -> Dict[str, Any]:
+    """
+    Async call to NVDB posisjon. Returns flattened dict matching NEW_COLS.
+    Retries 429/5xx and network errors happen in nvdb_klient.
+    """
+    resp = await klient.get(POSISJON_STI, params=_params(ost, nord))
+    if resp is None:
+        return blank_result()
+    if resp.status_code != 200:
+        print("Error body (truncated to 1k):", resp.text[:1000])
+        return blank_result()
+    return _fra_svar(resp.json())
+
+
+async def hent_posisjonar_async(
+    punkt: Dict[Nøkkel, Punkt],
+    concurrency: int = CONCURRENCY,
+) -> Dict[Nøkkel, Dict[str, Any]]:
+    """Slå opp punktet for kvar nøkkel samtidig, maks `concurrency` førespurnader i gang."""
+    resultat: Dict[Nøkkel, Dict[str, Any]] = {}
+
+    async with nvdb_klient.NvdbKlient(max_concurrency=concurrency) as klient:
+        async def _ein(key):
+            resultat[key] = await posisjon_lookup_async(klient, *punkt[key])
+
+        oppgaver = [asyncio.create_task(_ein(k)) for k in punkt]
+        for fut in tqdm(asyncio.as_completed(oppgaver), total=len(oppgaver),
+                        desc="NVDB posisjon", unit="oppslag"):
+            await fut
+    klient.skriv_statistikk()
+    return resultat
+
+
+# Strøyming (--straum): svar frå tidlegare batchar, avgrensa til POSISJON_CACHE_MAKS nøklar
+# (dei minst nyleg brukte blir kasta), så minnet held seg konstant
+POSISJON_CACHE_MAKS = 100_000
+posisjon_cache: "OrderedDict[Nøkkel, Dict[str, Any]]" = OrderedDict()
+# Punktet som blir slått opp for kvar nøkkel: det første sett i fila, også når
+# nøkkelen dukkar opp att i ein seinare batch (same svar som utan strøyming)
+posisjon_punkt: "OrderedDict[Nøkkel, Punkt]" = OrderedDict()
+
+# Batchar i arbeid samtidig deler oppslag av same posisjon
+_lookup_delt = straum.del_samtidige(posisjon_lookup_async)
+
+
+def _registrer_punkt(punkt: Dict[Nøkkel, Punkt]) -> Dict[Nøkkel, Punkt]:
+    """
+    Punktet som skal slåast opp for kvar nøkkel i batchen. Må kallast før første
+    await i batchen: batchane startar i fil-rekkjefølgje, så første punkt vinn.
+    """
+    for k, p in punkt.items():
+        posisjon_punkt.setdefault(k, p)
+    return {k: posisjon_punkt[k] for k in punkt}
+
+
+async def _posisjonar(
+    klient: nvdb_klient.NvdbKlient,
+    punkt: Dict[Nøkkel, Punkt],
+    trad: Optional[Tuple[ThreadPoolExecutor, requests.Session]] = None,
+) -> Dict[Nøkkel, Dict[str, Any]]:
+    """
+    Som hent_posisjonar_async, men med ein open klient, LRU-cache og utan framdriftslinje (for batchar).
+    Med `trad` = (trådpool, session) går oppslaga med requests i trådpoolen i staden for
+    klienten; cachen blir likevel berre lesen og skriven her, i tråden til event-loopen.
+    """
+    resultat = {}
+    for k in punkt:
+        if k in posisjon_cache:
+            posisjon_cache.move_to_end(k)
+            resultat[k] = posisjon_cache[k]
+    mangler = [k for k in punkt if k not in resultat]
+
+    async def _ein(k: Nøkkel) -> None:
+        if trad is None:
+            v = await _lookup_delt(klient, *punkt[k])
+        else:
+            v = await _lookup_delt_trad(*trad, *punkt[k])
+        # Inn i cachen med ein gong, så andre batchar ser svaret før heile denne er ferdig
+        resultat[k] = posisjon_cache[k] = v
+
+    await asyncio.gather(*[_ein(k) for k in mangler])
+    while len(posisjon_cache) > POSISJON_CACHE_MAKS:
+        k, _ = posisjon_cache.popitem(last=False)
+        posisjon_punkt.pop(k, None)
+    return resultat
+
+
+# --------------------------------------------------
+# requests (trådar): éin Session med delt tilkoplingspool
+# --------------------------------------------------
+
+
+def build_session(concurrency: int = CONCURRENCY) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
+
+def posisjon_lookup(ost: float, nord: float, headers: dict,
+                    session: Optional[requests.Session] = None) -> Dict[str, Any]:
+    """
+    Synchronous call to NVDB posisjon. Returns flattened dict matching NEW_COLS.
+    Also logs the error body on failure.
+    """
+    http = session or requests
+    params = _params(ost, nord)
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = requests.get(POSISJON_URL, params=params, headers=headers, timeout=TIMEOUT)
+            resp = http.get(POSISJON_URL, params=params, headers=headers, timeout=TIMEOUT)
             if resp.status_code == 200:
-                data = resp.json()
-                if isinstance(data, list) and data:
-                    return extract_fields(data[0])  # take first hit
+                return _fra_svar(resp.json())
+            print("Error body (truncated to 1k):", resp.text[:1000])
+            if resp.status_code not in RETRY_STATUS:
                 return blank_result()
-            err_text = resp.text
-            print("Error body (truncated to 1k):", err_text[:1000])
-            import time
-            time.sleep(RETRY_BACKOFF ** attempt)
         except requests.RequestException as e:
             print(f"RequestError on attempt {attempt}: {e}")
-            import time
+        if attempt < MAX_RETRIES:
             time.sleep(RETRY_BACKOFF ** attempt)
     return blank_result()
 
-def enrich_row_with_posisjon(
-    row: Dict[str, Any],
-    cache: Dict[Tuple[float, float], Dict[str, Any]],
-    headers: dict
-) -> Dict[str, Any]:
+
+def hent_posisjonar_trad(
+    punkt: Dict[Nøkkel, Punkt],
+    headers: dict,
+    concurrency: int = CONCURRENCY,
+) -> Dict[Nøkkel, Dict[str, Any]]:
+    """Same som hent_posisjonar_async, men med requests og ein trådpool."""
+    session = build_session(concurrency)
+    resultat: Dict[Nøkkel, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(posisjon_lookup, *p, headers, session): k for k, p in punkt.items()}
+        for fut in tqdm(as_completed(futures), total=len(futures),
+                        desc="NVDB posisjon", unit="oppslag"):
+            resultat[futures[fut]] = fut.result()
+    return resultat
+
+
+async def _posisjon_lookup_trad(pool: ThreadPoolExecutor, session: requests.Session,
+                                ost: float, nord: float) -> Dict[str, Any]:
+    """posisjon_lookup i `pool` (headers ligg på session), for strøyming med requests."""
+    return await asyncio.get_running_loop().run_in_executor(pool, posisjon_lookup, ost, nord, None, session)
+
+
+# Som _lookup_delt: batchar i arbeid samtidig deler oppslag av same posisjon
+_lookup_delt_trad = straum.del_samtidige(_posisjon_lookup_trad)
+
+
+# --------------------------------------------------
+# Rader
+# --------------------------------------------------
+
+
+def row_punkt(row: Dict[str, Any]) -> Optional[Punkt]:
     ost = parse_float_locale(row.get(COL_OST))
     nord = parse_float_locale(row.get(COL_NORD))
     if ost is None or nord is None:
-        return blank_result()
+        return None
+    return (ost, nord)
 
-    key = (ost, nord)
-    cached = cache.get(key)
-    if cached is not None:
-        return cached
 
-    enriched = posisjon_lookup(ost, nord, headers)
-    cache[key] = enriched
-    return enriched
+def row_key(row: Dict[str, Any], grid_m: float = GRID_M) -> Optional[Nøkkel]:
+    p = row_punkt(row)
+    return None if p is None else snap_key(p[0], p[1], grid_m)
 
 
-def main():
-    # Read rows first (unchanged)
-    with open(INPUT_FILE, mode="r", encoding="utf-8") as infile:
-        reader = csv.DictReader(infile, delimiter=";")
-        rows = list(reader)
-        fieldnames = reader.fieldnames or []
+def nøklar_og_punkt(
+    rows: List[Dict[str, Any]],
+    grid_m: float = GRID_M,
+) -> Tuple[List[Optional[Nøkkel]], Dict[Nøkkel, Punkt]]:
+    """Snappa nøkkel per rad, og første faktiske koordinat per unik nøkkel (den blir slått opp)."""
+    keys: List[Optional[Nøkkel]] = []
+    punkt: Dict[Nøkkel, Punkt] = {}
+    for r in rows:
+        p = row_punkt(r)
+        k = None if p is None else snap_key(p[0], p[1], grid_m)
+        keys.append(k)
+        if k is not None:
+            punkt.setdefault(k, p)
+    return keys, punkt
 
+
+def enrich_rows(
+    rows: List[Dict[str, Any]],
+    headers: dict,
+    grid_m: float = GRID_M,
+    concurrency: int = CONCURRENCY,
+    backend: str = "httpx",
+) -> List[Dict[str, Any]]:
+    """
+    NVDB posisjon for alle rader, i same rekkjefølgje som `rows`.
+    Éitt oppslag per unik snappa posisjon; backend "httpx" (async, nvdb_klient)
+    eller "requests" (trådar, `headers` blir berre brukt her).
+    """
+    keys, punkt = nøklar_og_punkt(rows, grid_m)
+    print(f"{len(rows)} rader, {len(punkt)} unike posisjonar (rutenett {grid_m} m)")
+
+    if backend == "requests":
+        cache = hent_posisjonar_trad(punkt, headers, concurrency)
+    else:
+        cache = asyncio.run(hent_posisjonar_async(punkt, concurrency))
+    return [cache.get(k, blank_result()) if k is not None else blank_result() for k in keys]
+
+
+def _lokal_indeks():
+    """Snappeindeks over det nedlasta vegnettet (blir lasta ned dersom fila manglar)."""
+    # vegnett_snapping importerer frå denne modulen, så importen må ligge her
+    import vegnett_snapping as vs
+
+    vegnett = vs.last_vegnett() if os.path.exists(vs.VEGNETT_FIL) else vs.last_ned_vegnett()
+    return vs.bygg_indeks(vegnett)
+
+
+def _snapp_rader(indeks, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Lokal snapping av radene mot vegnettet, utan kall til posisjon-endepunktet."""
+    import vegnett_snapping as vs
+
+    ost = np.array([parse_float_locale(r.get(COL_OST)) for r in rows], dtype=float)
+    nord = np.array([parse_float_locale(r.get(COL_NORD)) for r in rows], dtype=float)
+    return vs.snapp(indeks, ost, nord).to_dict("records")
+
+
+def ut_header(fieldnames: List[str]) -> List[str]:
     # Append new columns (unchanged)
-    for col in NEW_COLS:
-        if col not in fieldnames:
-            fieldnames.append(col)
+    return fieldnames + [col for col in NEW_COLS if col not in fieldnames]
 
+
+async def main_straum(lokal: bool, backend: str, headers: dict):
+    """
+    Som main(), men inn-fila blir lesen i faste batchar (straum.py): éitt oppslag
+    per unik snappa posisjon i batchen, radene skrivne i opphavleg rekkjefølgje.
+    """
+    indeks = _lokal_indeks() if lokal else None
+    # requests-backend: éin Session og trådpool for heile køyringa, same LRU-cache som httpx
+    trad = None
+    if backend == "requests":
+        session = build_session()
+        session.headers.update(headers)
+        trad = (ThreadPoolExecutor(max_workers=CONCURRENCY), session)
+
+    async with nvdb_klient.NvdbKlient() as klient:
+        async def _batch(fieldnames: List[str], rader: List[List[str]]) -> List[List[str]]:
+            rows = [dict(zip(fieldnames, r)) for r in rader]
+            if indeks is not None:
+                results = _snapp_rader(indeks, rows)
+            else:
+                keys, punkt = nøklar_og_punkt(rows)
+                punkt = _registrer_punkt(punkt)
+                cache = await _posisjonar(klient, punkt, trad)
+                results = [cache.get(k, blank_result()) if k is not None else blank_result() for k in keys]
+            ut = ut_header(fieldnames)
+            for row, enriched in zip(rows, results):
+                row.update(enriched)
+            return [[row.get(c, "") for c in ut] for row in rows]
+
+        await straum.berik_straum(INPUT_FILE, OUTPUT_FILE, _batch, ny_header=ut_header, desc="NVDB posisjon")
+    klient.skriv_statistikk()
+    if trad is not None:
+        trad[0].shutdown()
+        trad[1].close()
+
+
+def main():
     # ✅ REQUIRED by NVDB Les V4: X-Client must be set
     headers = {
         "Accept": "application/json",
         "User-Agent": "fallvilt-posisjon-enricher/2.0-async",
         "X-Client": X_CLIENT,
     }
+    lokal = "--lokal" in sys.argv[1:]
+    # python enrich_fallvilt_with_nvdb_position.py --requests : trådar i staden for asyncio
+    backend = "requests" if "--requests" in sys.argv[1:] else "httpx"
+
+    if "--straum" in sys.argv[1:]:
+        # Faste batchar, konstant minnebruk uansett filstorleik
+        asyncio.run(main_straum(lokal, backend, headers))
+        print(f"✅ Enriched data written to: {OUTPUT_FILE}")
+        return
+
+    # Read rows first (unchanged)
+    with open(INPUT_FILE, mode="r", encoding="utf-8") as infile:
+        reader = csv.DictReader(infile, delimiter=";")
+        rows = list(reader)
+        fieldnames = ut_header(reader.fieldnames or [])
 
-    cache: Dict[Tuple[float, float], Dict[str, Any]] = {}
-    results: Dict[int, Dict[str, Any]] = {}
-    for i in tqdm(range(len(rows)), desc="Enriching rows", unit="row"):
-        enriched = enrich_row_with_posisjon(rows[i], cache, headers)
-        results[i] = enriched
+    if lokal:
+        # Lokal snapping mot nedlasta vegnett, utan kall til posisjon-endepunktet
+        results = _snapp_rader(_lokal_indeks(), rows)
+    else:
+        results = enrich_rows(rows, headers, backend=backend)
 
     # Write output CSV once, preserving original order
     with open(OUTPUT_FILE, mode="w", newline="", encoding="utf-8") as outfile:
         writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=";")
         writer.writeheader()
-        for i in range(len(rows)):
-            row = rows[i]
-            row.update(results.get(i, blank_result()))
+        for row, enriched in zip(rows, results):
+            row.update(enriched)
             writer.writerow(row)
 
     print(f"✅ Enriched data written to: {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
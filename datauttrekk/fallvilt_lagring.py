@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Typa kolonnelagring (Parquet) for den berika fallvilt-tabellen.
+
+Alle stega i datauttrekk/ skriv breie ;-separerte CSV-filer der tal har
+desimalkomma og alt blir lese inn att som tekst. Denne modulen:
+- gir kolonnane rette typar (flyttal, heiltal, kategoriar, datoar, bool),
+- gjer vêrkolonnar om til flyttal i faste einingar (VAER_EINING), også frå
+  eldre filer med "verdi eining"-strengar som "-3.8 degC",
+- skriv tabellen til Parquet (pyarrow) ved sida av CSV-fila,
+- les berre kolonnane ein ber om (kolonnebeskjering), frå Parquet dersom
+  fila finst og elles frå CSV med same typing.
+
+Bruk frå kommandolinja:
+    python fallvilt_lagring.py Fallvilt_tidspunkter.csv [Fallvilt_tidspunkter.parquet]
+"""
+
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------
+# Skjema
+# ---------------------------
+
+# Tal som kan ha desimalkomma eller vere lagra som tekst
+FLYTTAL = [
+    "UTM33 øst",
+    "UTM33 nord",
+    "meter",
+    "relativPosisjon",
+    "avstand_vegnettet_m",
+    "ÅDT, total",
+    "Fartsgrense",
+    "Vegobjekt_540_lengde",
+    "Veglenkesekvenslengde",
+    "monthly_snow_depth",
+    "monthly_mean_temperature",
+    "monthly_mean_wind_speed",
+]
+
+# Id-ar og heiltal (ofte skrivne som "6928.0" av pandas)
+HEILTAL = [
+    "År",
+    "Måned",
+    "Fallvilt-ID",
+    "vegnr",
+    "strekning",
+    "delstrekning",
+    "veglenkesekvensid",
+    "geometri.srid",
+    "kommune (treff)",
+    "Vegobjekt_540_id",
+    "Vegobjekt_105_id",
+]
+
+# Få ulike verdiar -> kategori
+KATEGORI = [
+    "Kommune",
+    "Art",
+    "Kjønn",
+    "Alder",
+    "Årsak",
+    "Utfall",
+    "vegkategori",
+    "fase",
+    "arm",
+    "adskilte_løp",
+    "trafikantgruppe",
+    "retning",
+    "precipitation_type",
+    "weather_station_id",
+]
+
+DATO = ["Dato", "HendelsesDatoTid", "OppdatertDatoTid"]
+
+# Vêrkolonnar: flyttal i kanoniske einingar. Eininga står her (og i Parquet-
+# metadataen), ikkje i kvar celle som "-3.8 degC".
+VAER_EINING = {
+    "snow_depth": "cm",
+    "max_temperature": "degC",
+    "min_temperature": "degC",
+    "mean_temperature": "degC",
+    "total_precipitation": "mm",
+    "max_wind_speed": "m/s",
+    "mean_wind_speed": "m/s",
+    "max_wind_gust": "m/s",
+}
+
+EINING = {
+    **VAER_EINING,
+    "monthly_snow_depth": "cm",
+    "monthly_mean_temperature": "degC",
+    "monthly_mean_wind_speed": "m/s",
+}
+
+# Faktor frå eininga i teksten til den kanoniske (manglar eininga: verdien blir brukt som han er)
+OMREKNING: Dict[str, Dict[str, float]] = {
+    "cm": {"m": 100.0, "mm": 0.1},
+    "mm": {"cm": 10.0, "m": 1000.0},
+    "m/s": {"km/h": 1 / 3.6},
+}
+
+_TAL_EINING = r"(?P<tal>-?\d+(?:[.,]\d*)?(?:[eE][-+]?\d+)?)\s*(?P<eining>[^\s\d;]*)"
+
+BOOL = ["UkjentTidspunkt"]
+
+
+# ---------------------------
+# Typing
+# ---------------------------
+
+
+def _til_flyttal(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("float64")
+    t = (
+        s.astype("string")
+        .str.replace("\u00A0", "", regex=False)
+        .str.replace(" ", "", regex=False)
+        .str.replace(",", ".", regex=False)
+    )
+    return pd.to_numeric(t, errors="coerce").astype("float64")
+
+
+def tal_fra_eining(s: pd.Series, eining: Optional[str] = None) -> pd.Series:
+    """
+    "verdi eining"-strengar ("4 cm", "-3.8 degC", "6,4 m/s") -> flyttal, vektorisert.
+    Med `eining` blir verdiar i andre kjende einingar rekna om (OMREKNING).
+    Kolonnar som alt er tal blir berre gjorde om til float64.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("float64")
+    delar = s.astype("string").str.extract(_TAL_EINING)
+    tal = pd.to_numeric(delar["tal"].str.replace(",", ".", regex=False), errors="coerce").astype("float64")
+    for fra, faktor in OMREKNING.get(eining, {}).items():
+        tal = tal.mask(delar["eining"] == fra, tal * faktor)
+    return tal
+
+
+def _til_heiltal(s: pd.Series) -> pd.Series:
+    v = _til_flyttal(s)
+    # Behald berre verdiar som faktisk er heile tal
+    v = v.where(np.isclose(v, v.round()) | v.isna())
+    return v.round().astype("Int64")
+
+
+def _til_dato(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    d = pd.to_datetime(s, format="ISO8601", errors="coerce")
+    # Tidlegare steg skriv Dato som dd.mm.yyyy
+    mangler = d.isna() & s.notna()
+    if mangler.any():
+        d[mangler] = pd.to_datetime(s[mangler], format="%d.%m.%Y", errors="coerce")
+    return d
+
+
+def _til_bool(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype("boolean")
+    t = s.astype("string").str.strip().str.lower()
+    return t.map({"true": True, "false": False}).astype("boolean")
+
+
+def typ_fallvilt(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Gir kjende kolonnar rett type. Ukjende tekstkolonnar blir 'string'.
+    Kolonnar som ikkje finst i df blir hoppa over.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in VAER_EINING:
+            df[col] = tal_fra_eining(df[col], VAER_EINING[col])
+        elif col in FLYTTAL:
+            df[col] = _til_flyttal(df[col])
+        elif col in HEILTAL:
+            df[col] = _til_heiltal(df[col])
+        elif col in DATO:
+            df[col] = _til_dato(df[col])
+        elif col in BOOL:
+            df[col] = _til_bool(df[col])
+        elif col in KATEGORI:
+            df[col] = df[col].astype("string").astype("category")
+        elif df[col].dtype == object:
+            df[col] = df[col].astype("string")
+    return df
+
+
+# ---------------------------
+# Lesing / skriving
+# ---------------------------
+
+
+def parquet_sti(csv_sti: str) -> str:
+    return os.path.splitext(csv_sti)[0] + ".parquet"
+
+
+def skriv_parquet(df: pd.DataFrame, sti: str, einingar: Optional[Dict[str, str]] = None) -> None:
+    """
+    Typa Parquet; einingane til vêrkolonnane (EINING, pluss `einingar` for
+    andre kolonnar) blir lagra éin gong i metadataen ("einingar").
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as papq
+
+    tabell = pa.Table.from_pandas(typ_fallvilt(df), preserve_index=False)
+    einingar = {c: e for c, e in {**EINING, **(einingar or {})}.items() if c in tabell.column_names}
+    meta = dict(tabell.schema.metadata or {})
+    meta[b"einingar"] = json.dumps(einingar, ensure_ascii=False).encode("utf-8")
+    papq.write_table(tabell.replace_schema_metadata(meta), sti, compression="zstd")
+
+
+def les_einingar(sti: str) -> Dict[str, str]:
+    """Einingane til talkolonnane i ei Parquet-fil frå skriv_parquet (EINING for CSV)."""
+    if not sti.endswith(".parquet"):
+        return dict(EINING)
+    import pyarrow.parquet as papq
+
+    meta = papq.read_schema(sti).metadata or {}
+    return json.loads(meta.get(b"einingar", b"{}"))
+
+
+def csv_til_parquet(csv_sti: str, ut_sti: Optional[str] = None) -> str:
+    """Konverter ei ;-separert fallvilt-CSV til typa Parquet. Returnerer stien."""
+    ut_sti = ut_sti or parquet_sti(csv_sti)
+    df = pd.read_csv(csv_sti, sep=";", dtype=str, keep_default_na=False, na_values=[""])
+    skriv_parquet(df, ut_sti)
+    print(f"Skrev {len(df)} rader og {len(df.columns)} typa kolonner til {ut_sti}")
+    return ut_sti
+
+
+def _er_fersk(pq: str, csv_sti: str) -> bool:
+    """Parquet-fila er minst like ny som CSV-fila ho er laga frå."""
+    if not os.path.exists(csv_sti):
+        return True
+    return os.path.getmtime(pq) >= os.path.getmtime(csv_sti)
+
+
+def les_fallvilt(sti: str, kolonner: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Les den berika fallvilt-tabellen med typa kolonnar.
+
+    `sti` kan peike på .parquet eller .csv. For ei CSV-sti blir Parquet-fila
+    ved sida av brukt dersom ho finst og ikkje er eldre enn CSV-fila (ei
+    utdatert Parquet-fil blir ikkje lesen). `kolonner` avgrensar kva som blir
+    lese (kolonnar som ikkje finst i fila blir ignorerte).
+    """
+    pq = sti if sti.endswith(".parquet") else parquet_sti(sti)
+    if os.path.exists(pq) and (pq == sti or _er_fersk(pq, sti)):
+        if kolonner is not None:
+            import pyarrow.parquet as papq
+            finst = set(papq.read_schema(pq).names)
+            kolonner = [c for c in kolonner if c in finst]
+        return pd.read_parquet(pq, columns=kolonner)
+
+    if kolonner is not None:
+        header = pd.read_csv(sti, sep=";", nrows=0).columns
+        kolonner = [c for c in kolonner if c in header]
+    df = pd.read_csv(sti, sep=";", usecols=kolonner, dtype=str,
+                     keep_default_na=False, na_values=[""])
+    return typ_fallvilt(df)
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Bruk: python fallvilt_lagring.py <input.csv> [output.parquet]")
+        sys.exit(1)
+    csv_til_parquet(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lokal stasjonskatalog for Frost, i staden for eitt kall til
+/sources?geometry=nearest(...) per 0,45°-rute.
+
+1. last_ned_katalog() hentar alle målestasjonar (SensorSystem i Noreg) og
+   kva element kvar stasjon har tidsseriar for (availableTimeSeries), éin gong,
+   og lagrar det som JSON (frost_stasjonar.json).
+2. bygg_indeks() projiserer stasjonane til UTM33 og byggjer eit KD-tre
+   (scipy.spatial.cKDTree dersom scipy finst, elles brute force med NumPy),
+   saman med gyldigheitsperiode per (stasjon, element).
+3. naermaste() finn næraste stasjon for mange punkt om gongen, filtrert på
+   element (og dato): dei k næraste blir sjekka først, og k blir auka for
+   punkt der ingen av dei måler elementet.
+
+Slik kan t.d. snødybde kome frå næraste stasjon som faktisk måler snø, og
+stasjonen blir vald for kollisjonen, ikkje for midten av ruta.
+
+Nedlasting frå kommandolinja:
+    python frost_stasjonar.py
+Bruk i vêrberikinga (lastar ned katalogen dersom fila manglar):
+    python weather_enrichment.py --bulk
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from weather_enrichment import FROST_SOURCES_URL, frost_get
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+FROST_TIDSSERIAR_URL = "https://frost.met.no/observations/availableTimeSeries/v0.jsonld"
+KATALOG_FIL = "frost_stasjonar.json"
+
+# Element katalogen tek vare på (same som vêrberikinga spør etter)
+KATALOG_ELEMENT = [
+    "max(air_temperature P1D)",
+    "min(air_temperature P1D)",
+    "mean(air_temperature P1D)",
+    "sum(precipitation_amount P1D)",
+    "max(wind_speed P1D)",
+    "mean(wind_speed P1D)",
+    "max(wind_speed_of_gust P1D)",
+    "snow_depth",
+    "surface_snow_thickness",
+    "snow_depth_surface",
+    "air_temperature",
+]
+
+K_START = 8             # kandidatar per punkt i første runde
+BRUTE_BATCH = 5000      # punkt per batch utan scipy (held avstandsmatrisa liten)
+
+_til_utm = Transformer.from_crs("EPSG:4326", "EPSG:25833", always_xy=True)
+
+
+# ---------------------------
+# Nedlasting
+# ---------------------------
+
+
+def _stasjon_id(source_id: str) -> str:
+    """'SN18700:0' -> 'SN18700' (sensornummer blir ikkje brukt)."""
+    return str(source_id).split(":")[0]
+
+
+def last_ned_katalog(sti: str = KATALOG_FIL, element: Iterable[str] = KATALOG_ELEMENT) -> Dict[str, Any]:
+    """Hent stasjonar og tilgjengelege tidsseriar frå Frost og lagre som JSON."""
+    js = frost_get(FROST_SOURCES_URL, {
+        "types": "SensorSystem",
+        "country": "NO",
+        "fields": "id,name,geometry",
+    })
+    stasjonar = []
+    for s in js.get("data", []):
+        koord = (s.get("geometry") or {}).get("coordinates") or []
+        if len(koord) < 2:
+            continue
+        stasjonar.append({"id": s["id"], "namn": s.get("name", ""), "lon": koord[0], "lat": koord[1]})
+
+    js = frost_get(FROST_TIDSSERIAR_URL, {
+        "elements": ",".join(element),
+        "fields": "sourceId,elementId,validFrom,validTo",
+    })
+    tidsseriar = [
+        {
+            "id": _stasjon_id(t.get("sourceId", "")),
+            "element": t.get("elementId"),
+            "fra": t.get("validFrom"),
+            "til": t.get("validTo"),
+        }
+        for t in js.get("data", [])
+    ]
+
+    katalog = {"stasjonar": stasjonar, "tidsseriar": tidsseriar}
+    tmp = sti + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(katalog, f, ensure_ascii=False)
+    os.replace(tmp, sti)
+    print(f"Lagra {len(stasjonar)} stasjonar / {len(tidsseriar)} tidsseriar i {sti}")
+    return katalog
+
+
+def last_katalog(sti: str = KATALOG_FIL) -> Dict[str, Any]:
+    with open(sti, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------------------------
+# Indeks
+# ---------------------------
+
+
+def bygg_indeks(katalog: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    KD-tre over stasjonane i UTM33, og per element ein gyldigheitsperiode
+    (første fra, siste til; NaT = manglar / ope) for kvar stasjon.
+    """
+    st = pd.DataFrame(katalog["stasjonar"], columns=["id", "namn", "lon", "lat"])
+    ts = pd.DataFrame(katalog["tidsseriar"], columns=["id", "element", "fra", "til"])
+    # Berre stasjonar med minst éin tidsserie er interessante
+    st = st[st["id"].isin(ts["id"])].drop_duplicates("id").reset_index(drop=True)
+
+    x, y = _til_utm.transform(st["lon"].to_numpy(float), st["lat"].to_numpy(float))
+    xy = np.column_stack([x, y])
+
+    pos = pd.Series(np.arange(len(st)), index=st["id"])
+    ts = ts[ts["id"].isin(pos.index)]
+    ts = ts.assign(
+        nr=pos.loc[ts["id"]].to_numpy(),
+        fra=pd.to_datetime(ts["fra"], utc=True, errors="coerce").dt.tz_localize(None),
+        til=pd.to_datetime(ts["til"], utc=True, errors="coerce").dt.tz_localize(None),
+        open=ts["til"].isna(),
+    )
+
+    periode: Dict[str, Dict[str, np.ndarray]] = {}
+    for element, g in ts.groupby("element"):
+        agg = g.groupby("nr").agg(fra=("fra", "min"), til=("til", "max"), open=("open", "any"))
+        fra = np.full(len(st), np.datetime64("NaT"), dtype="datetime64[ns]")
+        til = np.full(len(st), np.datetime64("NaT"), dtype="datetime64[ns]")
+        har = np.zeros(len(st), dtype=bool)
+        nr = agg.index.to_numpy()
+        fra[nr] = agg["fra"].to_numpy("datetime64[ns]")
+        til[nr] = np.where(agg["open"], np.datetime64("NaT"), agg["til"].to_numpy("datetime64[ns]"))
+        har[nr] = True
+        periode[element] = {"har": har, "fra": fra, "til": til}
+
+    return {
+        "id": st["id"].to_numpy(str),
+        "xy": xy,
+        "tre": cKDTree(xy) if cKDTree is not None and len(xy) else None,
+        "periode": periode,
+    }
+
+
+def _k_naermaste(indeks: Dict[str, Any], punkt: np.ndarray, k: int) -> np.ndarray:
+    """Indeksar (n, k) til dei k næraste stasjonane, sorterte på avstand."""
+    n_st = len(indeks["xy"])
+    k = min(k, n_st)
+    if indeks["tre"] is not None:
+        _, idx = indeks["tre"].query(punkt, k=k)
+        return idx.reshape(len(punkt), k)
+
+    ut = np.empty((len(punkt), k), dtype=np.int64)
+    xy = indeks["xy"]
+    for a in range(0, len(punkt), BRUTE_BATCH):
+        p = punkt[a:a + BRUTE_BATCH]
+        d2 = ((p[:, None, :] - xy[None, :, :]) ** 2).sum(axis=2)
+        idx = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < n_st else np.tile(np.arange(n_st), (len(p), 1))
+        rekkjefølgje = np.argsort(np.take_along_axis(d2, idx, axis=1), axis=1)
+        ut[a:a + BRUTE_BATCH] = np.take_along_axis(idx, rekkjefølgje, axis=1)
+    return ut
+
+
+def _dekkjer(indeks: Dict[str, Any], element: List[str], kand: np.ndarray, dato: Optional[np.ndarray]) -> np.ndarray:
+    """(n, k) bool: stasjonen kand[i, j] måler minst eitt av elementa (på dato[i])."""
+    ok = np.zeros(kand.shape, dtype=bool)
+    for e in element:
+        p = indeks["periode"].get(e)
+        if p is None:
+            continue
+        treff = p["har"][kand]
+        if dato is not None:
+            d = dato[:, None]
+            fra, til = p["fra"][kand], p["til"][kand]
+            # Punkt utan dato blir ikkje filtrerte på periode
+            treff &= np.isnat(d) | ((np.isnat(fra) | (fra <= d)) & (np.isnat(til) | (til >= d)))
+        ok |= treff
+    return ok
+
+
+def naermaste(
+    indeks: Dict[str, Any],
+    ost: np.ndarray,
+    nord: np.ndarray,
+    element: Optional[Iterable[str]] = None,
+    dato: Optional[Iterable[Any]] = None,
+    k_start: int = K_START,
+) -> np.ndarray:
+    """
+    Id til næraste stasjon per punkt (UTM33), "" for ugyldige punkt eller
+    når ingen stasjon måler elementet. Med `element` må stasjonen ha minst eitt
+    av elementa; med `dato` må tidsserien òg vere gyldig den dagen.
+    """
+    ost = np.asarray(ost, dtype=float)
+    nord = np.asarray(nord, dtype=float)
+    ut = np.full(len(ost), "", dtype=object)
+    n_st = len(indeks["xy"])
+    if n_st == 0:
+        return ut
+
+    gyldig = np.isfinite(ost) & np.isfinite(nord)
+    dag = None
+    if dato is not None:
+        dag = pd.to_datetime(pd.Series(list(dato)), errors="coerce").to_numpy("datetime64[ns]")
+    element = list(element) if element is not None else None
+
+    att = np.flatnonzero(gyldig)
+    k = k_start
+    while len(att):
+        punkt = np.column_stack([ost[att], nord[att]])
+        kand = _k_naermaste(indeks, punkt, k)
+        if element is None:
+            ok = np.ones(kand.shape, dtype=bool)
+        else:
+            ok = _dekkjer(indeks, element, kand, dag[att] if dag is not None else None)
+        funne = ok.any(axis=1)
+        første = ok.argmax(axis=1)
+        ut[att[funne]] = indeks["id"][kand[funne, første[funne]]]
+        if k >= n_st:
+            break
+        att = att[~funne]
+        k = min(k * 4, n_st)
+    return ut
+
+
+def main():
+    last_ned_katalog()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,14 +9,24 @@ Endringer / oppførsel:
 - Legger til standardiserte kolonner: `Dato`, `År`, `Kommune`, `Stedfesting`, `Art`, `Kjønn`, `Alder`, `Årsak`, `Utfall`, `Merkelappnummer`, `Fallvilt-ID`, `UTM33 øst`, `UTM33 nord`.
 - BEHOLDER alle opprinnelige kolonner fra API-responsen; fjerner ingen råkolonner.
 - Hvis en original kolonne har et annet navn enn standarden, opprettes standardkolonnen ved siden av (dvs. vi legger til eller eventuelt overskriver med samme navn, men aldri sletter opprinnelige kolonner).
+- Med `--delta` hentes bare nye og endrede registreringer siden forrige synk (høyvannsmerke i fallvilt_synk.json), som upsertes på Fallvilt-ID.
+  Begrensning: API-et filtrerer på hendelsesdato, så hentevinduet starter OVERLAPP_DAGER før siste hendelse.
+  Endringer på eldre hendelser blir aldri hentet med `--delta`; kjør en full henting (uten flagg) for å fange dem.
+- Med `--parallell` hentes sidene parallelt og skrives til fallvilt_sider/ med checkpoint, slik at en avbrutt henting kan gjenopptas.
 """
 
 import datetime as dt
+import io
+import json
 import math
+import os
 import sys
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
 
+import numpy as np
 import pandas as pd
 import requests
 from requests.adapters import HTTPAdapter, Retry
@@ -33,60 +43,75 @@ def wgs84_to_utm33(lat_deg: float, lon_deg: float):
     Konverterer WGS84-geografiske koordinater (grader) til UTM sone 33N (EPSG:32633).
     Returnerer (Easting, Northing) i meter.
 
+    Eitt punkt gjennom wgs84_to_utm33_array, så formlane finst berre éin stad.
+    """
+    x, y = wgs84_to_utm33_array([lat_deg], [lon_deg])
+    return float(x[0]), float(y[0])  # (E, N)
+
+
+def wgs84_to_utm33_array(lat_deg, lon_deg):
+    """
+    Konverterer mange WGS84-punkt (grader) til UTM sone 33N (EPSG:32633) samtidig.
     Kilde: Standard UTM-formler (Transverse Mercator) med WGS84-ellipsoideparametre.
+    Tek imot array/Series med grader (tekst blir tolka, ugyldige verdiar -> NaN)
+    og returnerer (Easting, Northing) som float-array. Rader der lat eller lon
+    manglar eller ikkje er tal gir NaN i begge.
     """
+    lat_deg = pd.to_numeric(pd.Series(np.asarray(lat_deg, dtype=object)), errors="coerce").to_numpy(dtype=float)
+    lon_deg = pd.to_numeric(pd.Series(np.asarray(lon_deg, dtype=object)), errors="coerce").to_numpy(dtype=float)
+
+    x = np.full(lat_deg.shape, np.nan)
+    y = np.full(lat_deg.shape, np.nan)
+    gyldig = np.isfinite(lat_deg) & np.isfinite(lon_deg)
+    if not gyldig.any():
+        return x, y
 
     # WGS84-ellipsoide
-    a = 6378137.0                     # semi-major axis
+    a = 6378137.0
     f = 1 / 298.257223563
-    e2 = f * (2 - f)                  # eksentrisitet^2
-    ep2 = e2 / (1.0 - e2)             # sekundær eksentrisitet^2
+    e2 = f * (2 - f)
+    ep2 = e2 / (1.0 - e2)
 
-    # UTM-konstanter
+    # UTM-konstanter (sone 33N)
     k0 = 0.9996
-    lon0_deg = 15.0                   # sone 33N har sentralmeridian 15°E
-    lon0 = math.radians(lon0_deg)
+    lon0 = math.radians(15.0)
     false_easting = 500000.0
-    false_northing = 0.0              # nordlige halvkule
+    false_northing = 0.0
 
-    # Inn
-    lat = math.radians(lat_deg)
-    lon = math.radians(lon_deg)
+    lat = np.radians(lat_deg[gyldig])
+    lon = np.radians(lon_deg[gyldig])
 
-    # Hjelpestørrelser
-    sin_lat = math.sin(lat)
-    cos_lat = math.cos(lat)
-    tan_lat = math.tan(lat)
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+    tan_lat = np.tan(lat)
 
-    N = a / math.sqrt(1.0 - e2 * sin_lat * sin_lat)
+    N = a / np.sqrt(1.0 - e2 * sin_lat * sin_lat)
     T = tan_lat * tan_lat
     C = ep2 * cos_lat * cos_lat
     A = (lon - lon0) * cos_lat
 
-    # Meridional arc (M)
     e4 = e2 * e2
     e6 = e4 * e2
     M = (a * ((1 - e2/4 - 3*e4/64 - 5*e6/256) * lat
-         - (3*e2/8 + 3*e4/32 + 45*e6/1024) * math.sin(2*lat)
-         + (15*e4/256 + 45*e6/1024) * math.sin(4*lat)
-         - (35*e6/3072) * math.sin(6*lat)))
+         - (3*e2/8 + 3*e4/32 + 45*e6/1024) * np.sin(2*lat)
+         + (15*e4/256 + 45*e6/1024) * np.sin(4*lat)
+         - (35*e6/3072) * np.sin(6*lat)))
 
-    # Easting (x) og Northing (y)
     A2 = A * A
     A3 = A2 * A
     A4 = A2 * A2
     A5 = A4 * A
     A6 = A4 * A2
 
-    x = (k0 * N * (A
-         + (1 - T + C) * A3 / 6.0
-         + (5 - 18*T + T*T + 72*C - 58*ep2) * A5 / 120.0)
-         + false_easting)
+    x[gyldig] = (k0 * N * (A
+                 + (1 - T + C) * A3 / 6.0
+                 + (5 - 18*T + T*T + 72*C - 58*ep2) * A5 / 120.0)
+                 + false_easting)
 
-    y = (k0 * (M + N * tan_lat * (A2 / 2.0
-         + (5 - T + 9*C + 4*C*C) * A4 / 24.0
-         + (61 - 58*T + T*T + 600*C - 330*ep2) * A6 / 720.0))
-         + false_northing)
+    y[gyldig] = (k0 * (M + N * tan_lat * (A2 / 2.0
+                 + (5 - T + 9*C + 4*C*C) * A4 / 24.0
+                 + (61 - 58*T + T*T + 600*C - 330*ep2) * A6 / 720.0))
+                 + false_northing)
 
     return x, y  # (E, N)
 
@@ -114,10 +139,11 @@ def build_session() -> requests.Session:
     return session
 
 
-def fetch_page(session: requests.Session, params: Dict[str, Any], page: int, timeout: int = 30) -> List[Dict[str, Any]]:
+def fetch_page(session: requests.Session, params: Dict[str, Any], page: int, timeout: int = 30,
+               base_url: Optional[str] = None) -> List[Dict[str, Any]]:
     q = dict(params)
     q["page"] = page
-    resp = session.get(BASE_URL, params=q, timeout=timeout)
+    resp = session.get(base_url or BASE_URL, params=q, timeout=timeout)
     if resp.status_code != 200:
         try:
             err = resp.json()
@@ -143,6 +169,7 @@ def paginate_all(
     arsak: str = "PåkjørtAvMotorkjøretøy",
     til_dato: Optional[str] = None,
     sleep_between: float = 0.0,
+    base_url: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     session = build_session()
     params: Dict[str, Any] = {
@@ -157,7 +184,7 @@ def paginate_all(
     all_rows: List[Dict[str, Any]] = []
     page = 1
     while True:
-        rows = fetch_page(session, params, page=page)
+        rows = fetch_page(session, params, page=page, base_url=base_url)
         n = len(rows)
         print(f"Side {page}: {n} rader")
         if n == 0:
@@ -170,6 +197,149 @@ def paginate_all(
             time.sleep(sleep_between)
     return all_rows
 
+# ---------------------------
+# Parallell, gjenopptakbar henting
+# ---------------------------
+#
+# Sidene blir henta med ein avgrensa trådpool og skrivne til disk etter kvart
+# som dei kjem (mappe/side_00001.json, ...). checkpoint.json held parametrane
+# og kva sider som er ferdige, så ein avbroten køyring held fram der han slapp.
+# Talet på sider er ukjent på førehand: nye sider blir lagt i kø til ei side
+# kjem tilbake med færre enn page_size rader, og den blir siste side.
+
+CHECKPOINT_FIL = "checkpoint.json"
+
+
+def _side_fil(mappe: str, page: int) -> str:
+    return os.path.join(mappe, f"side_{page:05d}.json")
+
+
+def _skriv_atomisk(sti: str, data: Any) -> None:
+    tmp = sti + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fil:
+        json.dump(data, fil, ensure_ascii=False)
+    os.replace(tmp, sti)
+
+
+def _last_checkpoint(mappe: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Les checkpoint for same parametrar. Anna/ingen checkpoint -> start på nytt."""
+    sti = os.path.join(mappe, CHECKPOINT_FIL)
+    if os.path.exists(sti):
+        with open(sti, encoding="utf-8") as fil:
+            ckpt = json.load(fil)
+        if ckpt.get("params") == params:
+            # Berre sider som faktisk ligg på disk tel som ferdige
+            ckpt["ferdige"] = [p for p in ckpt.get("ferdige", []) if os.path.exists(_side_fil(mappe, p))]
+            return ckpt
+        print(f"Checkpoint i {mappe} gjeld andre parametrar, startar på nytt")
+        for namn in os.listdir(mappe):
+            if namn.startswith("side_") and namn.endswith(".json"):
+                os.remove(os.path.join(mappe, namn))
+    return {"params": params, "ferdige": [], "siste_side": None}
+
+
+def paginate_concurrent(
+    mappe: str,
+    fra_dato: str = "2025-01-01",
+    fylkesnr: int = 50,
+    page_size: int = 1000,
+    arsak: str = "PåkjørtAvMotorkjøretøy",
+    til_dato: Optional[str] = None,
+    max_workers: int = 4,
+    base_url: Optional[str] = None,
+) -> int:
+    """
+    Hent alle sider parallelt (max_workers samtidige) og skriv kvar side til `mappe`.
+    Kan køyrast på nytt etter avbrot; ferdige sider blir ikkje henta igjen.
+    Returnerer talet på sider. Les rader etterpå med les_sider(mappe).
+    """
+    os.makedirs(mappe, exist_ok=True)
+    params: Dict[str, Any] = {
+        "fraDato": fra_dato,
+        "fylkesnr": fylkesnr,
+        "pageSize": page_size,
+        "arsak": arsak,
+    }
+    if til_dato:
+        params["tilDato"] = til_dato
+
+    ckpt = _last_checkpoint(mappe, params)
+    ferdige = set(ckpt["ferdige"])
+    siste_side: Optional[int] = ckpt.get("siste_side")
+    if ferdige:
+        print(f"Gjenopptek: {len(ferdige)} sider ferdige frå før")
+
+    lokal = threading.local()
+
+    def _hent(page: int) -> int:
+        # requests.Session er ikkje trådsikker, så kvar tråd har si eiga
+        if not hasattr(lokal, "session"):
+            lokal.session = build_session()
+        rows = fetch_page(lokal.session, params, page=page, base_url=base_url)
+        _skriv_atomisk(_side_fil(mappe, page), rows)
+        return len(rows)
+
+    def _lagre_checkpoint() -> None:
+        _skriv_atomisk(os.path.join(mappe, CHECKPOINT_FIL), {
+            "params": params,
+            "ferdige": sorted(ferdige),
+            "siste_side": siste_side,
+        })
+
+    _lagre_checkpoint()
+    neste = 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        i_gang: Dict[Any, int] = {}
+        while True:
+            # Fyll poolen med sider som ikkje er ferdige og ikkje er etter siste side
+            while len(i_gang) < max_workers and (siste_side is None or neste <= siste_side):
+                if neste not in ferdige:
+                    i_gang[pool.submit(_hent, neste)] = neste
+                neste += 1
+            if not i_gang:
+                break
+
+            ferdig_no, _ = wait(i_gang, return_when=FIRST_COMPLETED)
+            feil: Optional[BaseException] = None
+            for fut in ferdig_no:
+                page = i_gang.pop(fut)
+                if fut.exception() is not None:
+                    feil = feil or fut.exception()
+                    continue
+                n = fut.result()
+                print(f"Side {page}: {n} rader")
+                ferdige.add(page)
+                if n < page_size and (siste_side is None or page < siste_side):
+                    siste_side = page
+            _lagre_checkpoint()
+            if feil is not None:
+                # Feil etter retries stoppar køyringa; ferdige sider er lagra i checkpoint
+                for fut in i_gang:
+                    fut.cancel()
+                raise feil
+
+    # Sider etter siste side (henta før slutten var kjend) skal ikkje vere med
+    for page in [p for p in ferdige if siste_side is not None and p > siste_side]:
+        os.remove(_side_fil(mappe, page))
+        ferdige.discard(page)
+    _lagre_checkpoint()
+    return len(ferdige)
+
+
+def les_side_for_side(mappe: str) -> Iterator[List[Dict[str, Any]]]:
+    """Sidene i `mappe` som lister av rader, i siderekkjefølgje (éi side i minnet om gongen)."""
+    with open(os.path.join(mappe, CHECKPOINT_FIL), encoding="utf-8") as fil:
+        ckpt = json.load(fil)
+    for page in sorted(ckpt["ferdige"]):
+        with open(_side_fil(mappe, page), encoding="utf-8") as fil:
+            yield json.load(fil)
+
+
+def les_sider(mappe: str) -> Iterator[Dict[str, Any]]:
+    """Rader frå sidene i `mappe`, i siderekkjefølgje."""
+    for rows in les_side_for_side(mappe):
+        yield from rows
+
 # ---------------------------
 # Transformasjon til ønsket CSV
 # ---------------------------
@@ -182,16 +352,17 @@ def _first_existing(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
     return None
 
 
-def to_csv_custom(rows: List[Dict[str, Any]], out_csv: str) -> None:
-    # Ønsket sluttkolonner i rekkefølge
-    desired = ["Dato", "År", "Kommune", "Stedfesting", "Art", "Kjønn", "Alder",
-               "Årsak", "Utfall", "Merkelappnummer", "Fallvilt-ID", "UTM33 øst", "UTM33 nord", "OppdatertDatoTid"]
+# Ønsket sluttkolonner i rekkefølge
+DESIRED = ["Dato", "År", "Kommune", "Stedfesting", "Art", "Kjønn", "Alder",
+           "Årsak", "Utfall", "Merkelappnummer", "Fallvilt-ID", "UTM33 øst", "UTM33 nord", "OppdatertDatoTid"]
+
+
+def to_dataframe_custom(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Rader fra API-et -> DataFrame med standardkolonnene sist (samme som i CSV-en)."""
+    desired = DESIRED
 
     if not rows:
-        pd.DataFrame(columns=desired).to_csv(
-            out_csv, index=False, encoding="utf-8")
-        print(f"Ingen rader hentet. Tom CSV skrevet til {out_csv}")
-        return
+        return pd.DataFrame(columns=desired)
 
     df = pd.json_normalize(rows, sep=".")
 
@@ -251,20 +422,10 @@ def to_csv_custom(rows: List[Dict[str, Any]], out_csv: str) -> None:
 
     # Riktig projeksjon: WGS84 -> UTM 33N (EPSG:32633)
     if lat_col and lon_col:
-        def _proj_row(lat, lon):
-            if pd.isna(lat) or pd.isna(lon):
-                return pd.Series([pd.NA, pd.NA])
-            try:
-                e, n = wgs84_to_utm33(float(lat), float(lon))
-                return pd.Series([e, n])
-            except Exception:
-                return pd.Series([pd.NA, pd.NA])
-
-        utm = df[[lat_col, lon_col]].apply(
-            lambda s: _proj_row(s[lat_col], s[lon_col]), axis=1)
-        utm.columns = ["UTM33 øst", "UTM33 nord"]
-        df["UTM33 øst"] = utm["UTM33 øst"]
-        df["UTM33 nord"] = utm["UTM33 nord"]
+        # Alle rader i éin operasjon; manglande/ugyldige koordinatar gir tom verdi
+        e, n = wgs84_to_utm33_array(df[lat_col], df[lon_col])
+        df["UTM33 øst"] = e
+        df["UTM33 nord"] = n
     else:
         df["UTM33 øst"] = pd.NA
         df["UTM33 nord"] = pd.NA
@@ -275,8 +436,13 @@ def to_csv_custom(rows: List[Dict[str, Any]], out_csv: str) -> None:
         if col not in df.columns:
             df[col] = pd.NA
 
-    # Legg til OppdatertDatoTid med dagens dato og tid
-    df["OppdatertDatoTid"] = dt.datetime.now().isoformat()
+    # OppdatertDatoTid: endringstidspunkt fra API-et dersom det finnes, ellers dagens dato og tid
+    oppd_col = _first_existing(df, ["OppdatertDatoTid", "oppdatertDatoTid"])
+    naa = dt.datetime.now().isoformat()
+    if oppd_col:
+        df["OppdatertDatoTid"] = df[oppd_col].where(df[oppd_col].notna(), naa)
+    else:
+        df["OppdatertDatoTid"] = naa
 
     final_cols = list(df.columns)
     # Ensure desired columns appear at the end in desired order if they aren't already
@@ -288,16 +454,180 @@ def to_csv_custom(rows: List[Dict[str, Any]], out_csv: str) -> None:
         else:
             final_cols.append(col)
 
-    out = df.reindex(columns=final_cols).copy()
+    return df.reindex(columns=final_cols).copy()
+
+
+def to_csv_custom(rows: List[Dict[str, Any]], out_csv: str) -> None:
+    if not rows:
+        pd.DataFrame(columns=DESIRED).to_csv(
+            out_csv, index=False, encoding="utf-8")
+        print(f"Ingen rader hentet. Tom CSV skrevet til {out_csv}")
+        return
+
+    out = to_dataframe_custom(rows)
     out.to_csv(out_csv, sep=";", index=False, encoding="utf-8")
     print(f"Skrev {len(out)} rader og {len(out.columns)} kolonner til {out_csv} (inkluderer alle opprinnelige API-kolonner)")
 
+def sider_til_csv(mappe: str, out_csv: str) -> int:
+    """
+    Skriv sidene i `mappe` til out_csv éi side om gongen, med same kolonnar og
+    rekkjefølgje som to_csv_custom over alle radene. Første gjennomgang finn
+    kolonnane (dei kan variere mellom sider), andre skriv header éin gong og
+    legg til kvar side. Returnerer talet på rader.
+    """
+    råkolonner: Dict[str, None] = {}
+    for rows in les_side_for_side(mappe):
+        if rows:
+            råkolonner.update(dict.fromkeys(pd.json_normalize(rows, sep=".").columns))
+    if not råkolonner:
+        to_csv_custom([], out_csv)
+        return 0
+    kolonner = [c for c in råkolonner if c not in DESIRED] + DESIRED
+
+    antal = 0
+    with open(out_csv, "w", encoding="utf-8", newline="") as fil:
+        pd.DataFrame(columns=kolonner).to_csv(fil, sep=";", index=False)
+        for rows in les_side_for_side(mappe):
+            if not rows:
+                continue
+            to_dataframe_custom(rows).reindex(columns=kolonner).to_csv(fil, sep=";", index=False, header=False)
+            antal += len(rows)
+    print(f"Skrev {antal} rader og {len(kolonner)} kolonner til {out_csv} (inkluderer alle opprinnelige API-kolonner)")
+    return antal
+
+# ---------------------------
+# Delta-synk (bare nye og endrede registreringer)
+# ---------------------------
+#
+# fallvilt_synk.json holder høyvannsmerket for hendelsestid (Dato) og
+# OppdatertDatoTid fra forrige synk. Neste synk henter bare fra
+# høyvannsmerket minus OVERLAPP_DAGER (API-et filtrerer på hendelsesdato,
+# så etterregistreringer og rettinger på nylige hendelser fanges av
+# overlappet), og upserter på Fallvilt-ID.
+# Høyvannsmerket for OppdatertDatoTid filtrerer bare rader som uansett er
+# hentet i vinduet; endringer på eldre hendelser enn overlappet fanges bare
+# av en full henting.
+
+SYNK_FIL = "fallvilt_synk.json"
+OVERLAPP_DAGER = 30
+
+
+def _som_tekst(df: pd.DataFrame) -> pd.DataFrame:
+    """Samme tekstform som når CSV-en leses inn igjen (for sammenligning)."""
+    buf = io.StringIO()
+    df.to_csv(buf, sep=";", index=False)
+    buf.seek(0)
+    return pd.read_csv(buf, sep=";", dtype=str, keep_default_na=False)
+
+
+def delta_synk(
+    out_csv: str = "fallvilt.csv",
+    synk_fil: str = SYNK_FIL,
+    start_dato: str = "2025-01-01",
+    fylkesnr: int = 50,
+    page_size: int = 1000,
+    arsak: str = "PåkjørtAvMotorkjøretøy",
+    overlapp_dager: int = OVERLAPP_DAGER,
+    base_url: Optional[str] = None,
+) -> List[str]:
+    """
+    Hent nye og endrede fallvilt siden forrige synk og upsert dem i out_csv.
+    Uten tidligere data hentes alt fra start_dato. Returnerer endrede Fallvilt-ID.
+
+    Bare hendelser fra høyvannsmerket for hendelsesdato minus overlapp_dager
+    blir hentet: en endring på en eldre hendelse blir ikke oppdaget, selv om
+    OppdatertDatoTid er ny. Kjør en full henting jevnlig for å fange slike.
+    """
+    synk: Dict[str, Any] = {}
+    if os.path.exists(synk_fil):
+        with open(synk_fil, encoding="utf-8") as fil:
+            synk = json.load(fil)
+
+    if os.path.exists(out_csv):
+        lagra = pd.read_csv(out_csv, sep=";", dtype=str, keep_default_na=False)
+        # En full henting kan gi samme Fallvilt-ID flere ganger (sider som forskyver seg); siste vinner
+        dupl = lagra["Fallvilt-ID"].duplicated(keep="last") & (lagra["Fallvilt-ID"] != "")
+        lagra = lagra[~dupl].reset_index(drop=True)
+    else:
+        lagra = pd.DataFrame(columns=DESIRED)
+        synk = {}
+
+    fra_dato = start_dato
+    if synk.get("hendelse_hwm"):
+        fra = pd.Timestamp(synk["hendelse_hwm"]) - pd.Timedelta(days=overlapp_dager)
+        fra_dato = max(fra.strftime("%Y-%m-%d"), start_dato)
+    print(f"Delta-synk fra {fra_dato}")
+
+    rows = paginate_all(fra_dato=fra_dato, fylkesnr=fylkesnr, page_size=page_size,
+                        arsak=arsak, base_url=base_url)
+    nye = _som_tekst(to_dataframe_custom(rows))
+    nye = nye[nye["Fallvilt-ID"] != ""].drop_duplicates("Fallvilt-ID", keep="last")
+
+    # Med endringstidspunkt fra API-et: bare poster oppdatert etter høyvannsmerket er kandidater
+    api_oppdatert = any("OppdatertDatoTid" in r or "oppdatertDatoTid" in r for r in rows)
+    if api_oppdatert and synk.get("api_oppdatert") and synk.get("oppdatert_hwm"):
+        oppd = pd.to_datetime(nye["OppdatertDatoTid"], errors="coerce")
+        nye = nye[(oppd > pd.Timestamp(synk["oppdatert_hwm"])) | ~nye["Fallvilt-ID"].isin(set(lagra["Fallvilt-ID"]))]
+
+    # Sammenlign innholdet (uten OppdatertDatoTid) med det som er lagret
+    kolonner = [c for c in nye.columns if c != "OppdatertDatoTid"]
+    gamle = lagra.reindex(columns=kolonner).set_index("Fallvilt-ID")
+    er_kjent = nye["Fallvilt-ID"].isin(gamle.index)
+    ulik = pd.Series(True, index=nye.index)
+    if er_kjent.any():
+        a = nye.loc[er_kjent, kolonner].set_index("Fallvilt-ID")
+        b = gamle.loc[a.index].fillna("")
+        ulik.loc[er_kjent] = (a.fillna("") != b).any(axis=1).to_numpy()
+    endra = nye[ulik]
+    endra_id = endra["Fallvilt-ID"].tolist()
+
+    # Upsert på Fallvilt-ID
+    ut = pd.concat([lagra[~lagra["Fallvilt-ID"].isin(set(endra_id))], endra], ignore_index=True)
+    ut = ut.reindex(columns=list(dict.fromkeys(list(lagra.columns) + list(nye.columns))))
+    tmp = out_csv + ".tmp"
+    ut.to_csv(tmp, sep=";", index=False, encoding="utf-8")
+    os.replace(tmp, out_csv)
+
+    # Høyvannsmerker skrives sist, så en avbrutt synk bare gjentas
+    dato = pd.to_datetime(ut["Dato"], errors="coerce")
+    oppd_alle = pd.to_datetime(ut["OppdatertDatoTid"], errors="coerce")
+    synk = {
+        "hendelse_hwm": dato.max().strftime("%Y-%m-%d") if dato.notna().any() else None,
+        "oppdatert_hwm": oppd_alle.max().isoformat() if oppd_alle.notna().any() else None,
+        "api_oppdatert": api_oppdatert,
+        "sist_synk": dt.datetime.now().isoformat(),
+    }
+    _skriv_atomisk(synk_fil, synk)
+
+    print(f"Delta-synk: {len(rows)} rader hentet, {len(endra_id)} nye/endrede, {len(ut)} totalt i {out_csv}")
+    return endra_id
+
 # ---------------------------
 # CLI
 # ---------------------------
 
 
 def main():
+    # python get_fallvilt.py --delta : bare nye/endrede fallvilt siden forrige synk, upsert i fallvilt.csv.
+    #   Henter bare hendelser fra siste hendelsesdato minus OVERLAPP_DAGER; endringer på eldre
+    #   hendelser fanges ikke, kjør full henting (uten flagg) for det.
+    if "--delta" in sys.argv[1:]:
+        delta_synk("fallvilt.csv")
+        return
+
+    # python get_fallvilt.py --parallell : parallell henting med checkpoint i fallvilt_sider/
+    if "--parallell" in sys.argv[1:]:
+        paginate_concurrent(
+            "fallvilt_sider",
+            fra_dato="2025-01-01",
+            fylkesnr=50,
+            page_size=1000,
+            arsak="PåkjørtAvMotorkjøretøy",
+        )
+        # Side for side til CSV, utan å halde alle radene i minnet
+        sider_til_csv("fallvilt_sider", "fallvilt.csv")
+        return
+
     rows = paginate_all(
         fra_dato="2025-01-01",
         fylkesnr=50,
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk-oppslag av vegobjekt i NVDB API LES v4 med `ids=`-filteret.
+
+I staden for éin GET per vegobjekt (/vegobjekter/540/{id}) blir mange id-ar
+sende i same førespurnad, og paginering blir følgd via metadata.neste.href.
+Eitt svar fyller geometri-, lengde- og eigenskapscachen samstundes, slik at
+kart (functions.hent_alle_wkt) og lengdeberiking
+(adttotal_vegobjektlengde_enrichment / combined_vegobjekter_enrichment)
+deler same oppslag.
+
+egenskapstabell() gjer det same for oppslag på vegsystemreferanse: éitt kall per
+unik (vegsystemreferanse, objekttype) over heile fila, alle samstundes, og
+resultatet kjem som ein tabell som kan flettast inn med éin merge.
+
+egenskapar_for_posisjonar() går eitt steg vidare: alle objekt av kvar type blir
+henta éin gong per veglenkesekvens (med start-/sluttposisjon), og kvar rad blir
+plassert på rett objekt lokalt med intervallsøk i sorterte tabellar. Tal kall
+følgjer då tal veglenker, ikkje tal kollisjonar.
+
+nvdb_klient.NVDB_LES_URL kan peikast mot ein lokal stub-server ved testing.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    # Appen importerer modulen via functions.py og har ikkje tqdm; då utan framdriftslinje
+    tqdm = None
+
+try:
+    from . import nvdb_klient
+except ImportError:
+    import nvdb_klient
+
+# ---------------------------
+# Konfigurasjon (HTTP, takt og retry ligg i nvdb_klient)
+# ---------------------------
+
+IDS_PER_REQUEST = 100     # id-ar per førespurnad (held URL-en kort nok)
+SIDESTORLEIK = 1000       # antall objekt per side
+INKLUDER = "metadata,geometri,lokasjon,egenskaper"
+
+# ---------------------------
+# Cachar (objekt-id som streng -> verdi)
+# ---------------------------
+
+objekt_cache: Dict[str, Dict[str, Any]] = {}
+wkt_cache: Dict[str, str] = {}
+lengde_cache: Dict[str, str] = {}
+egenskap_cache: Dict[str, Dict[str, str]] = {}
+
+# (vegsystemreferanse, type_id) -> (egenskapsverdi, objekt_id for første objekt)
+VSR_KOLONNE = "vegsystemreferanse.kortform"
+vsr_cache: Dict[Tuple[str, int], Tuple[str, str]] = {}
+
+# Segmentoppslag: posisjon på veglenkesekvensen (frå posisjon-beriking)
+VLS_KOLONNE = "veglenkesekvensid"
+POSISJON_KOLONNE = "relativPosisjon"
+VLS_PER_REQUEST = 50      # veglenkesekvensar per førespurnad
+# type_id -> veglenkesekvensid -> [(start, slutt, objekt_id)]
+stedfesting_cache: Dict[int, Dict[str, List[Tuple[float, float, str]]]] = {}
+
+
+def normaliser_id(verdi: Any) -> str:
+    """'1024045907.0' / 1024045907 -> '1024045907'. Tom streng for manglande verdiar."""
+    if verdi is None:
+        return ""
+    s = str(verdi).strip()
+    if not s or s.lower() == "nan":
+        return ""
+    if s.endswith(".0"):
+        s = s[:-2]
+    return s
+
+
+# ---------------------------
+# Uttrekk frå eitt vegobjekt
+# ---------------------------
+
+
+def wkt_fra_objekt(obj: Dict[str, Any]) -> str:
+    # Primært: geometri.wkt, sekundært: lokasjon.geometri.wkt
+    wkt = (obj.get("geometri") or {}).get("wkt")
+    if not wkt:
+        wkt = ((obj.get("lokasjon") or {}).get("geometri") or {}).get("wkt", "")
+    return wkt or ""
+
+
+def lengde_fra_objekt(obj: Dict[str, Any]) -> str:
+    lokasjon = obj.get("lokasjon") or {}
+    lengde = lokasjon.get("lengde", obj.get("lengde", ""))
+    return "" if lengde is None else str(lengde)
+
+
+def egenskapar_fra_objekt(obj: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        e.get("navn"): ("" if e.get("verdi") is None else str(e.get("verdi")))
+        for e in obj.get("egenskaper", []) or []
+        if e.get("navn")
+    }
+
+
+def stedfestingar_fra_objekt(obj: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+    """[(veglenkesekvensid, startposisjon, sluttposisjon)] for objektet. Punkt får start == slutt."""
+    ut = []
+    for sf in (obj.get("lokasjon") or {}).get("stedfestinger", []) or []:
+        vls = normaliser_id(sf.get("veglenkesekvensid"))
+        if not vls:
+            continue
+        if "relativPosisjon" in sf:
+            start = slutt = sf.get("relativPosisjon")
+        else:
+            start, slutt = sf.get("startposisjon"), sf.get("sluttposisjon")
+        if start is None or slutt is None:
+            continue
+        ut.append((vls, float(start), float(slutt)))
+    return ut
+
+
+def registrer_objekt(obj: Dict[str, Any]) -> Optional[str]:
+    """Fyll alle cachane frå eitt vegobjekt. Returnerer objekt-id."""
+    objekt_id = normaliser_id(obj.get("id"))
+    if not objekt_id:
+        return None
+    objekt_cache[objekt_id] = obj
+    wkt_cache[objekt_id] = wkt_fra_objekt(obj)
+    lengde_cache[objekt_id] = lengde_fra_objekt(obj)
+    egenskap_cache[objekt_id] = egenskapar_fra_objekt(obj)
+    return objekt_id
+
+
+# ---------------------------
+# HTTP
+# ---------------------------
+
+
+async def _hent_batch(
+    klient: nvdb_klient.NvdbKlient,
+    type_id: int,
+    ids: List[str],
+) -> Optional[List[str]]:
+    """Hent éin batch med id-ar, følg paginering. Returnerer id-ane som kom tilbake (None ved feil)."""
+    return await _hent_sider(klient, type_id, {"ids": ",".join(ids)})
+
+
+async def _hent_sider(
+    klient: nvdb_klient.NvdbKlient,
+    type_id: int,
+    filter: Dict[str, Any],
+) -> Optional[List[str]]:
+    """
+    Hent alle objekt av `type_id` som passar `filter`, følg paginering. Returnerer id-ane,
+    eller None om ei side feila (objekta frå sidene før ligg likevel i cachen).
+    """
+    url: Optional[str] = f"/vegobjekter/api/v4/vegobjekter/{type_id}"
+    params: Optional[Dict[str, Any]] = {
+        **filter,
+        "inkluder": INKLUDER,
+        "antall": SIDESTORLEIK,
+    }
+    funne: List[str] = []
+    sett_url = set()
+
+    while url and url not in sett_url:
+        sett_url.add(url)
+        data = await klient.get_json(url, params=params, endepunkt=f"/vegobjekter/api/v4/vegobjekter/{type_id}")
+        if data is None:
+            return None
+        if not data:
+            break
+
+        objekter = data.get("objekter", []) or []
+        for obj in objekter:
+            objekt_id = registrer_objekt(obj)
+            if objekt_id:
+                funne.append(objekt_id)
+
+        metadata = data.get("metadata") or {}
+        if not objekter or metadata.get("returnert", len(objekter)) == 0:
+            break
+        # Neste side: href inneheld alle parametrar
+        url = (metadata.get("neste") or {}).get("href")
+        params = None
+
+    return funne
+
+
+async def hent_vegobjekter_bulk(
+    type_id: int,
+    objekt_ids: Iterable[Any],
+    klient: Optional[nvdb_klient.NvdbKlient] = None,
+    base_url: Optional[str] = None,
+    ids_per_request: int = IDS_PER_REQUEST,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Hent mange vegobjekt av same type i få førespurnader.
+
+    Id-ar som alt ligg i objekt_cache blir ikkje henta på nytt.
+    Returnerer {objekt_id: vegobjekt-JSON} for alle id-ar som finst i cachen etterpå;
+    id-ar NVDB ikkje returnerte manglar i svaret. Utan `klient` blir det opna ein ny.
+    """
+    ids = list(dict.fromkeys(normaliser_id(v) for v in objekt_ids))
+    ids = [i for i in ids if i]
+    mangler = [i for i in ids if i not in objekt_cache]
+
+    if mangler:
+        batcher = [mangler[i:i + ids_per_request] for i in range(0, len(mangler), ids_per_request)]
+
+        async def _køyr(k: nvdb_klient.NvdbKlient):
+            await asyncio.gather(*[_hent_batch(k, type_id, b) for b in batcher])
+
+        if klient is None:
+            async with nvdb_klient.NvdbKlient(base_url=base_url) as k:
+                await _køyr(k)
+        else:
+            await _køyr(klient)
+
+    return {i: objekt_cache[i] for i in ids if i in objekt_cache}
+
+
+async def _hent_for_vegsystemreferanse(
+    klient: nvdb_klient.NvdbKlient,
+    vegsystemreferanse: str,
+    type_id: int,
+    egenskapsnavn: str,
+) -> Tuple[str, str]:
+    """
+    (verdi, objekt_id) for første objekt av `type_id` på vegsystemreferansen som har
+    egenskapen, og id-en til første objekt i svaret. Tomme strengar om ingenting finst.
+    """
+    nøkkel = (vegsystemreferanse, type_id)
+    if nøkkel in vsr_cache:
+        return vsr_cache[nøkkel]
+
+    params = {"vegsystemreferanse": vegsystemreferanse, "inkluder": "egenskaper"}
+    data = await klient.get_json(f"/vegobjekter/api/v4/vegobjekter/{type_id}", params=params)
+    if data is None:
+        # Ikkje cache feil, så ei ny køyring prøver igjen
+        return ("", "")
+
+    objekter = data.get("objekter", []) or []
+    objekt_id = normaliser_id(objekter[0].get("id")) if objekter else ""
+    verdi = ""
+    for obj in objekter:
+        eigenskapar = egenskapar_fra_objekt(obj)
+        if egenskapsnavn in eigenskapar:
+            verdi = eigenskapar[egenskapsnavn]
+            break
+
+    vsr_cache[nøkkel] = (verdi, objekt_id)
+    return vsr_cache[nøkkel]
+
+
+async def egenskapstabell(
+    klient: nvdb_klient.NvdbKlient,
+    vegsystemreferansar: Iterable[Any],
+    vegobjekter: List[Dict[str, Any]],
+) -> pd.DataFrame:
+    """
+    Slå opp alle unike (vegsystemreferanse, objekttype) samtidig (klienten avgrensar).
+
+    `vegobjekter` er lister av {"id": type_id, "navn": egenskapsnavn}.
+    Returnerer éi rad per unik vegsystemreferanse med kolonnane
+    VSR_KOLONNE, og per vegobjekt Vegobjekt_{id}_id og {navn} (strengar, "" om ukjent).
+    """
+    unike = list(dict.fromkeys(str(v) for v in vegsystemreferansar if v is not None and str(v)))
+    nøklar = [(vsr, vo) for vsr in unike for vo in vegobjekter]
+
+    pbar = tqdm(total=len(nøklar), desc="NVDB vegobjekter", unit="oppslag") if tqdm else None
+
+    async def _ein(vsr: str, vo: Dict[str, Any]) -> Tuple[str, str]:
+        svar = await _hent_for_vegsystemreferanse(klient, vsr, vo["id"], vo["navn"])
+        if pbar is not None:
+            pbar.update(1)
+        return svar
+
+    svar = await asyncio.gather(*[_ein(vsr, vo) for vsr, vo in nøklar])
+    if pbar is not None:
+        pbar.close()
+
+    tabell = pd.DataFrame({VSR_KOLONNE: unike})
+    n = len(vegobjekter)
+    for j, vo in enumerate(vegobjekter):
+        # nøklar er ordna vsr-major, så vegobjekt j ligg på plass j, j+n, j+2n, ...
+        del_svar = svar[j::n]
+        tabell[f"Vegobjekt_{vo['id']}_id"] = [objekt_id for _, objekt_id in del_svar]
+        tabell[vo["navn"]] = [verdi for verdi, _ in del_svar]
+    return tabell
+
+
+async def hent_for_veglenkesekvensar(
+    klient: nvdb_klient.NvdbKlient,
+    type_id: int,
+    veglenkesekvensar: Iterable[Any],
+    vls_per_request: int = VLS_PER_REQUEST,
+) -> Dict[str, List[Tuple[float, float, str]]]:
+    """
+    Hent alle objekt av `type_id` på veglenkesekvensane (éin gong per sekvens),
+    med lokasjon, så lengde/eigenskapar havnar i cachane på vegen.
+    Returnerer {veglenkesekvensid: [(start, slutt, objekt_id)]}.
+    """
+    per_vls = stedfesting_cache.setdefault(type_id, {})
+    ids = list(dict.fromkeys(normaliser_id(v) for v in veglenkesekvensar))
+    mangler = [i for i in ids if i and i not in per_vls]
+
+    batcher = [mangler[i:i + vls_per_request] for i in range(0, len(mangler), vls_per_request)]
+    # Heile sekvensen: 0-1@id
+    svar = await asyncio.gather(*[
+        _hent_sider(klient, type_id, {"veglenkesekvens": ",".join(f"0-1@{v}" for v in b)})
+        for b in batcher
+    ])
+
+    # Berre batchar der alle sidene kom tilbake blir cacha; ein feila batch
+    # skal ikkje sjå ut som "ingen objekt på sekvensen" resten av køyringa
+    spurde = {vls for b, funne in zip(batcher, svar) if funne is not None for vls in b}
+    feila = len(mangler) - len(spurde)
+    if feila:
+        print(f"NVDB {type_id}: {feila} veglenkesekvensar ikkje henta (feil mot API-et)")
+    nye: Dict[str, List[Tuple[float, float, str]]] = defaultdict(list)
+    for objekt_id in dict.fromkeys(oid for funne in svar if funne is not None for oid in funne):
+        for vls, start, slutt in stedfestingar_fra_objekt(objekt_cache[objekt_id]):
+            if vls in spurde:
+                nye[vls].append((min(start, slutt), max(start, slutt), objekt_id))
+    for vls in mangler:
+        if vls in spurde:
+            per_vls[vls] = nye.get(vls, [])
+
+    return {i: per_vls[i] for i in ids if i in per_vls}
+
+
+def finn_intervall(
+    intervall_vls: np.ndarray,
+    intervall_start: np.ndarray,
+    intervall_slutt: np.ndarray,
+    vls: np.ndarray,
+    posisjon: np.ndarray,
+) -> np.ndarray:
+    """
+    Indeks til intervallet (på same veglenkesekvens) som dekkjer posisjonen, -1 om ingen.
+
+    vls-kodane er heiltal, posisjonar i [0, 1]. Intervalla blir sorterte på
+    nøkkelen kode * 2 + start, og kvar posisjon slår opp siste intervall som
+    startar før han (searchsorted). Overlappande intervall (t.d. fartsgrense per
+    køyreretning) som ikkje blir fanga slik, blir sjekka eitt for eitt etterpå.
+    """
+    n = len(intervall_start)
+    treff = np.full(len(posisjon), -1, dtype=np.int64)
+    if n == 0 or len(posisjon) == 0:
+        return treff
+
+    rekkjefølgje = np.lexsort((intervall_start, intervall_vls))
+    s_vls = intervall_vls[rekkjefølgje]
+    s_start = intervall_start[rekkjefølgje]
+    s_slutt = intervall_slutt[rekkjefølgje]
+    nøkkel = s_vls * 2.0 + s_start
+
+    gyldig = (vls >= 0) & np.isfinite(posisjon)
+    q = np.where(gyldig, vls * 2.0 + np.where(gyldig, posisjon, 0.0), -1.0)
+    idx = np.searchsorted(nøkkel, q, side="right") - 1
+    i = np.clip(idx, 0, n - 1)
+    dekt = gyldig & (idx >= 0) & (s_vls[i] == vls) & (s_slutt[i] >= posisjon)
+    treff[dekt] = rekkjefølgje[i[dekt]]
+
+    # Rest: posisjonar på sekvensar med intervall, men utan treff i første forsøk
+    if np.any(gyldig & ~dekt):
+        første = np.searchsorted(s_vls, vls, side="left")
+        for r in np.flatnonzero(gyldig & ~dekt):
+            j = første[r]
+            while j < n and s_vls[j] == vls[r] and s_start[j] <= posisjon[r]:
+                if s_slutt[j] >= posisjon[r]:
+                    treff[r] = rekkjefølgje[j]
+                    break
+                j += 1
+    return treff
+
+
+async def egenskapar_for_posisjonar(
+    klient: nvdb_klient.NvdbKlient,
+    veglenkesekvensar: Iterable[Any],
+    posisjonar: Iterable[Any],
+    vegobjekter: List[Dict[str, Any]],
+) -> pd.DataFrame:
+    """
+    Segmentoppslag: same kolonnar som egenskapstabell(), men éi rad per posisjon
+    (same rekkjefølgje som inn). Objekta blir henta per veglenkesekvens og
+    plasserte med finn_intervall(); "" der ingen objekt dekkjer posisjonen.
+    """
+    vls_str = pd.Series([normaliser_id(v) for v in veglenkesekvensar], dtype=object)
+    pos = pd.to_numeric(pd.Series(list(posisjonar), dtype=object), errors="coerce").to_numpy(float)
+    koder, unike = pd.factorize(vls_str.where(vls_str != ""))   # "" -> -1
+
+    per_type = await asyncio.gather(*[
+        hent_for_veglenkesekvensar(klient, vo["id"], unike) for vo in vegobjekter
+    ])
+
+    kode_for = {v: k for k, v in enumerate(unike)}
+    tabell = pd.DataFrame(index=range(len(vls_str)))
+    for vo, intervall in zip(vegobjekter, per_type):
+        rader = [(kode_for[v], a, b, oid) for v, liste in intervall.items() for a, b, oid in liste]
+        i_vls = np.array([r[0] for r in rader], dtype=np.int64)
+        i_start = np.array([r[1] for r in rader], dtype=float)
+        i_slutt = np.array([r[2] for r in rader], dtype=float)
+        i_oid = np.array([r[3] for r in rader] + [""], dtype=object)
+        treff = finn_intervall(i_vls, i_start, i_slutt, koder, pos)
+
+        objekt_id = pd.Series(i_oid[treff])          # -1 peikar på "" til slutt
+        verdi_for = {oid: egenskap_cache.get(oid, {}).get(vo["navn"], "") for oid in objekt_id.unique() if oid}
+        tabell[f"Vegobjekt_{vo['id']}_id"] = objekt_id
+        tabell[vo["navn"]] = objekt_id.map(verdi_for).fillna("")
+    return tabell
+
+
+def hent_vegobjekter_bulk_sync(type_id: int, objekt_ids: Iterable[Any], **kwargs) -> Dict[str, Dict[str, Any]]:
+    """Synkron innpakning for skript som brukar requests/trådar."""
+    return asyncio.run(hent_vegobjekter_bulk(type_id, objekt_ids, **kwargs))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Felles asynkron klient mot NVDB API LES v4.
+
+Alle stega som snakkar med NVDB (og kartet i appen) går gjennom denne, så
+gjennomstrøyming kan justerast på éin stad:
+
+- éin httpx.AsyncClient med keep-alive-pool (HTTP/2 dersom pakka `h2` finst),
+- avgrensa tal samtidige førespurnader (semafor),
+- token bucket som held jamn takt (RATE_PER_SEKUND, BURST),
+- retry med backoff på 429/5xx/nettverksfeil, og Retry-After blir følgd på 429/503,
+- statistikk per endepunkt (kall, feil, retries, svartid).
+
+Semafor og lås blir laga når klienten blir opna (inne i event-loopen),
+ikkje når modulen blir importert.
+
+Bruk:
+    async with NvdbKlient() as klient:
+        data = await klient.get_json("/vegobjekter/api/v4/vegobjekter/540", params={...})
+    klient.skriv_statistikk()
+"""
+
+import asyncio
+import email.utils
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import httpx
+
+# ---------------------------
+# Konfigurasjon (felles for heile pipelinen)
+# ---------------------------
+
+NVDB_LES_URL = "https://nvdbapiles.atlas.vegvesen.no"
+
+# REQUIRED by NVDB Les V4: X-Client must be set
+headers = {
+    "Accept": "application/json",
+    "User-Agent": "fallvilt-nvdb/1.0-async",
+    "X-Client": "fallvilt-nvdb",
+}
+
+REQUEST_TIMEOUT = 20.0
+RETRY_BACKOFF = [0.5, 1.0, 2.0, 4.0]
+MAKS_RETRY_AFTER = 60.0        # sekund; lengre Retry-After blir avkorta
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+MAX_CONCURRENCY = 16           # samtidige førespurnader
+RATE_PER_SEKUND = 25.0         # gjennomsnittleg takt (token bucket)
+BURST = 25                     # kor mange som kan gå med ein gong etter pause
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+_ID_SEGMENT = re.compile(r"/\d{5,}(?=/|$)")
+
+
+def endepunkt_for(url: str) -> str:
+    """'/vegobjekter/540/1024045907' -> '/vegobjekter/540/{id}' (lange tal-id-ar blir slått saman)."""
+    sti = httpx.URL(url).path
+    return _ID_SEGMENT.sub("/{id}", sti)
+
+
+def retry_after_sekund(verdi: Optional[str]) -> Optional[float]:
+    """Retry-After som sekund eller HTTP-dato -> sekund å vente (None om ugyldig)."""
+    if not verdi:
+        return None
+    try:
+        return max(0.0, float(verdi))
+    except ValueError:
+        pass
+    try:
+        tid = email.utils.parsedate_to_datetime(verdi)
+    except (TypeError, ValueError):
+        return None
+    if tid is None:
+        return None
+    return max(0.0, tid.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Enkel token bucket: `rate` token per sekund, maks `kapasitet` spart opp."""
+
+    def __init__(self, rate: float, kapasitet: float):
+        self.rate = rate
+        self.kapasitet = kapasitet
+        self.token = kapasitet
+        self.sist = time.monotonic()
+        self._lås = asyncio.Lock()
+
+    async def ta(self) -> None:
+        if not self.rate:
+            return
+        async with self._lås:
+            while True:
+                no = time.monotonic()
+                self.token = min(self.kapasitet, self.token + (no - self.sist) * self.rate)
+                self.sist = no
+                if self.token >= 1:
+                    self.token -= 1
+                    return
+                await asyncio.sleep((1 - self.token) / self.rate)
+
+
+class NvdbKlient:
+    """Delt NVDB-klient. Må opnast med `async with` før bruk."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        rate_per_sekund: float = RATE_PER_SEKUND,
+        burst: int = BURST,
+        timeout: float = REQUEST_TIMEOUT,
+        http2: Optional[bool] = None,
+    ):
+        self.base_url = (base_url or NVDB_LES_URL).rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.rate_per_sekund = rate_per_sekund
+        self.burst = burst
+        self.timeout = timeout
+        self.http2 = HTTP2 if http2 is None else http2
+        self.statistikk: Dict[str, Dict[str, Any]] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self) -> "NvdbKlient":
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+        )
+        self._client = httpx.AsyncClient(limits=limits, http2=self.http2, headers=headers)
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(self.rate_per_sekund, self.burst)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _stat(self, endepunkt: str) -> Dict[str, Any]:
+        if endepunkt not in self.statistikk:
+            self.statistikk[endepunkt] = {
+                "kall": 0, "feil": 0, "retries": 0,
+                "sekund_totalt": 0.0, "sekund_maks": 0.0, "status": Counter(),
+            }
+        return self.statistikk[endepunkt]
+
+    async def get(
+        self,
+        sti_eller_url: str,
+        params: Optional[Dict[str, Any]] = None,
+        endepunkt: Optional[str] = None,
+    ) -> Optional[httpx.Response]:
+        """
+        GET med rate limiting og retry. Returnerer siste svar (kan vere 4xx),
+        eller None dersom alle forsøk feila med nettverksfeil/429/5xx.
+        """
+        if self._client is None:
+            raise RuntimeError("NvdbKlient må opnast med 'async with' før bruk")
+        url = sti_eller_url if sti_eller_url.startswith("http") else self.base_url + sti_eller_url
+        stat = self._stat(endepunkt or endepunkt_for(url))
+
+        forsøk = len(RETRY_BACKOFF) + 1
+        for i in range(forsøk):
+            vent = RETRY_BACKOFF[i] if i < len(RETRY_BACKOFF) else None
+            try:
+                await self._bucket.ta()
+                async with self._sem:
+                    start = time.monotonic()
+                    resp = await self._client.get(url, params=params, timeout=self.timeout)
+                    brukt = time.monotonic() - start
+                stat["kall"] += 1
+                stat["sekund_totalt"] += brukt
+                stat["sekund_maks"] = max(stat["sekund_maks"], brukt)
+                stat["status"][resp.status_code] += 1
+
+                if resp.status_code not in RETRY_STATUS:
+                    if resp.status_code >= 400:
+                        stat["feil"] += 1
+                    return resp
+
+                if resp.status_code in (429, 503):
+                    ra = retry_after_sekund(resp.headers.get("Retry-After"))
+                    if ra is not None:
+                        vent = min(ra, MAKS_RETRY_AFTER)
+            except (httpx.HTTPError, asyncio.TimeoutError):
+                stat["kall"] += 1
+                stat["status"]["nettverk"] += 1
+
+            if vent is None or i == forsøk - 1:
+                break
+            stat["retries"] += 1
+            await asyncio.sleep(vent)
+
+        stat["feil"] += 1
+        return None
+
+    async def get_json(
+        self,
+        sti_eller_url: str,
+        params: Optional[Dict[str, Any]] = None,
+        endepunkt: Optional[str] = None,
+    ) -> Optional[Any]:
+        """Som get(), men returnerer JSON ved 200 og None elles."""
+        resp = await self.get(sti_eller_url, params=params, endepunkt=endepunkt)
+        if resp is None or resp.status_code != 200:
+            return None
+        try:
+            return resp.json()
+        except ValueError:
+            return None
+
+    def skriv_statistikk(self) -> None:
+        for endepunkt, s in sorted(self.statistikk.items()):
+            snitt = s["sekund_totalt"] / s["kall"] if s["kall"] else 0.0
+            status = ", ".join(f"{k}: {v}" for k, v in sorted(s["status"].items(), key=lambda kv: str(kv[0])))
+            print(f"NVDB {endepunkt}: {s['kall']} kall, {s['feil']} feil, {s['retries']} retries, "
+                  f"snitt {snitt * 1000:.0f} ms, maks {s['sekund_maks'] * 1000:.0f} ms ({status})")
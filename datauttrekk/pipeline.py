@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Køyrer heile datauttrekket som ein DAG av steg i staden for manuelt skript for skript.
+
+Kvart steg deklarerer kva filer det les (inn), skriv (ut) og kva kode det
+brukar. Avhengnader blir utleidde frå filene: eit steg som les ei fil ventar
+på steget som skriv ho. Før eit steg køyrer blir det rekna ein nøkkel av
+innhaldet i inn-filene og koden (sha256). Er nøkkelen lik førre køyring og
+ut-filene uendra, blir steget hoppa over. Steg med "alltid" (hentinga frå
+API-et, som ikkje har inn-filer) køyrer kvar gong; nedstraums steg blir likevel
+hoppa over dersom ut-filene deira ikkje endra seg. Steg utan innbyrdes
+avhengnad (t.d. vêr- og tidspunktberiking) køyrer parallelt.
+
+Tilstanden ligg i pipeline_tilstand.json ved sida av skripta.
+
+Bruk:
+    python pipeline.py                 # køyr det som er utdatert
+    python pipeline.py --tørr          # vis kva som ville blitt køyrt
+    python pipeline.py --tving hent    # køyr 'hent' (og det som endrar seg nedstraums) på nytt
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from fallvilt_lagring import csv_til_parquet
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+MAPPE = os.path.dirname(os.path.abspath(__file__))
+TILSTAND_FIL = "pipeline_tilstand.json"
+JOBBAR = 3          # steg som kan køyre samtidig
+
+
+# ---------------------------
+# Funksjonssteg
+# ---------------------------
+
+
+def kopier(src: str, dst: str) -> Callable[[], None]:
+    """Steg som kopierer ei fil (der skripta ventar ulike filnamn)."""
+    def _kopier():
+        shutil.copyfile(src, dst)
+    _kopier.__name__ = f"kopier({src} -> {dst})"
+    return _kopier
+
+
+def slaa_saman_tidspunkt() -> None:
+    """Legg HendelsesDatoTid/UkjentTidspunkt frå tidspunktsteget til den månadsberika tabellen."""
+    df = pd.read_csv("Fallvilt_månedsberiket.csv", sep=";", dtype=str, keep_default_na=False)
+    tid = pd.read_csv(
+        "Fallvilt_hendelsestid.csv", sep=";", dtype=str, keep_default_na=False,
+        usecols=["Fallvilt-ID", "HendelsesDatoTid", "UkjentTidspunkt"],
+    ).drop_duplicates("Fallvilt-ID")
+    df = df.drop(columns=["HendelsesDatoTid", "UkjentTidspunkt"], errors="ignore")
+    df = df.merge(tid, on="Fallvilt-ID", how="left")
+    df.to_csv("Fallvilt_tidspunkter.csv", sep=";", index=False, encoding="utf-8")
+    csv_til_parquet("Fallvilt_tidspunkter.csv", "Fallvilt_tidspunkter.parquet")
+
+
+# ---------------------------
+# Steg (rekkjefølgja her er berre for lesbarheit; avhengnader kjem frå filene)
+# ---------------------------
+
+STEG: List[Dict[str, Any]] = [
+    {
+        # Delta-synk mot API-et: kjeldedata kan endre seg utan at noko lokalt gjer det.
+        # Endrar ikkje fallvilt.csv seg, blir resten av stega hoppa over.
+        "namn": "hent",
+        "kommando": ["get_fallvilt.py", "--delta"],
+        "alltid": True,
+        "inn": [],
+        "ut": ["fallvilt.csv"],
+        "kode": ["get_fallvilt.py"],
+    },
+    {
+        "namn": "kopi_fallvilt",
+        "funksjon": kopier("fallvilt.csv", "Fallvilt.csv"),
+        "inn": ["fallvilt.csv"],
+        "ut": ["Fallvilt.csv"],
+        "kode": [],
+    },
+    {
+        "namn": "posisjon",
+        "kommando": ["enrich_fallvilt_with_nvdb_position.py", "--straum"],
+        "inn": ["Fallvilt.csv"],
+        "ut": ["Fallvilt_nvdb_enriched.csv"],
+        "kode": ["enrich_fallvilt_with_nvdb_position.py", "nvdb_klient.py", "straum.py"],
+    },
+    {
+        "namn": "kopi_posisjon",
+        "funksjon": kopier("Fallvilt_nvdb_enriched.csv", "Fallvilt_trdlag_2016-2026_enriched.csv"),
+        "inn": ["Fallvilt_nvdb_enriched.csv"],
+        "ut": ["Fallvilt_trdlag_2016-2026_enriched.csv"],
+        "kode": [],
+    },
+    {
+        "namn": "vegobjekter",
+        "kommando": ["vegobjekter_enrichment.py"],
+        "inn": ["Fallvilt_trdlag_2016-2026_enriched.csv"],
+        "ut": ["Fallvilt_trdlag_2016-2026_vegobjekter.csv"],
+        "kode": ["vegobjekter_enrichment.py", "nvdb_bulk.py", "nvdb_klient.py"],
+    },
+    {
+        "namn": "veglenkesekvenslengde",
+        "kommando": ["veglenkesekvenslengde_enrichment.py", "--straum"],
+        "inn": ["Fallvilt_trdlag_2016-2026_vegobjekter.csv"],
+        "ut": ["Fallvilt_trdlag_2016-2026_veglenkesekvenslengde.csv"],
+        "kode": ["veglenkesekvenslengde_enrichment.py", "nvdb_klient.py", "straum.py"],
+    },
+    {
+        "namn": "adttotal",
+        "kommando": ["adttotal_vegobjektlengde_enrichment.py"],
+        "inn": ["Fallvilt_trdlag_2016-2026_vegobjekter.csv"],
+        "ut": ["Fallvilt_trdlag_2016-2026_adttotallengder.csv"],
+        "kode": ["adttotal_vegobjektlengde_enrichment.py", "nvdb_bulk.py", "nvdb_klient.py"],
+    },
+    {
+        "namn": "vær",
+        "kommando": ["weather_enrichment.py", "--bulk"],
+        "inn": ["Fallvilt_trdlag_2016-2026_adttotallengder.csv"],
+        "ut": ["Fallvilt_beriket_med_vær.csv"],
+        "kode": ["weather_enrichment.py", "frost_stasjonar.py", "vaer_lager.py", "fallvilt_lagring.py"],
+    },
+    {
+        "namn": "månadssnitt",
+        "kommando": ["calc_avg_montly_weather.py"],
+        "inn": ["Fallvilt_beriket_med_vær.csv"],
+        "ut": ["Fallvilt_månedsberiket.csv"],
+        "kode": ["calc_avg_montly_weather.py", "vaer_lager.py", "fallvilt_lagring.py"],
+    },
+    {
+        # Trekktabell per (stasjon, dato) for regresjonane, ved sida av månadssnittet
+        "namn": "vêrtrekk",
+        "kommando": ["vaer_trekk.py"],
+        "inn": ["Fallvilt_beriket_med_vær.csv"],
+        "ut": ["Fallvilt_vaertrekk.parquet"],
+        "kode": ["vaer_trekk.py", "vaer_lager.py", "fallvilt_lagring.py"],
+    },
+    {
+        # Treng berre Fallvilt-ID, så det køyrer parallelt med vêrstega
+        "namn": "tidspunkt",
+        "kommando": ["tidspunkt_enrichment.py", "--straum", "--liste",
+                     "Fallvilt_trdlag_2016-2026_adttotallengder.csv", "Fallvilt_hendelsestid.csv"],
+        "inn": ["Fallvilt_trdlag_2016-2026_adttotallengder.csv"],
+        "ut": ["Fallvilt_hendelsestid.csv"],
+        "kode": ["tidspunkt_enrichment.py", "straum.py", "fallvilt_lagring.py", "get_fallvilt.py"],
+    },
+    {
+        "namn": "saman",
+        "funksjon": slaa_saman_tidspunkt,
+        "inn": ["Fallvilt_månedsberiket.csv", "Fallvilt_hendelsestid.csv"],
+        "ut": ["Fallvilt_tidspunkter.csv", "Fallvilt_tidspunkter.parquet"],
+        "kode": ["pipeline.py", "fallvilt_lagring.py"],
+    },
+]
+
+
+# ---------------------------
+# Hashing og tilstand
+# ---------------------------
+
+def last_tilstand(sti: str = TILSTAND_FIL) -> Dict[str, Any]:
+    if os.path.exists(sti):
+        with open(sti, encoding="utf-8") as fil:
+            return json.load(fil)
+    return {"filer": {}, "steg": {}}
+
+
+def lagre_tilstand(tilstand: Dict[str, Any], sti: str = TILSTAND_FIL) -> None:
+    tmp = sti + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fil:
+        json.dump(tilstand, fil, ensure_ascii=False, indent=2)
+    os.replace(tmp, sti)
+
+
+def fil_hash(sti: str, tilstand: Dict[str, Any]) -> Optional[str]:
+    """sha256 av fila. Gjenbrukt frå tilstanden så lenge storleik og mtime er uendra."""
+    if not os.path.exists(sti):
+        return None
+    st = os.stat(sti)
+    kjend = tilstand["filer"].get(sti)
+    if kjend and kjend[0] == st.st_size and kjend[1] == st.st_mtime_ns:
+        return kjend[2]
+
+    h = hashlib.sha256()
+    with open(sti, "rb") as fil:
+        for bit in iter(lambda: fil.read(1 << 20), b""):
+            h.update(bit)
+    digest = h.hexdigest()
+    tilstand["filer"][sti] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def steg_nøkkel(steg: Dict[str, Any], tilstand: Dict[str, Any]) -> str:
+    """Nøkkel av kommando, kode og innhaldet i inn-filene."""
+    h = hashlib.sha256()
+    h.update(json.dumps(steg.get("kommando") or getattr(steg.get("funksjon"), "__name__", "")).encode())
+    for sti in steg["kode"] + steg["inn"]:
+        h.update(sti.encode())
+        h.update((fil_hash(sti, tilstand) or "manglar").encode())
+    return h.hexdigest()
+
+
+def er_oppdatert(steg: Dict[str, Any], nøkkel: str, tilstand: Dict[str, Any]) -> bool:
+    førre = tilstand["steg"].get(steg["namn"])
+    if not førre or førre.get("nøkkel") != nøkkel:
+        return False
+    # Ut-filene må finnast og vere slik steget skreiv dei
+    return all(fil_hash(sti, tilstand) == førre["ut"].get(sti) for sti in steg["ut"])
+
+
+# ---------------------------
+# Køyring
+# ---------------------------
+
+
+def avhengnader(steg: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Steg -> stega som skriv filene det les."""
+    produsent = {sti: s["namn"] for s in steg for sti in s["ut"]}
+    return {
+        s["namn"]: sorted({produsent[sti] for sti in s["inn"] if sti in produsent} - {s["namn"]})
+        for s in steg
+    }
+
+
+def køyr_steg(steg: Dict[str, Any]) -> None:
+    start = time.time()
+    print(f"▶ {steg['namn']}")
+    if "funksjon" in steg:
+        steg["funksjon"]()
+    else:
+        subprocess.run([sys.executable] + steg["kommando"], check=True)
+    print(f"✔ {steg['namn']} ({time.time() - start:.1f} s)")
+
+
+def køyr(
+    steg: List[Dict[str, Any]] = STEG,
+    tving: Optional[List[str]] = None,
+    jobbar: int = JOBBAR,
+    tørr: bool = False,
+) -> bool:
+    """Køyr alle utdaterte steg. Returnerer True dersom ingen steg feila."""
+    tilstand = last_tilstand()
+    tving = set(tving or [])
+    avheng = avhengnader(steg)
+    etter_namn = {s["namn"]: s for s in steg}
+    ferdige: Dict[str, str] = {}        # namn -> "køyrt" / "hoppa over" / "feila"
+    i_gang: Dict[Any, str] = {}
+    nøklar: Dict[str, str] = {}
+
+    with ThreadPoolExecutor(max_workers=jobbar) as pool:
+        while len(ferdige) < len(steg):
+            før = len(ferdige) + len(i_gang)
+            for namn, s in etter_namn.items():
+                if namn in ferdige or namn in i_gang.values():
+                    continue
+                if not all(a in ferdige for a in avheng[namn]):
+                    continue
+                if any(ferdige[a] == "feila" for a in avheng[namn]):
+                    print(f"✘ {namn}: hoppa over fordi eit steg før feila")
+                    ferdige[namn] = "feila"
+                    continue
+
+                nøkkel = steg_nøkkel(s, tilstand)
+                # I tørrkøyring er inn-filene ikkje oppdaterte enno
+                oppstraums_endra = tørr and any(ferdige[a] == "køyrt" for a in avheng[namn])
+                alltid = namn in tving or s.get("alltid", False)
+                if not alltid and not oppstraums_endra and er_oppdatert(s, nøkkel, tilstand):
+                    print(f"· {namn}: oppdatert")
+                    ferdige[namn] = "hoppa over"
+                elif tørr:
+                    print(f"○ {namn}: ville blitt køyrt")
+                    ferdige[namn] = "køyrt"
+                else:
+                    nøklar[namn] = nøkkel
+                    i_gang[pool.submit(køyr_steg, s)] = namn
+
+            if not i_gang:
+                if len(ferdige) == før:
+                    raise RuntimeError("Stega har ein syklus eller manglande avhengnad")
+                continue
+
+            ferdig_no, _ = wait(i_gang, return_when=FIRST_COMPLETED)
+            for fut in ferdig_no:
+                namn = i_gang.pop(fut)
+                s = etter_namn[namn]
+                if fut.exception() is not None:
+                    print(f"✘ {namn}: {fut.exception()}")
+                    ferdige[namn] = "feila"
+                    continue
+                ferdige[namn] = "køyrt"
+                # Nøkkelen er rekna av inn-filene slik dei var då steget starta.
+                # Tilstanden blir berre endra her i hovudtråden.
+                tilstand["steg"][namn] = {
+                    "nøkkel": nøklar[namn],
+                    "ut": {sti: fil_hash(sti, tilstand) for sti in s["ut"]},
+                }
+                lagre_tilstand(tilstand)
+
+    if not tørr:
+        lagre_tilstand(tilstand)
+    køyrde = [n for n, v in ferdige.items() if v == "køyrt"]
+    feila = [n for n, v in ferdige.items() if v == "feila"]
+    print(f"Ferdig: {len(køyrde)} køyrt, {len(ferdige) - len(køyrde) - len(feila)} oppdatert, {len(feila)} feila")
+    return not feila
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Køyr datauttrekket som ein DAG med caching")
+    parser.add_argument("--tving", default="", help="kommaseparerte steg som skal køyrast uansett")
+    parser.add_argument("--jobbar", type=int, default=JOBBAR, help="steg som kan køyre samtidig")
+    parser.add_argument("--tørr", action="store_true", help="vis berre kva som ville blitt køyrt")
+    args = parser.parse_args()
+
+    os.chdir(MAPPE)
+    tving = [t for t in args.tving.split(",") if t]
+    ukjende = set(tving) - {s["namn"] for s in STEG}
+    if ukjende:
+        parser.error(f"ukjende steg: {', '.join(sorted(ukjende))}")
+    ok = køyr(STEG, tving=tving, jobbar=args.jobbar, tørr=args.tørr)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Strøyming for CSV-til-CSV-stega, med avgrensa minnebruk.
+
+Berikingsskripta las heile inn-fila med list(reader) før dei byrja, og venta så
+på eitt oppslag per rad. berik_straum() les i staden fila i faste batchar
+(BATCH_RADER rader) og sender kvar batch til ein async berikingsfunksjon som
+slår opp dei unike nøklane i batchen samtidig. Maks BATCHAR_I_GANG batchar er
+i arbeid om gongen; radene blir skrivne i opphavleg rekkjefølgje gjennom ein
+omsorteringsbuffer (ein kø av batchar i innlesingsrekkjefølgje, der ein batch
+blir skriven først når alle før han er skrivne). Minnebruken er dermed
+uavhengig av kor lang fila er.
+
+Bruk (sjå tidspunkt_enrichment.py):
+    async def berik(header, rader):   # -> ut-rader i same rekkjefølgje
+        ...
+    await straum.berik_straum(inn, ut, berik, ny_header=lambda h: h + ["Ny"])
+"""
+
+import asyncio
+import csv
+import functools
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tqdm import tqdm
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+BATCH_RADER = 2000       # rader per batch
+BATCHAR_I_GANG = 3       # batchar under arbeid eller i bufferen samtidig
+
+Rad = List[str]
+Berik = Callable[[List[str], List[Rad]], Awaitable[List[Rad]]]
+
+
+def del_samtidige(hent: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Samtidige kall med same argument deler éin førespurnad. Batchar som er i
+    arbeid samtidig kan ha same nøkkel før cachen til skriptet er fylt.
+    """
+    i_gang: Dict[Tuple[Any, ...], asyncio.Future] = {}
+
+    @functools.wraps(hent)
+    async def _hent(*args: Any) -> Any:
+        fut = i_gang.get(args)
+        if fut is None:
+            fut = i_gang[args] = asyncio.ensure_future(hent(*args))
+            fut.add_done_callback(lambda _: i_gang.pop(args, None))
+        return await fut
+
+    return _hent
+
+
+def les_batchar(reader: Iterable[Rad], storleik: int = BATCH_RADER) -> Iterator[List[Rad]]:
+    """Lister på maks `storleik` rader frå `reader`, utan å lese vidare enn neste batch."""
+    batch: List[Rad] = []
+    for rad in reader:
+        batch.append(rad)
+        if len(batch) >= storleik:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def berik_straum(
+    inn: str,
+    ut: str,
+    berik: Berik,
+    ny_header: Optional[Callable[[List[str]], List[str]]] = None,
+    batch_rader: int = BATCH_RADER,
+    i_gang: int = BATCHAR_I_GANG,
+    desc: str = "Rader",
+    linjeskift: str = "\r\n",
+) -> int:
+    """
+    Les `inn` (;-separert) batch for batch, køyr berik(header, rader) for kvar
+    batch og skriv resultatet til `ut` i same rekkjefølgje som inn-radene.
+    `ny_header` gir ut-headeren frå inn-headeren (standard: uendra);
+    `linjeskift` "\n" gir same filer som pandas.to_csv.
+    Returnerer talet på rader skrivne.
+    """
+    i_gang = max(1, i_gang)
+    with open(inn, mode="r", encoding="utf-8") as infile, \
+            open(ut, mode="w", newline="", encoding="utf-8") as outfile:
+        reader = csv.reader(infile, delimiter=";")
+        header = next(reader)
+        writer = csv.writer(outfile, delimiter=";", lineterminator=linjeskift)
+        writer.writerow(ny_header(header) if ny_header else header)
+
+        # Omsorteringsbuffer: batchane i innlesingsrekkjefølgje, ferdige eller ikkje
+        ventar: Deque[asyncio.Task] = deque()
+        skrivne = 0
+        pbar = tqdm(desc=desc, unit="rad")
+
+        async def _skriv_første() -> None:
+            nonlocal skrivne
+            rader = await ventar.popleft()
+            writer.writerows(rader)
+            skrivne += len(rader)
+            pbar.update(len(rader))
+
+        try:
+            for batch in les_batchar(reader, batch_rader):
+                ventar.append(asyncio.create_task(berik(header, batch)))
+                # Full buffer: vent på den eldste batchen før neste blir lesen
+                while len(ventar) >= i_gang:
+                    await _skriv_første()
+                # Skriv ferdige batchar i front utan å vente
+                while ventar and ventar[0].done():
+                    await _skriv_første()
+            while ventar:
+                await _skriv_første()
+        finally:
+            for task in ventar:
+                task.cancel()
+            pbar.close()
+    return skrivne
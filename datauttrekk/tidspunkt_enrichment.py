@@ -1,13 +1,21 @@
 import csv
+import sys
 import asyncio
 import httpx
-from tqdm import tqdm
+import pandas as pd
+from tqdm.asyncio import tqdm_asyncio
+
+import get_fallvilt
+import straum
+from fallvilt_lagring import csv_til_parquet
 
 # -------------------------------------
 # Config
 # -------------------------------------
 INPUT_FILE = "Fallvilt_månedsberiket.csv"
 OUTPUT_FILE = "Fallvilt_tidspunkter.csv"
+# Typa kolonneversjon av same tabell (for lag_*-skripta og appane)
+OUTPUT_PARQUET = "Fallvilt_tidspunkter.parquet"
 
 API_BASE = "https://www.hjorteviltregisteret.no/api/v0/fallvilt"
 
@@ -20,12 +28,31 @@ MAX_CONCURRENCY = 16
 REQUEST_TIMEOUT = 20.0
 RETRY_BACKOFF = [0.5, 1.0, 2.0]
 
+# Listemodus (--liste): felta frå listeendepunktet (get_fallvilt.paginate_all) for heile
+# datospennet i inn-fila, i staden for eitt detaljkall per id. Same filter som get_fallvilt.
+LISTE_FYLKESNR = 50
+LISTE_ARSAK = "PåkjørtAvMotorkjøretøy"
+LISTE_PAGE_SIZE = 1000
+LISTE_ID_FELT = ["FallviltId", "fallviltId", "FallviltID"]
+
 sem = asyncio.Semaphore(MAX_CONCURRENCY)
 
 # Cache: id -> (HendelsesDatoTid, UkjentTidspunkt)
 cache = {}
 
 
+def _tidspunkt(data: dict) -> tuple[str, str]:
+    hendelse = data.get("HendelsesDatoTid", "")
+    ukjent = data.get("UkjentTidspunkt", "")
+
+    # Convert boolean to "true"/"false" or keep as empty
+    if isinstance(ukjent, bool):
+        ukjent = "true" if ukjent else "false"
+    else:
+        ukjent = ""
+    return (hendelse, ukjent)
+
+
 # --------------------------------------------------
 # Fetch HendelsesDatoTid + UkjentTidspunkt for given Fallvilt-ID
 # --------------------------------------------------
@@ -51,19 +78,9 @@ async def fetch_fallvilt_data(
 
             # Success
             if resp.status_code == 200:
-                data = resp.json()
-
-                hendelse = data.get("HendelsesDatoTid", "")
-                ukjent = data.get("UkjentTidspunkt", "")
-
-                # Convert boolean to "true"/"false" or keep as empty
-                if isinstance(ukjent, bool):
-                    ukjent = "true" if ukjent else "false"
-                else:
-                    ukjent = ""
-
-                cache[fallvilt_id] = (hendelse, ukjent)
-                return (hendelse, ukjent)
+                verdi = _tidspunkt(resp.json())
+                cache[fallvilt_id] = verdi
+                return verdi
 
             # Retry on server errors
             elif 500 <= resp.status_code < 600:
@@ -87,42 +104,139 @@ async def fetch_fallvilt_data(
 
 
 # --------------------------------------------------
-# Main processing
+# Listemodus: mange fallvilt per side i staden for eitt kall per id
 # --------------------------------------------------
-async def prosesser():
-    # Read input CSV
-    with open(INPUT_FILE, mode="r", encoding="utf-8") as infile:
+def datospenn(input_file: str) -> tuple[str, str] | None:
+    """Første og siste Dato i inn-fila (YYYY-MM-DD), lesen rad for rad. None utan datoar."""
+    with open(input_file, mode="r", encoding="utf-8") as infile:
         reader = csv.reader(infile, delimiter=";")
         header = next(reader)
-        rows = list(reader)
-
-    # Add new columns
-    out_header = header + ["HendelsesDatoTid", "UkjentTidspunkt"]
-
-    # Index of Fallvilt-ID column
+        if "Dato" not in header:
+            return None
+        dato_idx = header.index("Dato")
+        unike = {row[dato_idx] for row in reader if len(row) > dato_idx}
+
+    tekst = pd.Series(sorted(unike), dtype="string")
+    datoar = pd.to_datetime(tekst, format="ISO8601", errors="coerce")
+    # Seinare steg skriv Dato som dd.mm.yyyy
+    mangler = datoar.isna()
+    datoar[mangler] = pd.to_datetime(tekst[mangler], format="%d.%m.%Y", errors="coerce")
+    datoar = datoar.dropna()
+    if datoar.empty:
+        return None
+    return datoar.min().strftime("%Y-%m-%d"), (datoar.max() + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+async def last_fra_liste(input_file: str) -> int:
+    """
+    Fyll cache frå listeendepunktet for datospennet i inn-fila. Fallvilt der
+    listesvaret manglar felta (eller som ikkje er med i lista) blir henta med
+    detaljkall som før. Returnerer kor mange id-ar som kom frå lista.
+    """
+    spenn = datospenn(input_file)
+    if spenn is None:
+        print("Fann ingen datoar i inn-fila, hentar kvar id for seg")
+        return 0
+    fra_dato, til_dato = spenn
+    objekt = await asyncio.to_thread(
+        get_fallvilt.paginate_all,
+        fra_dato=fra_dato,
+        til_dato=til_dato,
+        fylkesnr=LISTE_FYLKESNR,
+        page_size=LISTE_PAGE_SIZE,
+        arsak=LISTE_ARSAK,
+        base_url=API_BASE,
+    )
+    lasta = 0
+    for obj in objekt:
+        fid = next((obj[k] for k in LISTE_ID_FELT if obj.get(k) not in (None, "")), None)
+        if fid is None or "HendelsesDatoTid" not in obj or "UkjentTidspunkt" not in obj:
+            continue
+        cache[str(fid)] = _tidspunkt(obj)
+        lasta += 1
+    print(f"{lasta} av {len(objekt)} fallvilt frå listeendepunktet ({fra_dato}–{til_dato}), "
+          "resten blir henta enkeltvis")
+    return lasta
+
+
+# Batches in flight at the same time share lookups of the same ID
+_fetch_delt = straum.del_samtidige(fetch_fallvilt_data)
+
+
+async def berik_batch(
+    client: httpx.AsyncClient,
+    header: list[str],
+    rows: list[list[str]],
+    framdrift: bool = False,
+) -> list[list[str]]:
+    """
+    Appends (HendelsesDatoTid, UkjentTidspunkt) to each row, same order as `rows`.
+    Each unique Fallvilt-ID in the batch is fetched once, all concurrently (bounded by sem).
+    """
     try:
         fallvilt_idx = header.index("Fallvilt-ID")
     except ValueError:
         raise Exception("Kolonnen 'Fallvilt-ID' finnes ikke i CSV!")
 
-    async with httpx.AsyncClient() as client:
-        pbar = tqdm(total=len(rows), desc="Fetching fallvilt-data", unit="row")
+    unike = list(dict.fromkeys(row[fallvilt_idx] for row in rows))
+    # Id-ar som alt ligg i cachen (t.d. frå listemodus) treng ingen oppgåve
+    data = {fid: cache[fid] for fid in unike if fid in cache}
+    unike = [fid for fid in unike if fid not in data]
+    oppslag = [_fetch_delt(client, fid) for fid in unike]
+    if framdrift:
+        svar = await tqdm_asyncio.gather(*oppslag, desc="Fetching fallvilt-data", unit="id")
+    else:
+        svar = await asyncio.gather(*oppslag)
+    data.update(zip(unike, svar))
+    return [row + list(data[row[fallvilt_idx]]) for row in rows]
 
-        with open(OUTPUT_FILE, mode="w", newline="", encoding="utf-8") as outfile:
-            writer = csv.writer(outfile, delimiter=";")
-            writer.writerow(out_header)
 
-            for row in rows:
-                fallvilt_id = row[fallvilt_idx]
+def _ny_header(header: list[str]) -> list[str]:
+    return header + ["HendelsesDatoTid", "UkjentTidspunkt"]
 
-                # Fetch HendelsesDatoTid + UkjentTidspunkt
-                hendelse, ukjent = await fetch_fallvilt_data(client, fallvilt_id)
 
-                writer.writerow(row + [hendelse, ukjent])
-                pbar.update(1)
+# --------------------------------------------------
+# Main processing
+# --------------------------------------------------
+async def prosesser(input_file=INPUT_FILE, output_file=OUTPUT_FILE, parquet_file=OUTPUT_PARQUET,
+                    strøym=False, liste=False):
+    if liste:
+        await last_fra_liste(input_file)
 
-        pbar.close()
+    async with httpx.AsyncClient() as client:
+        if strøym:
+            # Faste batchar, rekkjefølgja held ved like av omsorteringsbufferen i straum.py
+            await straum.berik_straum(
+                input_file, output_file,
+                lambda header, rows: berik_batch(client, header, rows),
+                ny_header=_ny_header, desc="Fetching fallvilt-data",
+            )
+        else:
+            # Read input CSV
+            with open(input_file, mode="r", encoding="utf-8") as infile:
+                reader = csv.reader(infile, delimiter=";")
+                header = next(reader)
+                rows = list(reader)
+
+            out_rows = await berik_batch(client, header, rows, framdrift=True)
+
+            with open(output_file, mode="w", newline="", encoding="utf-8") as outfile:
+                writer = csv.writer(outfile, delimiter=";")
+                writer.writerow(_ny_header(header))
+                writer.writerows(out_rows)
+
+    if parquet_file:
+        csv_til_parquet(output_file, parquet_file)
 
 
 if __name__ == "__main__":
-    asyncio.run(prosesser())
\ No newline at end of file
+    # python tidspunkt_enrichment.py [input.csv output.csv] : andre filer, utan Parquet (brukt av pipeline.py)
+    # --straum : les og skriv i faste batchar (konstant minnebruk uansett filstorleik)
+    # --liste  : hent felta frå listeendepunktet (nokre få sider), detaljkall berre for resten
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    strøym = "--straum" in sys.argv[1:]
+    liste = "--liste" in sys.argv[1:]
+    if len(args) >= 2:
+        asyncio.run(prosesser(args[0], args[1], parquet_file=None, strøym=strøym, liste=liste))
+    else:
+        asyncio.run(prosesser(strøym=strøym, liste=liste))
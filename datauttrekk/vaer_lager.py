@@ -0,0 +1,316 @@
+"""
+Vedvarande lager for Frost-observasjonar, delt av alle køyringar.
+
+station_cache, daily_cache og raw_cache i weather_enrichment.py lever berre så
+lenge prosessen lever, så kvar ny køyring spurde Frost om same historikk på
+nytt. Dette lageret er ei SQLite-fil (vaer_lager.sqlite):
+
+- observasjon: éin verdi per (stasjon, element, dato), både som tal og som
+  "verdi eining"-streng (same format som i CSV-en),
+- dekning: kva (stasjon, elementsett, dato) som er spurt om, også dagar utan
+  data, så tomme dagar ikkje blir spurde om igjen,
+- raa_dag: rå timesdata for fallback (get_raw_day), som JSON,
+- stasjon_rute: næraste stasjon per 0,45°-rute (nearest_station_id).
+
+Dagar som var minst FERSK_DAGAR gamle då dei blei henta, er endelege og blir
+aldri henta på nytt. Nyare dagar blir rekna som utgåtte og henta igjen, sidan
+Frost kan fylle inn eller rette dei siste dagane.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+VAER_DB = "vaer_lager.sqlite"
+FERSK_DAGAR = 7          # dagar etter datoen der Frost framleis kan endre verdiane
+
+OBS_KOLONNER = ["station", "dato", "element", "verdi", "tekst"]
+
+# Éi open tilkopling per tråd og fil: radvis oppslag (main()) skal ikkje opne fila kvar gong
+_lokal = threading.local()
+
+
+def _kople(sti: str) -> sqlite3.Connection:
+    tilkoplingar = getattr(_lokal, "tilkoplingar", None)
+    if tilkoplingar is None:
+        tilkoplingar = _lokal.tilkoplingar = {}
+    if sti not in tilkoplingar:
+        tilkoplingar[sti] = _opne(sti)
+    return tilkoplingar[sti]
+
+
+def _opne(sti: str) -> sqlite3.Connection:
+    mappe = os.path.dirname(sti)
+    if mappe:
+        os.makedirs(mappe, exist_ok=True)
+    con = sqlite3.connect(sti, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS observasjon (
+            station TEXT NOT NULL,
+            element TEXT NOT NULL,
+            dato    TEXT NOT NULL,
+            verdi   REAL,
+            tekst   TEXT NOT NULL,
+            PRIMARY KEY (station, element, dato)
+        );
+        CREATE TABLE IF NOT EXISTS dekning (
+            station    TEXT NOT NULL,
+            elementsett TEXT NOT NULL,
+            dato       TEXT NOT NULL,
+            henta      REAL NOT NULL,
+            PRIMARY KEY (station, elementsett, dato)
+        );
+        CREATE TABLE IF NOT EXISTS raa_dag (
+            station TEXT NOT NULL,
+            dato    TEXT NOT NULL,
+            data    TEXT NOT NULL,
+            henta   REAL NOT NULL,
+            PRIMARY KEY (station, dato)
+        );
+        CREATE TABLE IF NOT EXISTS stasjon_rute (
+            gx      REAL NOT NULL,
+            gy      REAL NOT NULL,
+            station TEXT NOT NULL,
+            PRIMARY KEY (gx, gy)
+        );
+        """
+    )
+    return con
+
+
+def _endeleg(datoar: pd.Series, henta: pd.Series) -> pd.Series:
+    """Sann der dagen var minst FERSK_DAGAR gammal då han blei henta."""
+    dag = pd.to_datetime(datoar, errors="coerce")
+    grense = (dag - pd.Timestamp("1970-01-01")).dt.total_seconds() + FERSK_DAGAR * 86400
+    return henta.astype(float) >= grense
+
+
+def _endeleg_dag(dato: str, henta: float) -> bool:
+    """Som _endeleg, for éin dag (utan pandas, for radvise oppslag)."""
+    try:
+        dag = datetime.fromisoformat(dato).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return False
+    return henta >= dag.timestamp() + FERSK_DAGAR * 86400
+
+
+def hent_dag(
+    station: str,
+    elementsett: str,
+    dato: str,
+    element: Iterable[str],
+    sti: str = VAER_DB,
+) -> Optional[Dict[str, str]]:
+    """
+    {element: tekst} for éin endeleg henta dag (tom dict om dagen var utan data),
+    eller None om dagen ikkje er henta / må friskast opp.
+    """
+    if not os.path.exists(sti):
+        return None
+    try:
+        con = _kople(sti)
+    except sqlite3.Error:
+        return None
+    rad = con.execute(
+        "SELECT henta FROM dekning WHERE station = ? AND elementsett = ? AND dato = ?",
+        (station, elementsett, dato),
+    ).fetchone()
+    if rad is None or not _endeleg_dag(dato, rad[0]):
+        return None
+    element = list(element)
+    plass = ",".join("?" * len(element))
+    return dict(con.execute(
+        f"SELECT element, tekst FROM observasjon WHERE station = ? AND dato = ? AND element IN ({plass})",
+        (station, dato, *element),
+    ).fetchall())
+
+
+def dekte_dagar(
+    station: str,
+    elementsett: str,
+    datoar: Iterable[str],
+    sti: str = VAER_DB,
+) -> set:
+    """Dei av `datoar` som alt er henta for (stasjon, elementsett) og ikkje treng oppfrisking."""
+    datoar = list(dict.fromkeys(datoar))
+    if not datoar:
+        return set()
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Vêrlager utilgjengeleg ({e}), hentar frå Frost")
+        return set()
+    rader = []
+    for i in range(0, len(datoar), 500):
+        bit = datoar[i:i + 500]
+        plass = ",".join("?" * len(bit))
+        rader += con.execute(
+            f"SELECT dato, henta FROM dekning WHERE station = ? AND elementsett = ? AND dato IN ({plass})",
+            (station, elementsett, *bit),
+        ).fetchall()
+    if not rader:
+        return set()
+    rader = pd.DataFrame(rader, columns=["dato", "henta"])
+    return set(rader.loc[_endeleg(rader["dato"], rader["henta"]), "dato"])
+
+
+def lagre_observasjonar(
+    obs: pd.DataFrame,
+    dekning: Iterable[Tuple[str, str, str]],
+    sti: str = VAER_DB,
+) -> None:
+    """
+    Lagre observasjonar (OBS_KOLONNER, éin per stasjon/element/dato) og merk
+    (stasjon, elementsett, dato) i `dekning` som henta no.
+    """
+    no = time.time()
+    verdiar = [
+        (r.station, r.element, r.dato, None if pd.isna(r.verdi) else float(r.verdi), r.tekst)
+        for r in obs.itertuples(index=False)
+    ]
+    dekt = [(s, e, d, no) for s, e, d in dekning]
+    if not verdiar and not dekt:
+        return
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Vêrlager utilgjengeleg ({e}), lagrar ikkje")
+        return
+    with con:
+        con.executemany("INSERT OR REPLACE INTO observasjon VALUES (?, ?, ?, ?, ?)", verdiar)
+        con.executemany("INSERT OR REPLACE INTO dekning VALUES (?, ?, ?, ?)", dekt)
+
+
+def hent_observasjonar(
+    par: pd.DataFrame,
+    element: Iterable[str],
+    sti: str = VAER_DB,
+) -> pd.DataFrame:
+    """
+    Alle lagra observasjonar av `element` for (station, dato)-para i `par`,
+    som tabell med OBS_KOLONNER. Tom tabell om lageret manglar.
+    """
+    element = list(element)
+    tom = pd.DataFrame(columns=OBS_KOLONNER)
+    par = par[["station", "dato"]].dropna().drop_duplicates()
+    if par.empty or not element or not os.path.exists(sti):
+        return tom
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Vêrlager utilgjengeleg ({e})")
+        return tom
+    try:
+        con.execute("CREATE TEMP TABLE par (station TEXT, dato TEXT, PRIMARY KEY (station, dato))")
+        con.executemany("INSERT INTO par VALUES (?, ?)", par.itertuples(index=False, name=None))
+        plass = ",".join("?" * len(element))
+        return pd.read_sql_query(
+            f"""
+            SELECT o.station, o.dato, o.element, o.verdi, o.tekst
+            FROM observasjon o JOIN par p ON o.station = p.station AND o.dato = p.dato
+            WHERE o.element IN ({plass})
+            """,
+            con, params=element,
+        )
+    finally:
+        con.execute("DROP TABLE IF EXISTS temp.par")
+
+
+def hent_seriar(
+    stasjonar: Iterable[str],
+    element: Iterable[str],
+    sti: str = VAER_DB,
+) -> pd.DataFrame:
+    """
+    Heile dagsserien av `element` for stasjonane (alle lagra datoar), som tabell
+    med OBS_KOLONNER. Bulk-henting lagrar heile datovindauge, så seriane er
+    samanhengande der det har vore kollisjonar.
+    """
+    stasjonar = [s for s in dict.fromkeys(stasjonar) if s]
+    element = list(element)
+    tom = pd.DataFrame(columns=OBS_KOLONNER)
+    if not stasjonar or not element or not os.path.exists(sti):
+        return tom
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Vêrlager utilgjengeleg ({e})")
+        return tom
+    plass_e = ",".join("?" * len(element))
+    delar = []
+    for i in range(0, len(stasjonar), 500):
+        bit = stasjonar[i:i + 500]
+        plass_s = ",".join("?" * len(bit))
+        delar.append(pd.read_sql_query(
+            f"""
+            SELECT station, dato, element, verdi, tekst FROM observasjon
+            WHERE station IN ({plass_s}) AND element IN ({plass_e})
+            """,
+            con, params=[*bit, *element],
+        ))
+    return pd.concat(delar, ignore_index=True)
+
+
+# ---------------------------
+# Rå timesdata og stasjonsruter (radvis sti i weather_enrichment.main)
+# ---------------------------
+
+
+def hent_raa_dag(station: str, dato: str, sti: str = VAER_DB) -> Optional[List[Dict[str, Any]]]:
+    """Lagra rå "data"-liste for dagen, eller None om ho manglar eller er utgått."""
+    if not os.path.exists(sti):
+        return None
+    try:
+        con = _kople(sti)
+    except sqlite3.Error:
+        return None
+    rad = con.execute(
+        "SELECT data, henta FROM raa_dag WHERE station = ? AND dato = ?", (station, dato)
+    ).fetchone()
+    if rad is None or not _endeleg_dag(dato, rad[1]):
+        return None
+    return json.loads(rad[0])
+
+
+def lagre_raa_dag(station: str, dato: str, data: List[Dict[str, Any]], sti: str = VAER_DB) -> None:
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Vêrlager utilgjengeleg ({e}), lagrar ikkje")
+        return
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO raa_dag VALUES (?, ?, ?, ?)",
+            (station, dato, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+
+
+def hent_stasjonsruter(sti: str = VAER_DB) -> Dict[Tuple[float, float], str]:
+    if not os.path.exists(sti):
+        return {}
+    try:
+        con = _kople(sti)
+    except sqlite3.Error:
+        return {}
+    return {(gx, gy): s for gx, gy, s in con.execute("SELECT gx, gy, station FROM stasjon_rute")}
+
+
+def lagre_stasjonsrute(rute: Tuple[float, float], station: str, sti: str = VAER_DB) -> None:
+    try:
+        con = _kople(sti)
+    except sqlite3.Error:
+        return
+    with con:
+        con.execute("INSERT OR REPLACE INTO stasjon_rute VALUES (?, ?, ?)", (rute[0], rute[1], station))
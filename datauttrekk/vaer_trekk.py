@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vêrtrekk per (stasjon, dato) som eigen, kompakt tabell.
+
+calc_avg_montly_weather.py reknar berre eit snitt per kommune/år/månad og
+kopierer det inn på kvar kollisjonsrad. Denne modulen byggjer i staden ein
+trekk-tabell med éi rad per unik (weather_station_id, Dato) i vêrfila:
+
+- <var>_7d, <var>_30d: glidande snitt over dei siste 7/30 dagane (til og med
+  dagen), berre når minst MIN_DEKNING av dagane har verdi,
+- <var>_maaned: snitt for stasjonen den kalendermånaden,
+- <var>_klima: klimatologi for stasjonen på dagen i året (snitt over alle år,
+  glatta over ±KLIMA_GLATTING dagar),
+- <var>_avvik, <var>_30d_avvik: dagsverdien / 30-dagarssnittet minus
+  klimatologien.
+
+Dagsseriane kjem frå vêrlageret (vaer_lager.sqlite; bulk-hentinga lagrar heile
+datovindauge rundt kollisjonane), supplerte med verdiane i vêrfila. Alt blir
+rekna i éi gruppert køyring per stasjon med pandas/NumPy.
+
+Regresjonsskripta hentar trekka med ein join på nøkkelen i staden for å
+dra dei med i den breie CSV-en:
+    from vaer_trekk import les_trekk, legg_til_trekk
+    df = legg_til_trekk(df, les_trekk(), ["mean_temperature_30d_avvik", "total_precipitation_7d"])
+
+Bruk frå kommandolinja:
+    python vaer_trekk.py [Fallvilt_beriket_med_vær.csv] [Fallvilt_vaertrekk.parquet]
+"""
+
+import math
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import vaer_lager
+from fallvilt_lagring import VAER_EINING, les_fallvilt, skriv_parquet
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+INPUT_CSV = "Fallvilt_beriket_med_vær.csv"
+OUTPUT_PARQUET = "Fallvilt_vaertrekk.parquet"
+
+STASJON_KOLONNE = "weather_station_id"
+DATO_KOLONNE = "Dato"
+
+# Frost-element -> vêrkolonne. Snødybda kan kome frå ein annan stasjon enn
+# weather_station_id, så ho er ikkje med.
+TREKK_ELEMENT = {
+    "mean(air_temperature P1D)": "mean_temperature",
+    "sum(precipitation_amount P1D)": "total_precipitation",
+    "mean(wind_speed P1D)": "mean_wind_speed",
+}
+
+RULLANDE_DAGAR = [7, 30]     # vindauge for glidande snitt
+MIN_DEKNING = 0.5            # del av dagane i vindauget / månaden som må ha verdi
+KLIMA_GLATTING = 15          # ± dagar rundt dagen i året
+MIN_KLIMA_OBS = 2 * (2 * KLIMA_GLATTING + 1)   # observasjonar bak ein klimatologiverdi
+
+NOKKEL = [STASJON_KOLONNE, DATO_KOLONNE]
+
+
+# ---------------------------
+# Dagsseriar
+# ---------------------------
+
+
+def dagsverdiar(vaer: pd.DataFrame, sti: str = vaer_lager.VAER_DB) -> pd.DataFrame:
+    """
+    Éi rad per (station, dato) med ein kolonne per vêrvariabel: heile den lagra
+    serien for stasjonane i `vaer`, der verdiane i vêrfila fyller hol.
+    """
+    variablar = list(TREKK_ELEMENT.values())
+    fra_fil = (
+        vaer.dropna(subset=NOKKEL)
+        .rename(columns={STASJON_KOLONNE: "station", DATO_KOLONNE: "dato"})
+        .groupby(["station", "dato"], observed=True)[variablar].mean()
+    )
+
+    obs = vaer_lager.hent_seriar(fra_fil.index.get_level_values("station").unique(), TREKK_ELEMENT, sti)
+    if obs.empty:
+        dagleg = fra_fil
+    else:
+        fra_lager = (
+            obs.assign(
+                dato=pd.to_datetime(obs["dato"], errors="coerce"),
+                variabel=obs["element"].map(TREKK_ELEMENT),
+                verdi=pd.to_numeric(obs["verdi"], errors="coerce"),
+            )
+            .dropna(subset=["dato"])
+            .pivot_table(index=["station", "dato"], columns="variabel", values="verdi", aggfunc="mean")
+            .reindex(columns=variablar)
+        )
+        dagleg = fra_lager.combine_first(fra_fil)
+    return dagleg.reset_index().sort_values(["station", "dato"], ignore_index=True)
+
+
+# ---------------------------
+# Trekk
+# ---------------------------
+
+
+def _klimatologi(stasjon: np.ndarray, dag: np.ndarray, verdiar: np.ndarray) -> np.ndarray:
+    """
+    Glatta snitt per (stasjon, dag i året) for kvar rad: summar og tal i
+    tabellar (stasjonar, 365, variablar), summerte sirkulært over ±KLIMA_GLATTING.
+    """
+    n_st, n_var = stasjon.max() + 1, verdiar.shape[1]
+    har = ~np.isnan(verdiar)
+    summar = np.zeros((n_st, 365, n_var))
+    tal = np.zeros((n_st, 365, n_var))
+    np.add.at(summar, (stasjon, dag), np.where(har, verdiar, 0.0))
+    np.add.at(tal, (stasjon, dag), har)
+
+    glatta_sum = summar.copy()
+    glatta_tal = tal.copy()
+    for k in range(1, KLIMA_GLATTING + 1):
+        for skift in (k, -k):
+            glatta_sum += np.roll(summar, skift, axis=1)
+            glatta_tal += np.roll(tal, skift, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        klima = np.where(glatta_tal >= MIN_KLIMA_OBS, glatta_sum / glatta_tal, np.nan)
+    return klima[stasjon, dag]
+
+
+def bygg_trekk(dagleg: pd.DataFrame) -> pd.DataFrame:
+    """Trekk for kvar rad i `dagleg` (frå dagsverdiar: station, dato, variablar)."""
+    variablar = list(TREKK_ELEMENT.values())
+    d = dagleg.sort_values(["station", "dato"], ignore_index=True)
+    ut = d[["station", "dato"]].copy()
+    if d.empty:
+        return ut
+
+    # Glidande snitt over kalenderdagar; groupby sorterer på stasjon som d, så
+    # resultatet ligg i same rekkjefølgje
+    per_stasjon = d.set_index("dato").groupby("station", sort=True)[variablar]
+    for n in RULLANDE_DAGAR:
+        rull = per_stasjon.rolling(f"{n}D", min_periods=math.ceil(n * MIN_DEKNING)).mean()
+        for v in variablar:
+            ut[f"{v}_{n}d"] = rull[v].to_numpy()
+
+    # Månadssnitt per stasjon, med krav til dekning
+    månad = [d["station"], d["dato"].dt.year, d["dato"].dt.month]
+    grupper = d.groupby(månad, sort=False)[variablar]
+    snitt, tal = grupper.transform("mean"), grupper.transform("count")
+    dagar_i_månad = d["dato"].dt.days_in_month.to_numpy()[:, None]
+    ut[[f"{v}_maaned" for v in variablar]] = snitt.where(tal.to_numpy() >= dagar_i_månad * MIN_DEKNING).to_numpy()
+
+    # Klimatologi på dag i året (29. februar blir rekna som 28.)
+    stasjon = pd.factorize(d["station"])[0]
+    dag = d["dato"].dt.dayofyear.to_numpy()
+    dag = np.where(d["dato"].dt.is_leap_year & (dag > 59), dag - 1, dag) - 1
+    klima = _klimatologi(stasjon, dag, d[variablar].to_numpy(float))
+    for i, v in enumerate(variablar):
+        ut[f"{v}_klima"] = klima[:, i]
+        ut[f"{v}_avvik"] = d[v].to_numpy(float) - klima[:, i]
+        ut[f"{v}_30d_avvik"] = ut[f"{v}_30d"] - klima[:, i]
+    return ut
+
+
+def trekk_einingar(kolonner: List[str]) -> Dict[str, str]:
+    """Eininga til kvar trekk-kolonne er eininga til vêrvariabelen han kjem frå."""
+    return {
+        k: VAER_EINING[v]
+        for k in kolonner
+        for v in TREKK_ELEMENT.values()
+        if k.startswith(v + "_")
+    }
+
+
+def lag_trekktabell(vaer: pd.DataFrame, sti: str = vaer_lager.VAER_DB) -> pd.DataFrame:
+    """Trekk-tabellen for dei unike (weather_station_id, Dato) i `vaer`."""
+    vaer = vaer.assign(
+        **{
+            STASJON_KOLONNE: vaer[STASJON_KOLONNE].astype("string").replace("", pd.NA),
+            DATO_KOLONNE: pd.to_datetime(vaer[DATO_KOLONNE], errors="coerce").dt.normalize(),
+        }
+    )
+    trekk = bygg_trekk(dagsverdiar(vaer, sti)).rename(
+        columns={"station": STASJON_KOLONNE, "dato": DATO_KOLONNE}
+    )
+    nøklar = vaer[NOKKEL].dropna().drop_duplicates()
+    return nøklar.merge(trekk, on=NOKKEL, how="left").sort_values(NOKKEL, ignore_index=True)
+
+
+# ---------------------------
+# Bruk i analysane
+# ---------------------------
+
+
+def les_trekk(sti: str = OUTPUT_PARQUET, kolonner: Optional[List[str]] = None) -> pd.DataFrame:
+    """Trekk-tabellen (nøkkel + `kolonner`, standard alle)."""
+    if kolonner is not None:
+        kolonner = list(dict.fromkeys(NOKKEL + list(kolonner)))
+    return pd.read_parquet(sti, columns=kolonner)
+
+
+def legg_til_trekk(df: pd.DataFrame, trekk: pd.DataFrame, kolonner: Optional[List[str]] = None) -> pd.DataFrame:
+    """Venstre-join av trekka på (weather_station_id, Dato); radene i df held rekkjefølgja."""
+    kolonner = [c for c in trekk.columns if c not in NOKKEL] if kolonner is None else list(kolonner)
+    høgre = trekk[NOKKEL + kolonner].assign(
+        **{STASJON_KOLONNE: trekk[STASJON_KOLONNE].astype(str)}
+    )
+    nøkkel = pd.DataFrame({
+        STASJON_KOLONNE: df[STASJON_KOLONNE].astype(str),
+        DATO_KOLONNE: pd.to_datetime(df[DATO_KOLONNE], errors="coerce").dt.normalize(),
+    })
+    verdiar = nøkkel.merge(høgre, on=NOKKEL, how="left")[kolonner]
+    return pd.concat([df, verdiar.set_axis(df.index)], axis=1)
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+
+def main():
+    inn = sys.argv[1] if len(sys.argv) > 1 else INPUT_CSV
+    ut = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_PARQUET
+
+    vaer = les_fallvilt(inn, kolonner=NOKKEL + list(TREKK_ELEMENT.values()))
+    trekk = lag_trekktabell(vaer)
+    skriv_parquet(trekk, ut, einingar=trekk_einingar(list(trekk.columns)))
+    print(f"Skrev {len(trekk)} nøklar og {len(trekk.columns) - len(NOKKEL)} trekk "
+          f"({len(vaer)} rader i {inn}) til {ut}")
+
+
+if __name__ == "__main__":
+    main()
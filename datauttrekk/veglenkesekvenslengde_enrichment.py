@@ -1,8 +1,11 @@
 import csv
+import sys
 import asyncio
-import httpx
-from tqdm import tqdm
-from typing import Dict
+from tqdm.asyncio import tqdm_asyncio
+from typing import Dict, List, Optional
+
+import nvdb_klient
+import straum
 
 # =======================
 # Config
@@ -20,26 +23,14 @@ LENGTH_COL = 'Veglenkesekvenslengde'
 # If False and LENGTH_COL exists, keep existing values and skip API calls for those rows
 REFRESH_EXISTING = False
 
-# REQUIRED by NVDB Les V4: X-Client must be set
-headers = {
-    "Accept": "application/json",
-    "User-Agent": "fallvilt-veglenkesekvenslengde/1.0-async",
-    "X-Client": "fallvilt-veglenkesekvenslengde",
-}
-
-# --- Parallelization / retry controls ---
-MAX_CONCURRENCY = 16
-REQUEST_TIMEOUT = 20.0  # seconds
-RETRY_BACKOFF = [0.5, 1.0, 2.0, 4.0]  # simple backoff delays
+# Samtidigheit, takt og retry blir styrt i nvdb_klient.py
 
-# Base URL for veglenkesekvenser (NVDB vegnett API v4)
-BASE_URL = "https://nvdbapiles.atlas.vegvesen.no/vegnett/api/v4/veglenkesekvenser"
+# Path for veglenkesekvenser (NVDB vegnett API v4)
+BASE_PATH = "/vegnett/api/v4/veglenkesekvenser"
 
 # Simple in-memory cache: veglenkesekvensId -> str(lengde)
 cache: Dict[int, str] = {}
 
-sem = asyncio.Semaphore(MAX_CONCURRENCY)
-
 
 def _parse_int(value: str) -> int | None:
     """
@@ -62,58 +53,31 @@ def _parse_int(value: str) -> int | None:
             return None
 
 
-async def fetch_veglenkesekvens_lengde(client: httpx.AsyncClient, veglenkesekvens_id: int) -> str:
+async def fetch_veglenkesekvens_lengde(klient: nvdb_klient.NvdbKlient, veglenkesekvens_id: int) -> str:
     """
     Fetches 'lengde' for a given veglenkesekvensId.
     Returns empty string if not found or on non-retriable errors.
-    Includes simple retries for 429/5xx/timeouts.
+    Retries for 429/5xx/timeouts happen in nvdb_klient.
     """
     if veglenkesekvens_id in cache:
         return cache[veglenkesekvens_id]
 
-    url = f"{BASE_URL}/{veglenkesekvens_id}"
+    data = await klient.get_json(f"{BASE_PATH}/{veglenkesekvens_id}")
+    if data is None:
+        return ""
 
-    attempts = len(RETRY_BACKOFF) + 1
-    for i in range(attempts):
-        try:
-            async with sem:
-                resp = await client.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-
-            if resp.status_code == 200:
-                data = resp.json()
-                lengde = data.get("lengde")
-                val = "" if lengde is None else str(lengde)
-                cache[veglenkesekvens_id] = val
-                return val
-
-            # Retry on rate limit or server errors
-            if resp.status_code == 429 or 500 <= resp.status_code < 600:
-                if i < attempts - 1:
-                    await asyncio.sleep(RETRY_BACKOFF[i])
-                    continue
-                else:
-                    return ""
-
-            # For 4xx (other than 429), do not retry
-            return ""
-
-        except (httpx.HTTPError, asyncio.TimeoutError):
-            if i < attempts - 1:
-                await asyncio.sleep(RETRY_BACKOFF[i])
-                continue
-            return ""
-
-    return ""  # Fallback (shouldn't get here)
-
-
-async def prosesser():
-    # Read CSV header and rows
-    with open(input_file, mode='r', encoding='utf-8') as infile:
-        reader = csv.reader(infile, delimiter=';')
-        header = next(reader)
-        rows = list(reader)
-
-    # Build index mapping
+    lengde = data.get("lengde")
+    val = "" if lengde is None else str(lengde)
+    cache[veglenkesekvens_id] = val
+    return val
+
+
+# Batches in flight at the same time share lookups of the same id
+_fetch_delt = straum.del_samtidige(fetch_veglenkesekvens_lengde)
+
+
+def _kolonner(header: List[str]) -> tuple[int, Optional[int], List[str]]:
+    """(index of id column, index of existing length column or None, output header)."""
     col_idx = {name: i for i, name in enumerate(header)}
 
     if VEGLENKESEKV_ID_COL not in col_idx:
@@ -122,67 +86,79 @@ async def prosesser():
             f"Available columns: {header}"
         )
 
-    vegsekv_idx = col_idx[VEGLENKESEKV_ID_COL]
-
     # Prepare output header:
-    # - if LENGTH_COL exists and REFRESH_EXISTING=False -> keep as-is
+    # - if LENGTH_COL exists -> keep as-is (overwritten only if REFRESH_EXISTING)
     # - else (missing) -> append it
-    length_col_exists = LENGTH_COL in col_idx
-    if length_col_exists:
-        out_header = header[:]  # keep original order
-        length_idx = col_idx[LENGTH_COL]
+    if LENGTH_COL in col_idx:
+        return col_idx[VEGLENKESEKV_ID_COL], col_idx[LENGTH_COL], header[:]
+    return col_idx[VEGLENKESEKV_ID_COL], None, header + [LENGTH_COL]
+
+
+async def berik_batch(
+    klient: nvdb_klient.NvdbKlient,
+    header: List[str],
+    rows: List[List[str]],
+    framdrift: bool = False,
+) -> List[List[str]]:
+    """
+    Output rows (same order as `rows`) with LENGTH_COL filled in.
+    Each unique veglenkesekvensId in the batch is fetched once, all concurrently.
+    """
+    vegsekv_idx, length_idx, _ = _kolonner(header)
+
+    if length_idx is not None and not REFRESH_EXISTING:
+        # Keep the existing values; rows unchanged
+        return rows
+
+    ids = [_parse_int(row[vegsekv_idx]) for row in rows]
+    unike = list(dict.fromkeys(i for i in ids if i is not None))
+    oppslag = [_fetch_delt(klient, i) for i in unike]
+    if framdrift:
+        svar = await tqdm_asyncio.gather(*oppslag, desc="Veglenkesekvenser", unit="id")
     else:
-        out_header = header + [LENGTH_COL]
-        length_idx = None  # will be last column in output
-
-    async with httpx.AsyncClient() as client:
-        with open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
-            writer = csv.writer(outfile, delimiter=';')
-            writer.writerow(out_header)
-
-            pbar = tqdm(total=len(rows), desc="Processing rows", unit="row")
-
-            for row in rows:
-                # Decide if we should fetch new value
-                should_fetch = True
-
-                if length_col_exists and not REFRESH_EXISTING:
-                    # Keep the existing value; write row unchanged
-                    writer.writerow(row)
-                    pbar.update(1)
-                    continue
-
-                # Parse veglenkesekvensId
-                veglenkesekvens_id = _parse_int(row[vegsekv_idx])
-
-                if veglenkesekvens_id is None:
-                    # No valid ID -> write empty length
-                    if length_col_exists:
-                        # overwrite existing length (if refreshing)
-                        new_row = list(row)
-                        new_row[length_idx] = ""
-                        writer.writerow(new_row)
-                    else:
-                        # append new column with empty value
-                        writer.writerow(row + [""])
-                    pbar.update(1)
-                    continue
-
-                # Fetch length
-                length_val = await fetch_veglenkesekvens_lengde(client, veglenkesekvens_id)
-
-                # Write output row
-                if length_col_exists:
-                    new_row = list(row)
-                    new_row[length_idx] = length_val
-                    writer.writerow(new_row)
-                else:
-                    writer.writerow(row + [length_val])
-
-                pbar.update(1)
-
-            pbar.close()
+        svar = await asyncio.gather(*oppslag)
+    lengder = dict(zip(unike, svar))
+
+    out_rows = []
+    for row, veglenkesekvens_id in zip(rows, ids):
+        # No valid ID -> empty length
+        length_val = "" if veglenkesekvens_id is None else lengder[veglenkesekvens_id]
+        if length_idx is not None:
+            # overwrite existing length (refreshing)
+            new_row = list(row)
+            new_row[length_idx] = length_val
+            out_rows.append(new_row)
+        else:
+            out_rows.append(row + [length_val])
+    return out_rows
+
+
+async def prosesser(strøym: bool = False):
+    async with nvdb_klient.NvdbKlient() as klient:
+        if strøym:
+            # Faste batchar, rekkjefølgja held ved like av omsorteringsbufferen i straum.py
+            await straum.berik_straum(
+                input_file, output_file,
+                lambda header, rows: berik_batch(klient, header, rows),
+                ny_header=lambda header: _kolonner(header)[2], desc="Processing rows",
+            )
+        else:
+            # Read CSV header and rows
+            with open(input_file, mode='r', encoding='utf-8') as infile:
+                reader = csv.reader(infile, delimiter=';')
+                header = next(reader)
+                rows = list(reader)
+
+            out_rows = await berik_batch(klient, header, rows, framdrift=True)
+
+            with open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
+                writer = csv.writer(outfile, delimiter=';')
+                writer.writerow(_kolonner(header)[2])
+                writer.writerows(out_rows)
+
+    klient.skriv_statistikk()
 
 
 if __name__ == "__main__":
-    asyncio.run(prosesser())
\ No newline at end of file
+    # --straum : les og skriv i faste batchar (konstant minnebruk uansett filstorleik)
+    asyncio.run(prosesser(strøym="--straum" in sys.argv[1:]))
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lokal snapping av punkt til vegnettet, i staden for eitt kall til
+/vegnett/api/v4/posisjon per kollisjon.
+
+1. last_ned_vegnett() hentar segmentert vegnett (veglenkesekvensar med
+   geometri og vegsystemreferanse) for fylket éin gong og lagrar det som
+   kompakte NumPy-array (vegnett_50.npz).
+2. bygg_indeks() lagar eit rutenett over alle linjestykka (CSR-tabell
+   rute -> linjestykke), der kvart stykke er registrert i alle ruter
+   bounding-boksen dekkjer.
+3. snapp() finn næraste linjestykke innanfor maks_avstand for mange punkt
+   om gongen (vektorisert), og reknar ut relativ posisjon, meterverdi og
+   avstand. Resultatet har same kolonnar som NEW_COLS i
+   enrich_fallvilt_with_nvdb_position.py.
+
+Nedlasting frå kommandolinja:
+    python vegnett_snapping.py [fylkesnr]
+Snapping av fallvilt-CSV (lastar ned vegnettet dersom fila manglar):
+    python enrich_fallvilt_with_nvdb_position.py --lokal
+"""
+
+import re
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+from enrich_fallvilt_with_nvdb_position import (
+    MAKS_AVSTAND,
+    NEW_COLS,
+    X_CLIENT,
+)
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+VEGNETT_URL = "https://nvdbapiles.atlas.vegvesen.no/vegnett/api/v4/veglenkesekvenser/segmentert"
+FYLKE = 50
+VEGNETT_FIL = f"vegnett_{FYLKE}.npz"
+
+SIDESTORLEIK = 1000
+CELLE_M = float(MAKS_AVSTAND)   # rutestorleik; punktet sitt søkjeområde dekkjer då maks 3x3 ruter
+BATCH = 20000                   # punkt per vektorisert batch (held kandidatpar-tabellen liten)
+
+headers = {
+    "Accept": "application/json",
+    "User-Agent": "fallvilt-vegnett-snapping/1.0",
+    "X-Client": X_CLIENT,
+}
+
+# Tekstattributt per segment (lagra som unicode-array i .npz)
+SEGMENT_TEKST = [
+    "kortform", "vegkategori", "fase", "vegnr", "strekning", "delstrekning",
+    "arm", "adskilte_løp", "trafikantgruppe", "retning", "kommune", "srid",
+]
+# Talattributt per segment. fra_meter/til_meter (eller meter, for kryss og sideanlegg)
+# er på strekninga; del_* er på kryssdelen/sideanleggsdelen når segmentet ligg der
+SEGMENT_TAL = [
+    "veglenkesekvensid", "startposisjon", "sluttposisjon", "fra_meter", "til_meter", "meter",
+    "del_fra_meter", "del_til_meter",
+]
+
+_TAL = re.compile(r"[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+# Siste meterdel i kortforma: "EV6 S1D1 m120-250", "EV6 S1D1 m120 SD1 m15-30"
+_SISTE_METER = re.compile(r"(.*\bm)\d+(?:-\d+)?$")
+
+
+# ---------------------------
+# Nedlasting
+# ---------------------------
+
+
+def build_session() -> requests.Session:
+    session = requests.Session()
+    retries = Retry(
+        total=5,
+        backoff_factor=1.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(headers)
+    return session
+
+
+def _koordinatar(wkt: str) -> np.ndarray:
+    """LINESTRING [Z] (x y [z], ...) -> array (n, 3). z = NaN om WKT-en er 2D."""
+    if not wkt or "(" not in wkt:
+        return np.empty((0, 3))
+    punkt = []
+    for par in wkt[wkt.index("(") + 1:wkt.rindex(")")].split(","):
+        v = [float(t) for t in _TAL.findall(par)]
+        if len(v) >= 2:
+            punkt.append((v[0], v[1], v[2] if len(v) > 2 else np.nan))
+    return np.array(punkt, dtype=float).reshape(-1, 3)
+
+
+def _segment_attributt(seg: Dict[str, Any]) -> Dict[str, Any]:
+    vsr = seg.get("vegsystemreferanse") or {}
+    vegsystem = vsr.get("vegsystem") or {}
+    strek = vsr.get("strekning") or {}
+    del_ = vsr.get("kryssystem") or vsr.get("sideanlegg") or {}
+    return {
+        "kortform": vsr.get("kortform", ""),
+        "vegkategori": vegsystem.get("vegkategori", ""),
+        "fase": vegsystem.get("fase", ""),
+        "vegnr": vegsystem.get("nummer", ""),
+        "strekning": strek.get("strekning", ""),
+        "delstrekning": strek.get("delstrekning", ""),
+        "arm": strek.get("arm", ""),
+        "adskilte_løp": strek.get("adskilte_løp", ""),
+        "trafikantgruppe": strek.get("trafikantgruppe", ""),
+        "retning": strek.get("retning", ""),
+        "kommune": seg.get("kommune", ""),
+        "srid": (seg.get("geometri") or {}).get("srid", ""),
+        "veglenkesekvensid": seg.get("veglenkesekvensid"),
+        "startposisjon": seg.get("startposisjon"),
+        "sluttposisjon": seg.get("sluttposisjon"),
+        "fra_meter": strek.get("fra_meter"),
+        "til_meter": strek.get("til_meter"),
+        "meter": strek.get("meter"),
+        "del_fra_meter": del_.get("fra_meter"),
+        "del_til_meter": del_.get("til_meter"),
+    }
+
+
+def vegnett_fra_segment(segment: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Segment-JSON frå NVDB -> kompakte array:
+    linjestykke (x0, y0, z0, x1, y1, z1), kva segment dei høyrer til, og
+    kor langt inn i segmentet dei startar (meter langs geometrien).
+    """
+    attr: Dict[str, list] = {k: [] for k in SEGMENT_TEKST + SEGMENT_TAL}
+    stykke, seg_nr, offset, seg_lengd = [], [], [], []
+
+    for seg in segment:
+        xyz = _koordinatar((seg.get("geometri") or {}).get("wkt", ""))
+        if len(xyz) < 2:
+            continue
+        n = len(attr["kortform"])
+        for k, v in _segment_attributt(seg).items():
+            attr[k].append(v)
+
+        a, b = xyz[:-1], xyz[1:]
+        lengd = np.hypot(b[:, 0] - a[:, 0], b[:, 1] - a[:, 1])
+        stykke.append(np.hstack([a, b]))
+        seg_nr.append(np.full(len(a), n, dtype=np.int64))
+        offset.append(np.concatenate([[0.0], np.cumsum(lengd)[:-1]]))
+        seg_lengd.append(lengd.sum())
+
+    vegnett: Dict[str, np.ndarray] = {
+        "stykke": np.vstack(stykke) if stykke else np.empty((0, 6)),
+        "stykke_segment": np.concatenate(seg_nr) if seg_nr else np.empty(0, dtype=np.int64),
+        "stykke_offset": np.concatenate(offset) if offset else np.empty(0),
+        "segment_lengd": np.array(seg_lengd, dtype=float),
+    }
+    for k in SEGMENT_TEKST:
+        vegnett[k] = np.array(["" if v is None else str(v) for v in attr[k]], dtype=str)
+    for k in SEGMENT_TAL:
+        vegnett[k] = np.array([np.nan if v is None or v == "" else float(v) for v in attr[k]], dtype=float)
+    return vegnett
+
+
+def last_ned_vegnett(
+    fylke: int = FYLKE,
+    sti: str = VEGNETT_FIL,
+    base_url: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """Hent segmentert vegnett for fylket (følgjer metadata.neste.href) og lagre som .npz."""
+    session = build_session()
+    url: Optional[str] = base_url or VEGNETT_URL
+    params: Optional[Dict[str, Any]] = {"fylke": fylke, "antall": SIDESTORLEIK}
+    segment: List[Dict[str, Any]] = []
+    sett_url = set()
+
+    while url and url not in sett_url:
+        sett_url.add(url)
+        resp = session.get(url, params=params, timeout=60)
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code} frå vegnett: {resp.text[:500]}")
+        data = resp.json()
+        objekter = data.get("objekter", []) or []
+        segment.extend(objekter)
+        print(f"Vegnett: {len(segment)} segment")
+        metadata = data.get("metadata") or {}
+        if not objekter or metadata.get("returnert", len(objekter)) == 0:
+            break
+        url = (metadata.get("neste") or {}).get("href")
+        params = None
+
+    vegnett = vegnett_fra_segment(segment)
+    np.savez_compressed(sti, **vegnett)
+    print(f"Lagra {len(vegnett['kortform'])} segment / {len(vegnett['stykke'])} linjestykke i {sti}")
+    return vegnett
+
+
+def last_vegnett(sti: str = VEGNETT_FIL) -> Dict[str, np.ndarray]:
+    with np.load(sti) as npz:
+        vegnett = {k: npz[k] for k in npz.files}
+    manglar = [k for k in SEGMENT_TEKST + SEGMENT_TAL if k not in vegnett]
+    if manglar:
+        print(f"{sti} manglar {', '.join(manglar)} (eldre format), lastar ned på nytt")
+        return last_ned_vegnett(sti=sti)
+    return vegnett
+
+
+# ---------------------------
+# Rutenett-indeks
+# ---------------------------
+
+
+def bygg_indeks(vegnett: Dict[str, np.ndarray], celle_m: float = CELLE_M) -> Dict[str, Any]:
+    """
+    Rutenett over linjestykka: (rute-nøkkel sortert, start/slutt i stykke-lista).
+    Eit stykke blir registrert i alle ruter bounding-boksen dekkjer.
+    """
+    s = vegnett["stykke"]
+    x0 = np.floor(np.minimum(s[:, 0], s[:, 3]) / celle_m).astype(np.int64)
+    x1 = np.floor(np.maximum(s[:, 0], s[:, 3]) / celle_m).astype(np.int64)
+    y0 = np.floor(np.minimum(s[:, 1], s[:, 4]) / celle_m).astype(np.int64)
+    y1 = np.floor(np.maximum(s[:, 1], s[:, 4]) / celle_m).astype(np.int64)
+
+    # Ekspander kvart stykke til alle (cx, cy) i bounding-boksen
+    nx = x1 - x0 + 1
+    ny = y1 - y0 + 1
+    antal = nx * ny
+    stykke_id = np.repeat(np.arange(len(s)), antal)
+    lokal = np.arange(antal.sum()) - np.repeat(np.cumsum(antal) - antal, antal)
+    cx = np.repeat(x0, antal) + lokal % np.repeat(nx, antal)
+    cy = np.repeat(y0, antal) + lokal // np.repeat(nx, antal)
+
+    nøkkel = _rute_nøkkel(cx, cy)
+    rekkjefølgje = np.argsort(nøkkel, kind="stable")
+    nøkkel = nøkkel[rekkjefølgje]
+    unike, start = np.unique(nøkkel, return_index=True)
+    slutt = np.append(start[1:], len(nøkkel))
+
+    return {
+        "vegnett": vegnett,
+        "celle_m": celle_m,
+        "ruter": unike,
+        "start": start,
+        "slutt": slutt,
+        "stykke_id": stykke_id[rekkjefølgje],
+    }
+
+
+def _rute_nøkkel(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+    # UTM33 i meter: rutenummer får god plass i 32 bit kvar
+    return (cx.astype(np.int64) << 32) + (cy.astype(np.int64) & 0xFFFFFFFF)
+
+
+# ---------------------------
+# Snapping
+# ---------------------------
+
+
+def _næraste(indeks: Dict[str, Any], ost: np.ndarray, nord: np.ndarray, maks_avstand: float):
+    """Næraste linjestykke per punkt: (stykke, t langs stykket, avstand). -1 om ingen innanfor."""
+    n = len(ost)
+    beste = np.full(n, -1, dtype=np.int64)
+    beste_t = np.zeros(n)
+    beste_d = np.full(n, np.inf)
+    if len(indeks["ruter"]) == 0:
+        return beste, beste_t, beste_d
+    celle = indeks["celle_m"]
+    s = indeks["vegnett"]["stykke"]
+
+    # Søkjeområdet [p - r, p + r] dekkjer alle ruter frå floor((p-r)/c) til floor((p+r)/c)
+    r = float(maks_avstand)
+    steg = int(np.ceil(r / celle))
+    gyldig = np.isfinite(ost) & np.isfinite(nord)
+    cx = np.floor(np.where(gyldig, ost, 0.0) / celle).astype(np.int64)
+    cy = np.floor(np.where(gyldig, nord, 0.0) / celle).astype(np.int64)
+
+    for dx in range(-steg, steg + 1):
+        for dy in range(-steg, steg + 1):
+            nøkkel = _rute_nøkkel(cx + dx, cy + dy)
+            pos = np.searchsorted(indeks["ruter"], nøkkel)
+            pos = np.minimum(pos, len(indeks["ruter"]) - 1)
+            treff = gyldig & (indeks["ruter"][pos] == nøkkel)
+            if not treff.any():
+                continue
+            punkt = np.nonzero(treff)[0]
+            fra = indeks["start"][pos[punkt]]
+            antal = indeks["slutt"][pos[punkt]] - fra
+
+            # Kandidatpar (punkt, stykke)
+            p = np.repeat(punkt, antal)
+            k = indeks["stykke_id"][np.repeat(fra, antal) + np.arange(antal.sum()) - np.repeat(np.cumsum(antal) - antal, antal)]
+
+            ax, ay, bx, by = s[k, 0], s[k, 1], s[k, 3], s[k, 4]
+            vx, vy = bx - ax, by - ay
+            l2 = vx * vx + vy * vy
+            with np.errstate(invalid="ignore", divide="ignore"):
+                t = ((ost[p] - ax) * vx + (nord[p] - ay) * vy) / l2
+            t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+            d = np.hypot(ost[p] - (ax + t * vx), nord[p] - (ay + t * vy))
+
+            # Minste avstand per punkt i denne ruta (sorter på punkt, så avstand)
+            o = np.lexsort((d, p))
+            p, k, t, d = p[o], k[o], t[o], d[o]
+            først = np.ones(len(p), dtype=bool)
+            først[1:] = p[1:] != p[:-1]
+            p, k, t, d = p[først], k[først], t[først], d[først]
+
+            betre = d < beste_d[p]
+            beste[p[betre]] = k[betre]
+            beste_t[p[betre]] = t[betre]
+            beste_d[p[betre]] = d[betre]
+
+    utanfor = beste_d > maks_avstand
+    beste[utanfor] = -1
+    return beste, beste_t, beste_d
+
+
+def _langs(fra: np.ndarray, til: np.ndarray, andel: np.ndarray, punkt: Optional[np.ndarray] = None) -> np.ndarray:
+    """Meterverdi for andelen langs [fra, til]; `punkt` der segmentet berre har éin meterverdi."""
+    ut = fra + andel * (til - fra)
+    if punkt is not None:
+        ut = np.where(np.isfinite(ut), ut, punkt)
+    return ut
+
+
+def _kortform(segment_kortform: np.ndarray, meter: np.ndarray) -> np.ndarray:
+    """
+    Kortforma til segmentet med siste meterdel bytt ut med meterverdien til punktet,
+    som i svaret frå /posisjon ("EV6 S1D1 m120 SD1 m15-30" -> "EV6 S1D1 m120 SD1 m22").
+    """
+    ut = []
+    for kf, m in zip(segment_kortform, meter):
+        treff = _SISTE_METER.match(kf)
+        ut.append(f"{treff.group(1)}{int(round(m))}" if treff and np.isfinite(m) else kf)
+    return np.array(ut, dtype=object)
+
+
+def _fmt(v: np.ndarray, desimalar: int) -> np.ndarray:
+    ut = np.char.mod(f"%.{desimalar}f", np.nan_to_num(v))
+    return np.where(np.isfinite(v), ut, "")
+
+
+def snapp(
+    indeks: Dict[str, Any],
+    ost,
+    nord,
+    maks_avstand: float = MAKS_AVSTAND,
+    batch: int = BATCH,
+) -> pd.DataFrame:
+    """
+    Snapp punkt (UTM33) til næraste veg innanfor maks_avstand.
+    Returnerer DataFrame med kolonnane i NEW_COLS (tomme strengar utan treff).
+    """
+    ost = np.asarray(ost, dtype=float)
+    nord = np.asarray(nord, dtype=float)
+    v = indeks["vegnett"]
+
+    stykke = np.empty(len(ost), dtype=np.int64)
+    t = np.empty(len(ost))
+    d = np.empty(len(ost))
+    for i in range(0, len(ost), batch):
+        sl = slice(i, i + batch)
+        stykke[sl], t[sl], d[sl] = _næraste(indeks, ost[sl], nord[sl], maks_avstand)
+
+    treff = stykke >= 0
+    k = np.where(treff, stykke, 0)
+    seg = v["stykke_segment"][k] if len(v["stykke_segment"]) else np.zeros(len(ost), dtype=np.int64)
+    s = v["stykke"][k]
+
+    # Punkt på vegen (z interpolert dersom geometrien har høgd)
+    px = s[:, 0] + t * (s[:, 3] - s[:, 0])
+    py = s[:, 1] + t * (s[:, 4] - s[:, 1])
+    pz = s[:, 2] + t * (s[:, 5] - s[:, 2])
+
+    # Andel langs segmentet -> relativ posisjon på veglenkesekvensen og meterverdi på strekninga
+    langs = v["stykke_offset"][k] + t * np.hypot(s[:, 3] - s[:, 0], s[:, 4] - s[:, 1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        andel = np.where(v["segment_lengd"][seg] > 0, langs / v["segment_lengd"][seg], 0.0)
+    relpos = _langs(v["startposisjon"][seg], v["sluttposisjon"][seg], andel)
+    meter = _langs(v["fra_meter"][seg], v["til_meter"][seg], andel, v["meter"][seg])
+    del_meter = _langs(v["del_fra_meter"][seg], v["del_til_meter"][seg], andel)
+
+    vlsid = np.array([str(int(x)) if np.isfinite(x) else "" for x in v["veglenkesekvensid"][seg]], dtype=object)
+    relpos_txt = _fmt(relpos, 8)
+    meter_txt = _fmt(meter, 3)
+
+    # Vegsystemreferanse for punktet; på kryss/sideanlegg er det meterverdien på delen som endrar seg
+    kortform = _kortform(v["kortform"][seg], np.where(np.isfinite(del_meter), del_meter, meter))
+
+    z_txt = np.where(np.isfinite(pz), " " + _fmt(pz, 3), "")
+    wkt = np.where(
+        np.isfinite(pz),
+        "POINT Z (" + _fmt(px, 3).astype(object) + " " + _fmt(py, 3).astype(object) + z_txt.astype(object) + ")",
+        "POINT (" + _fmt(px, 3).astype(object) + " " + _fmt(py, 3).astype(object) + ")",
+    )
+
+    ut = pd.DataFrame({
+        "vegsystemreferanse.kortform": kortform,
+        "vegkategori": v["vegkategori"][seg],
+        "fase": v["fase"][seg],
+        "vegnr": v["vegnr"][seg],
+        "strekning": v["strekning"][seg],
+        "delstrekning": v["delstrekning"][seg],
+        "arm": v["arm"][seg],
+        "adskilte_løp": v["adskilte_løp"][seg],
+        "trafikantgruppe": v["trafikantgruppe"][seg],
+        "retning": v["retning"][seg],
+        "meter": meter_txt,
+        "veglenkesekvensid": vlsid,
+        "relativPosisjon": relpos_txt,
+        "veglenkesekvens.kortform": relpos_txt.astype(object) + "@" + vlsid,
+        "geometri.wkt": wkt,
+        "geometri.srid": v["srid"][seg],
+        "kommune (treff)": v["kommune"][seg],
+        "avstand_vegnettet_m": _fmt(d, 3),
+    }, columns=NEW_COLS).astype(object)
+    ut.loc[~treff, :] = ""
+    return ut
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+
+def main():
+    # Last ned (eller oppdater) vegnettet for fylket
+    last_ned_vegnett(int(sys.argv[1]) if len(sys.argv) > 1 else FYLKE)
+
+
+if __name__ == "__main__":
+    main()
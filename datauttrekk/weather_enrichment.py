@@ -1,17 +1,23 @@
 import os
+import sys
 import csv
 import time
 import math
 import json
+import numpy as np
 import pandas as pd
 import requests
 from tqdm import tqdm
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from pyproj import Transformer
+import collections
 import concurrent.futures
 import threading
 
+import vaer_lager
+from fallvilt_lagring import VAER_EINING, tal_fra_eining
+
 # =======================
 # KONFIG
 # =======================
@@ -50,7 +56,24 @@ RAW_ELEMENTS = ",".join([
     "precipitation_type"
 ])
 
-# Output-kolonner (vi lagrer verdier som "tall + enhet" i strenger, som i dine eksempler)
+# Bulk-modus (--bulk): éin førespurnad per stasjon og datovindauge i staden for per (stasjon, dato)
+BULK_VINDU_DAGER = 366    # lengde på referencetime-intervallet per førespurnad
+BULK_WORKERS = 8          # éin trådpool for heile køyringa
+SNOW_ELEMENTS = ["snow_depth", "surface_snow_thickness", "snow_depth_surface"]
+P1D_KOLONNER = {
+    "max(air_temperature P1D)":      "max_temperature",
+    "min(air_temperature P1D)":      "min_temperature",
+    "mean(air_temperature P1D)":     "mean_temperature",
+    "sum(precipitation_amount P1D)": "total_precipitation",
+    "max(wind_speed P1D)":           "max_wind_speed",
+    "mean(wind_speed P1D)":          "mean_wind_speed",
+    "max(wind_speed_of_gust P1D)":   "max_wind_gust",
+}
+# Stasjonen for dagsverdiar må måle temperatur (P1D); snødybde kan kome frå ein annan stasjon
+TEMP_P1D_ELEMENTS = ["max(air_temperature P1D)", "min(air_temperature P1D)", "mean(air_temperature P1D)"]
+
+# Output-kolonner. Internt (cache/lager) er verdiane "tall + enhet"-strenger; i fila blir
+# vêrkolonnane skrivne som tal i einingane i fallvilt_lagring.VAER_EINING
 OUT_COLS = [
     "snow_depth",
     "max_temperature",
@@ -127,7 +150,8 @@ def frost_get(url, params):
 # =======================
 # CACHER
 # =======================
-station_cache = {}        # key=(grid_lon, grid_lat) -> "SNxxxxx"
+# Vedvarande lager (vaer_lager.sqlite) blir lese først; desse er berre for prosessen
+station_cache = vaer_lager.hent_stasjonsruter()   # key=(grid_lon, grid_lat) -> "SNxxxxx"
 daily_cache   = {}        # key=(station_id, date_iso) -> dict med ferdige strenger
 raw_cache     = {}        # key=(station_id, date_iso) -> raw "data" (liste)
 
@@ -152,9 +176,16 @@ def nearest_station_id(lon, lat):
         raise RuntimeError("Ingen stasjon funnet for punktet.")
     sn = data[0]["id"]  # "SNxxxxx"
     station_cache[key] = sn
+    vaer_lager.lagre_stasjonsrute(key, sn)
     return sn
 
 def get_p1d_summary(station_id, date_iso):
+    tekst = vaer_lager.hent_dag(station_id, "p1d", date_iso, P1D_KOLONNER)
+    if tekst is not None:
+        if not tekst:
+            return None
+        return {kol: tekst.get(eid, "") for eid, kol in P1D_KOLONNER.items()}
+
     params = {
         "sources": station_id,
         "elements": DAILY_ELEMENTS,
@@ -162,6 +193,9 @@ def get_p1d_summary(station_id, date_iso):
     }
     js = frost_get(FROST_OBS_URL, params)
     rows = js.get("data", [])
+    vaer_lager.lagre_observasjonar(
+        _obs_tabell(station_id, rows, keep="last"), [(station_id, "p1d", date_iso)]
+    )
     if not rows:
         return None
     obs = {}
@@ -186,6 +220,10 @@ def get_raw_day(station_id, date_iso):
     key = (station_id, date_iso)
     if key in raw_cache:
         return raw_cache[key]
+    rows = vaer_lager.hent_raa_dag(station_id, date_iso)
+    if rows is not None:
+        raw_cache[key] = rows
+        return rows
     d0 = datetime.fromisoformat(date_iso).date()
     d1 = d0 + timedelta(days=1)
     window = f"{d0}T00:00:00Z/{d1}T00:00:00Z"
@@ -197,6 +235,7 @@ def get_raw_day(station_id, date_iso):
     js = frost_get(FROST_OBS_URL, params)
     rows = js.get("data", [])
     raw_cache[key] = rows
+    vaer_lager.lagre_raa_dag(station_id, date_iso, rows)
     return rows
 
 def snow_depth_from_raw(raw_rows):
@@ -281,59 +320,318 @@ def get_daily_weather(lon, lat, date_iso):
     return out
 
 # =======================
-# HOVEDPIPELINE
+# BULK: stasjon × datovindauge, kolonnetabell i minnet
 # =======================
+OBS_KOLONNER = vaer_lager.OBS_KOLONNER
+
+def _obs_tabell(station_id, rows, keep):
+    """
+    Frost "data"-liste -> kolonnetabell (OBS_KOLONNER) med éin verdi per
+    (element, dato): keep="last" for P1D (som get_p1d_summary), "first" for snø.
+    """
+    kol = {k: [] for k in OBS_KOLONNER}
+    for row in rows:
+        dato = str(row.get("referenceTime", ""))[:10]
+        for ob in row.get("observations", []):
+            v, u = ob.get("value"), ob.get("unit")
+            if v is None:
+                continue
+            kol["station"].append(station_id)
+            kol["dato"].append(dato)
+            kol["element"].append(ob.get("elementId"))
+            kol["verdi"].append(pd.to_numeric(v, errors="coerce") if isinstance(v, str) else v)
+            # Same strengformat som get_p1d_summary / snow_depth_from_raw
+            kol["tekst"].append(f"{v} {u}".strip() if u else str(v))
+    return pd.DataFrame(kol).drop_duplicates(["element", "dato"], keep=keep)
+
+def datovindauge(datoer, vindu_dager=BULK_VINDU_DAGER):
+    """
+    Dekk dei sorterte datoane (YYYY-MM-DD) med få intervall på maks `vindu_dager` dagar.
+    Returnerer [(fra, til)] der til er eksklusiv, klar for referencetime "fra/til".
+    """
+    dagar = sorted(set(pd.to_datetime(list(datoer)).normalize()))
+    vindauge = []
+    for d in dagar:
+        if vindauge and d < vindauge[-1][0] + pd.Timedelta(days=vindu_dager):
+            vindauge[-1][1] = d + pd.Timedelta(days=1)
+        else:
+            vindauge.append([d, d + pd.Timedelta(days=1)])
+    return [(a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")) for a, b in vindauge]
+
+def frost_observasjoner(station_id, elements, fra, til):
+    """
+    Rå Frost-rader for stasjonen i [fra, til). [] om Frost ikkje har data
+    (404/412), None om kallet feila (då blir dagane ikkje merkte som henta).
+    """
+    params = {
+        "sources": station_id,
+        "elements": elements,
+        "referencetime": f"{fra}/{til}",
+    }
+    try:
+        return frost_get(FROST_OBS_URL, params).get("data", [])
+    except Exception as e:
+        print(f"Frost {station_id} {fra}/{til}: {str(e)[:200]}")
+        # Frost svarar 404/412 når stasjonen manglar elementa i perioden
+        if isinstance(e, RuntimeError) and ("(404)" in str(e) or "(412)" in str(e)):
+            return []
+        return None
 
-kommune_dato_cache = {}   # key = (Kommune, date_iso) -> weather dict
-
-def process_row(row, idx, new_cols, kommune_dato_cache, kommune_cache_lock):
-    kommune = str(row.get("Kommune", "")).strip()
-    d = row.get("Dato")
+# Elementsett i bulk-modus: namn i vaer_lager.dekning, element, stasjonskolonne, kva duplikat som vinn
+BULK_SETT = [
+    ("p1d", list(P1D_KOLONNER), "station", "last"),
+    ("snow", SNOW_ELEMENTS, "snow_station", "first"),
+]
 
-    out_row = list(row.values)
+def oppdater_vaer_lager(par):
+    """
+    Hent frå Frost det som manglar (eller er utgått) i vaer_lager for para, og lagre det.
+    Éin førespurnad per stasjon, elementsett og datovindauge; dagar som alt er
+    endelege i lageret blir ikkje spurde om.
+    """
+    jobbar = []
+    for namn, element, kolonne, keep in BULK_SETT:
+        for station_id, dager in par[par[kolonne] != ""].groupby(kolonne)["dato"]:
+            dekt = vaer_lager.dekte_dagar(station_id, namn, dager)
+            mangler = [d for d in dager.unique() if d not in dekt]
+            for fra, til in datovindauge(mangler):
+                jobbar.append((namn, station_id, ",".join(element), fra, til, keep))
+    if not jobbar:
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+        svar = list(tqdm(executor.map(lambda j: frost_observasjoner(j[1], j[2], j[3], j[4]), jobbar),
+                         total=len(jobbar), desc="Frost (bulk)", unit="kall"))
+
+    tabellar, dekning = [], []
+    for (namn, station_id, _, fra, til, keep), rows in zip(jobbar, svar):
+        if rows is None:
+            continue
+        tabellar.append(_obs_tabell(station_id, rows, keep))
+        # Alle dagar i vindauget er henta, også dei utan data
+        dekning += [(station_id, namn, d.strftime("%Y-%m-%d"))
+                    for d in pd.date_range(fra, til, inclusive="left")]
+    obs = pd.concat(tabellar, ignore_index=True) if tabellar else pd.DataFrame(columns=OBS_KOLONNER)
+    vaer_lager.lagre_observasjonar(obs, dekning)
+
+def hent_vaer_bulk(par):
+    """
+    Vêr for alle unike (station, dato) i `par` (DataFrame med kolonnane station, dato
+    og valfritt snow_station; utan snow_station kjem snødybda frå `station`).
+    Lageret (vaer_lager) blir fylt frå Frost der det manglar, og verdiane lesne derifrå;
+    rå timesdata blir berre henta for dagar utan P1D-verdiar (same fallback som get_daily_weather).
+    Returnerer éi rad per unik kombinasjon med OUT_COLS (strenger).
+    """
+    if "snow_station" not in par.columns:
+        par = par.assign(snow_station=par["station"])
+    par = par[par["dato"].notna()].fillna("").drop_duplicates().reset_index(drop=True)
+    oppdater_vaer_lager(par)
+
+    # P1D: éin verdi per (stasjon, dato, element) i lageret
+    p1d = vaer_lager.hent_observasjonar(par[par["station"] != ""], P1D_KOLONNER)
+    p1d = (p1d.pivot(index=["station", "dato"], columns="element", values="tekst")
+              .rename(columns=P1D_KOLONNER))
+    # Snødybde: første snøelement (i SNOW_ELEMENTS-rekkjefølgje) med verdi
+    snow = vaer_lager.hent_observasjonar(
+        par.loc[par["snow_station"] != "", ["snow_station", "dato"]].rename(columns={"snow_station": "station"}),
+        SNOW_ELEMENTS,
+    )
+    snow = (snow.assign(prioritet=snow["element"].map({e: i for i, e in enumerate(SNOW_ELEMENTS)}))
+                .sort_values("prioritet", kind="stable")
+                .drop_duplicates(["station", "dato"], keep="first")
+                .set_index(["station", "dato"])["tekst"].rename("snow_depth"))
+
+    ut = par.join(p1d, on=["station", "dato"]).join(snow.rename_axis(["snow_station", "dato"]), on=["snow_station", "dato"])
+    for c in OUT_COLS:
+        if c not in ut.columns:
+            ut[c] = ""
+    ut[OUT_COLS] = ut[OUT_COLS].fillna("")
+    ut["weather_station_id"] = ut["station"]
+
+    # Fallback frå rå timesdata der P1D manglar heilt
+    p1d_cols = list(P1D_KOLONNER.values())
+    mangler = ut.index[(ut[p1d_cols] == "").all(axis=1) & (ut["station"] != "")]
+    if len(mangler):
+        def _fallback(i):
+            try:
+                return i, compute_daily_from_raw(get_raw_day(ut.at[i, "station"], ut.at[i, "dato"]))
+            except Exception:
+                return i, {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+            for i, res in tqdm(executor.map(_fallback, mangler), total=len(mangler),
+                               desc="Frost (fallback)", unit="dagar"):
+                for k, v in res.items():
+                    if k in ut.columns:
+                        ut.at[i, k] = v
+    return ut
+
+def main_bulk():
+    """Bulk-variant av main(): heile fila i minnet, vêr slått opp vektorisert per (stasjon, dato)."""
+    df = pd.read_csv(INPUT_CSV, sep=";", low_memory=False)
+    new_cols = [c for c in OUT_COLS if c not in df.columns]
+
+    df["Dato"] = pd.to_datetime(df["Dato"], format="%d.%m.%Y", errors="coerce")
+    dato_iso = df["Dato"].dt.strftime("%Y-%m-%d")
+
+    east = df["UTM33 øst"].map(parse_coord).astype(float).to_numpy()
+    north = df["UTM33 nord"].map(parse_coord).astype(float).to_numpy()
+
+    # Næraste stasjon per kollisjon frå lokal stasjonskatalog (ingen sources-kall):
+    # dagsverdiar frå næraste temperaturstasjon, snødybde frå næraste snøstasjon,
+    # begge med tidsserie som er gyldig den dagen
+    import frost_stasjonar as fs
+    katalog = fs.last_katalog() if os.path.exists(fs.KATALOG_FIL) else fs.last_ned_katalog()
+    indeks = fs.bygg_indeks(katalog)
+    har_dato = dato_iso.notna().to_numpy()
+    east = np.where(har_dato, east, np.nan)
+    station = pd.Series(fs.naermaste(indeks, east, north, TEMP_P1D_ELEMENTS, dato_iso), index=df.index)
+    snow_station = pd.Series(fs.naermaste(indeks, east, north, SNOW_ELEMENTS, dato_iso), index=df.index)
+
+    # Rader utan koordinatar arvar stasjonane til ei anna rad i same kommune same dag
+    # (som arv_posisjonar i main())
+    kommune = df["Kommune"].astype(str).str.strip()
+    def _arv(st):
+        st = st.mask(st == "")
+        return st.fillna(st.groupby([kommune, dato_iso]).transform("first").where(dato_iso.notna()))
+    station, snow_station = _arv(station), _arv(snow_station)
+
+    # Vêr per unik (stasjon, dato), så vektorisert oppslag tilbake på radene
+    par = pd.DataFrame({"station": station, "snow_station": snow_station, "dato": dato_iso}).fillna({"station": "", "snow_station": ""})
+    vaer = hent_vaer_bulk(par)
+    rader = par.merge(vaer, on=["station", "snow_station", "dato"], how="left")
+    for c in new_cols:
+        if c in VAER_EINING:
+            df[c] = tal_fra_eining(rader[c], VAER_EINING[c]).to_numpy()
+        else:
+            df[c] = rader[c].fillna("").to_numpy()
+
+    df.to_csv(OUTPUT_CSV, sep=";", index=False, encoding="utf-8")
+    print(f"🎉 Ferdig! Skrev {OUTPUT_CSV} ({par['station'].nunique()} stasjoner)")
 
-    if pd.isna(d):
-        out_row.extend([""] * len(new_cols))
-        return idx, out_row
+# =======================
+# HOVEDPIPELINE
+# =======================
 
-    date_iso = pd.to_datetime(d).strftime("%Y-%m-%d")
+CHUNKS_I_GANG = 2   # chunkar sende til trådpoolen før den eldste blir skriven (held arbeidarane i gang)
+FRAMDRIFT_SUFFIX = ".framdrift.json"
 
-    cache_key = (kommune, date_iso)
-    with kommune_cache_lock:
-        if cache_key in kommune_dato_cache:
-            wx = kommune_dato_cache[cache_key]
-            out_row.extend([wx.get(c, "") for c in new_cols])
-            return idx, out_row
+def framdrift_sti():
+    return OUTPUT_CSV + FRAMDRIFT_SUFFIX
 
-    east = parse_coord(row.get("UTM33 øst"))
-    north = parse_coord(row.get("UTM33 nord"))
+def _inn_id():
+    """Identiteten til inn-fila; ei endra fil gjer framdrifta ugyldig."""
+    st = os.stat(INPUT_CSV)
+    return {"inn": INPUT_CSV, "storleik": st.st_size, "mtime_ns": st.st_mtime_ns}
 
+def les_framdrift(out_header):
+    """
+    Framdrifta frå ei avbroten køyring: {"rader", "bytes", ...}, eller None om
+    ho manglar eller ikkje passar (anna inn-fil, anna header, for kort ut-fil).
+    """
+    sti = framdrift_sti()
+    if not os.path.exists(sti) or not os.path.exists(OUTPUT_CSV):
+        return None
+    try:
+        with open(sti, encoding="utf-8") as f:
+            fd = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ({k: fd.get(k) for k in ("inn", "storleik", "mtime_ns")} != _inn_id()
+            or fd.get("header") != out_header
+            or os.path.getsize(OUTPUT_CSV) < fd.get("bytes", 0)):
+        print(f"Framdrifta i {sti} passar ikkje til {INPUT_CSV}, startar på nytt")
+        return None
+    return fd
+
+def skriv_framdrift(out_f, rader, out_header):
+    """Skriv framdrifta etter at ut-fila er tømd til disk (atomisk, via .tmp)."""
+    out_f.flush()
+    os.fsync(out_f.fileno())
+    fd = {**_inn_id(), "header": out_header, "rader": rader, "bytes": out_f.tell()}
+    tmp = framdrift_sti() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(fd, f, ensure_ascii=False)
+    os.replace(tmp, framdrift_sti())
+
+def _lonlat(east, north):
+    """(lon, lat) frå UTM-tekst/-tal, eller None om koordinatane ikkje er brukbare."""
+    east, north = parse_coord(east), parse_coord(north)
     if east is None or north is None:
-        out_row.extend([""] * len(new_cols))
-        return idx, out_row
-
+        return None
     try:
-        lon, lat = utm33_to_lonlat(east, north)
+        return utm33_to_lonlat(east, north)
     except Exception:
+        return None
+
+def arv_posisjonar():
+    """
+    (Kommune, dato) -> (lon, lat) for første rad i INPUT_CSV (filrekkjefølgje) med
+    brukbare koordinatar. Rader utan koordinatar slår opp vêret der, same kva for
+    chunk den raden ligg i (som _arv i main_bulk). Berre fire kolonnar blir lesne.
+    """
+    posisjonar = {}
+    chunks = pd.read_csv(INPUT_CSV, sep=";", chunksize=CHUNK_SIZE * 50, low_memory=False,
+                         usecols=["Kommune", "Dato", "UTM33 øst", "UTM33 nord"])
+    for chunk in chunks:
+        dato = pd.to_datetime(chunk["Dato"], format="%d.%m.%Y", errors="coerce").dt.strftime("%Y-%m-%d")
+        kommune = chunk["Kommune"].map(lambda k: str(k).strip())
+        for k, d, e, n in zip(kommune, dato, chunk["UTM33 øst"], chunk["UTM33 nord"]):
+            if pd.isna(d) or (k, d) in posisjonar:
+                continue
+            lonlat = _lonlat(e, n)
+            if lonlat is not None:
+                posisjonar[(k, d)] = lonlat
+    return posisjonar
+
+def process_row(row, new_cols, arv):
+    """
+    Ut-rad med vêr for rada. Rader utan brukbare koordinatar brukar posisjonen
+    til første rad med koordinatar i same kommune same dag (`arv`, frå arv_posisjonar).
+    """
+    out_row = list(row.values)
+    d = row.get("Dato")
+
+    if pd.isna(d):
+        out_row.extend([""] * len(new_cols))
+        return out_row
+
+    date_iso = pd.to_datetime(d).strftime("%Y-%m-%d")
+    lonlat = _lonlat(row.get("UTM33 øst"), row.get("UTM33 nord"))
+    if lonlat is None:
+        lonlat = arv.get((str(row.get("Kommune", "")).strip(), date_iso))
+    if lonlat is None:
         out_row.extend([""] * len(new_cols))
-        return idx, out_row
+        return out_row
 
     try:
-        wx = get_daily_weather(lon, lat, date_iso)
+        wx = get_daily_weather(lonlat[0], lonlat[1], date_iso)
     except Exception:
         wx = {c: "" for c in new_cols}
 
-    with kommune_cache_lock:
-        kommune_dato_cache[cache_key] = wx
-
     out_row.extend([wx.get(c, "") for c in new_cols])
-    return idx, out_row
-
-def main():
-    # Forbered output: skriv header én gang
-    if os.path.exists(OUTPUT_CSV):
-        os.remove(OUTPUT_CSV)
-
+    return out_row
+
+def skriv_chunk(futures, out_writer, out_header, new_cols):
+    """Skriv éin chunk i inn-rekkjefølgje (futures i same rekkjefølgje som radene)."""
+    rader = [f.result() for f in futures]
+
+    # Vêrverdiar som tal (vektorisert per chunk), tomt der verdien manglar
+    for c in new_cols:
+        if c in VAER_EINING:
+            j = out_header.index(c)
+            tal = tal_fra_eining(pd.Series([r[j] for r in rader], dtype=object), VAER_EINING[c])
+            for r, v in zip(rader, tal):
+                r[j] = "" if pd.isna(v) else v
+
+    out_writer.writerows(rader)
+    return len(rader)
+
+def main(ny=False):
+    """
+    Radvis berikning med ordna og gjenopptakbar skriving: radene blir skrivne i
+    inn-rekkjefølgje, og etter kvar chunk blir framdrifta lagra ved sida av
+    OUTPUT_CSV. Ei ny køyring held fram der den førre stoppa (ny=True: start på nytt).
+    """
     # Les input-header
     with open(INPUT_CSV, "r", encoding="utf-8") as f:
         reader = csv.reader(f, delimiter=";")
@@ -342,38 +640,63 @@ def main():
     new_cols = [c for c in OUT_COLS if c not in base_header]
     out_header = base_header + new_cols
 
-    # Åpne output-fil for streaming append
-    out_f = open(OUTPUT_CSV, "w", newline="", encoding="utf-8")
-    out_writer = csv.writer(out_f, delimiter=";")
-    out_writer.writerow(out_header)
+    framdrift = None if ny else les_framdrift(out_header)
+    if framdrift:
+        # Kutt det som blei skrive etter siste lagra framdrift, og hald fram derifrå
+        ferdige = framdrift["rader"]
+        os.truncate(OUTPUT_CSV, framdrift["bytes"])
+        out_f = open(OUTPUT_CSV, "a", newline="", encoding="utf-8")
+        out_writer = csv.writer(out_f, delimiter=";")
+        print(f"Held fram etter {ferdige} rader i {OUTPUT_CSV}")
+    else:
+        ferdige = 0
+        out_f = open(OUTPUT_CSV, "w", newline="", encoding="utf-8")
+        out_writer = csv.writer(out_f, delimiter=";")
+        out_writer.writerow(out_header)
+        skriv_framdrift(out_f, 0, out_header)
+
+    # Posisjonar for rader utan koordinatar, frå heile fila (også chunkar som kjem seinare)
+    arv = arv_posisjonar()
 
     # Progressbar
     total_rows = sum(1 for _ in open(INPUT_CSV, encoding="utf-8")) - 1
-    pbar = tqdm(total=total_rows, desc="Beriker med værdata", unit="rader")
-
-    kommune_dato_cache = {}   # key = (Kommune, date_iso) -> weather dict
-    kommune_cache_lock = threading.Lock()
+    pbar = tqdm(total=total_rows, initial=ferdige, desc="Beriker med værdata", unit="rader")
 
-    # STREAMING: ikke bygg store chunks, skriv rad for rad
-    for chunk in pd.read_csv(INPUT_CSV, sep=";", chunksize=CHUNK_SIZE, low_memory=False):
-        # Normaliser dato
-        chunk["Dato"] = pd.to_datetime(chunk["Dato"], format="%d.%m.%Y", errors="coerce")
-
-        # Submit rows to thread pool
+    # Éin trådpool for heile køyringa; CHUNKS_I_GANG chunkar i kø, så arbeidarane
+    # ikkje står og ventar medan den eldste chunken blir skriven
+    chunks = pd.read_csv(INPUT_CSV, sep=";", chunksize=CHUNK_SIZE, low_memory=False,
+                         skiprows=range(1, ferdige + 1))
+    ventar = collections.deque()
+    try:
         with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
-            futures = [
-                executor.submit(process_row, row, idx, new_cols, kommune_dato_cache, kommune_cache_lock)
-                for idx, row in chunk.iterrows()
-            ]
-            # Ensure order by sorting futures by idx
-            for future in concurrent.futures.as_completed(futures):
-                idx, out_row = future.result()
-                out_writer.writerow(out_row)
-                pbar.update(1)
-
-    pbar.close()
-    out_f.close()
+            for chunk in chunks:
+                # Normaliser dato
+                chunk["Dato"] = pd.to_datetime(chunk["Dato"], format="%d.%m.%Y", errors="coerce")
+                futures = [executor.submit(process_row, row, new_cols, arv) for _, row in chunk.iterrows()]
+                for f in futures:
+                    f.add_done_callback(lambda _: pbar.update(1))
+                ventar.append(futures)
+                # Skriv den eldste chunken (i rekkjefølgje) når neste alt er i arbeid
+                while len(ventar) >= CHUNKS_I_GANG:
+                    ferdige += skriv_chunk(ventar.popleft(), out_writer, out_header, new_cols)
+                    skriv_framdrift(out_f, ferdige, out_header)
+            while ventar:
+                ferdige += skriv_chunk(ventar.popleft(), out_writer, out_header, new_cols)
+                skriv_framdrift(out_f, ferdige, out_header)
+    finally:
+        for futures in ventar:
+            for f in futures:
+                f.cancel()
+        pbar.close()
+        out_f.close()
+
+    os.remove(framdrift_sti())
     print(f"🎉 Ferdig! Skrev {OUTPUT_CSV}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python weather_enrichment.py --bulk : éin Frost-førespurnad per stasjon og datovindauge
+    # python weather_enrichment.py --ny   : radvis, men start på nytt i staden for å halde fram
+    if "--bulk" in sys.argv[1:]:
+        main_bulk()
+    else:
+        main(ny="--ny" in sys.argv[1:])
\ No newline at end of file
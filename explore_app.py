@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from datauttrekk.fallvilt_lagring import les_fallvilt
 
 st.set_page_config(
     page_title="Dyrepåkjørsler – risikostrekninger",
@@ -9,12 +10,22 @@ st.set_page_config(
 # -------------------------------------------------------------------
 # DATA – les rådata og forbered kolonner
 # -------------------------------------------------------------------
+# Kolonnar som blir brukte i filtera og utrekninga under
+KOLONNER = [
+    "Dato", "År", "Kommune", "Art", "Kjønn", "Alder", "Årsak", "Utfall",
+    "Merkelappnummer", "Fallvilt-ID", "vegsystemreferanse.kortform",
+    "vegkategori", "vegnr", "strekning", "fase", "arm", "adskilte_løp",
+    "trafikantgruppe", "retning", "veglenkesekvensid", "relativPosisjon",
+    "avstand_vegnettet_m", "ÅDT, total", "Fartsgrense", "Vegobjekt_540_id",
+    "Vegobjekt_105_id", "Vegobjekt_540_lengde",
+]
+
 @st.cache_data
 def load_raw_data():
-    df = pd.read_csv(
+    # Typa kolonnar; brukar Parquet-fila ved sida av dersom ho finst
+    df = les_fallvilt(
         "Fallvilt_trdlag_2016-2026_adttotallengder.csv",
-        sep=";",
-        low_memory=False
+        kolonner=KOLONNER,
     )
 
     # Konverter dato
@@ -9,11 +9,13 @@ import numpy as np
 #from streamlit_folium import st_folium
 from pyproj import Transformer
 import branca.colormap as cm
+import os
 import asyncio
-import httpx
 import folium   # ← DENNE mangla
 from typing import Optional, Dict
 from streamlit.components.v1 import html
+from datauttrekk import nvdb_bulk, nvdb_klient
+import geometri_lager
 
 
 def map_arsrisiko_til_yrke(arsrisiko):
@@ -124,7 +126,173 @@ def lyskategori_fra_tidspunkt(ts):
         return "skumring"
     else:
         return "natt"
-    
+
+
+# Representativt punkt for Trøndelag (same som i lyskategori_fra_tidspunkt)
+TRONDELAG_LAT = 63.4
+TRONDELAG_LON = 10.4
+
+
+def solhoyde_vektorisert(tidspunkt, lat, lon, med_refraksjon=True):
+    """
+    Vektorisert solhøgde (grader over/under horisont) for mange tidspunkt i eitt pass.
+
+    Brukar same NOAA-formlar som astral.sun.elevation, men reknar på heile
+    NumPy-array i staden for éin rad om gongen. Tidspunkt utan tidssone blir
+    tolka som UTC (som i astral), tidssone-medvitne tidspunkt blir konverterte.
+
+    Parametre
+    ----------
+    tidspunkt : pd.Series / DatetimeIndex / liste med datetime, eller eitt enkelt tidspunkt
+    lat, lon : float eller array med same lengd som tidspunkt (grader, WGS84)
+    med_refraksjon : bool, juster for atmosfærisk refraksjon (som astral)
+    ----------
+    np.ndarray : solhøgde i grader, NaN der tidspunkt eller posisjon manglar
+    """
+    if np.ndim(tidspunkt) == 0:
+        tidspunkt = [tidspunkt]
+    ts = pd.DatetimeIndex(pd.to_datetime(tidspunkt))
+    if ts.tz is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+
+    # Heile sekund sidan 1970 (astral rundar òg ned til heile sekund)
+    sek = ts.as_unit("s").asi8.astype(float)
+    sek[ts.isna()] = np.nan
+
+    lat = np.clip(np.asarray(lat, dtype=float), -89.8, 89.8)
+    lon = np.asarray(lon, dtype=float)
+
+    # Juliansk dag og hundreår
+    jd = sek / 86400.0 + 2440587.5
+    t = (jd - 2451545.0) / 36525.0
+
+    l0 = np.mod(280.46646 + t * (36000.76983 + 0.0003032 * t), 360.0)
+    m = 357.52911 + t * (35999.05029 - 0.0001537 * t)
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    mrad = np.radians(m)
+    c = (
+        np.sin(mrad) * (1.914602 - t * (0.004817 + 0.000014 * t))
+        + np.sin(2 * mrad) * (0.019993 - 0.000101 * t)
+        + np.sin(3 * mrad) * 0.000289
+    )
+    omega = 125.04 - 1934.136 * t
+    lambd = l0 + c - 0.00569 - 0.00478 * np.sin(np.radians(omega))
+    sekund = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    eps = 23.0 + (26.0 + sekund / 60.0) / 60.0 + 0.00256 * np.cos(np.radians(omega))
+
+    deklinasjon = np.arcsin(np.sin(np.radians(eps)) * np.sin(np.radians(lambd)))
+
+    y = np.tan(np.radians(eps) / 2.0) ** 2
+    l0rad = np.radians(l0)
+    eqtime = 4.0 * np.degrees(
+        y * np.sin(2 * l0rad)
+        - 2.0 * e * np.sin(mrad)
+        + 4.0 * e * y * np.sin(mrad) * np.cos(2 * l0rad)
+        - 0.5 * y * y * np.sin(4 * l0rad)
+        - 1.25 * e * e * np.sin(2 * mrad)
+    )
+
+    # Sann soltid i minutt (UTC-minutt i døgnet + korreksjonar)
+    utc_minutt = np.mod(sek, 86400.0) / 60.0
+    timevinkel = np.radians((utc_minutt + eqtime + 4.0 * lon) / 4.0 - 180.0)
+
+    latrad = np.radians(lat)
+    csz = (
+        np.cos(latrad) * np.cos(deklinasjon) * np.cos(timevinkel)
+        + np.sin(latrad) * np.sin(deklinasjon)
+    )
+    solhoyde = 90.0 - np.degrees(np.arccos(np.clip(csz, -1.0, 1.0)))
+
+    if med_refraksjon:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            te = np.tan(np.radians(solhoyde))
+            korreksjon = np.select(
+                [
+                    solhoyde >= 85.0,
+                    solhoyde > 5.0,
+                    solhoyde > -0.575,
+                ],
+                [
+                    0.0,
+                    58.1 / te - 0.07 / te**3 + 0.000086 / te**5,
+                    1735.0 + solhoyde * (-518.2 + solhoyde * (103.4 + solhoyde * (-12.79 + solhoyde * 0.711))),
+                ],
+                default=-20.774 / te,
+            )
+        solhoyde = solhoyde + korreksjon / 3600.0
+
+    return solhoyde
+
+
+def lyskategori_fra_solhoyde(solhoyde):
+    """
+    Vektorisert versjon av grensene i lyskategori_fra_tidspunkt.
+    Returnerer object-array med "dag"/"skumring"/"natt", None der solhøgde manglar.
+    """
+    solhoyde = np.asarray(solhoyde, dtype=float)
+    kategori = np.select(
+        [solhoyde > 12, solhoyde > -12],
+        ["dag", "skumring"],
+        default="natt",
+    ).astype(object)
+    kategori[np.isnan(solhoyde)] = None
+    return kategori
+
+
+def solhoyde_og_lyskategori(tidspunkt, lat=TRONDELAG_LAT, lon=TRONDELAG_LON):
+    """
+    Reknar solhøgde og lyskategori for alle tidspunkt i eitt pass.
+    Erstattar Series.apply(lyskategori_fra_tidspunkt) i lag_*-skripta.
+
+    Returnerer (solhoyde, lyskategori) som NumPy-array.
+    """
+    solhoyde = solhoyde_vektorisert(tidspunkt, lat, lon)
+    return solhoyde, lyskategori_fra_solhoyde(solhoyde)
+
+
+def tal_fra_tekst(verdiar):
+    """
+    Vektorisert tolking av tal som kan ha desimalkomma (t.d. "311386,7176").
+    Ugyldige eller tomme verdiar blir NaN.
+    """
+    arr = np.asarray(verdiar)
+    if arr.dtype.kind in "fiu":
+        return arr.astype(float)
+    s = pd.Series(arr.astype(object)).astype(str)
+    s = s.str.replace("\u00A0", "", regex=False).str.replace(" ", "", regex=False)
+    return pd.to_numeric(s.str.replace(",", ".", regex=False), errors="coerce").to_numpy()
+
+
+def heiltal_fra_tekst(verdiar):
+    """
+    Som tal_fra_tekst, men avkorta mot null til heiltal (Int64), t.d. UTM-koordinatar
+    til meter. Ugyldige eller tomme verdiar blir <NA> i staden for eit tilfeldig heiltal.
+    """
+    return pd.array(np.trunc(tal_fra_tekst(verdiar)), dtype="Int64")
+
+
+def utm33_til_latlon(ost, nord, src_epsg=32633):
+    """
+    Konverterer UTM33-koordinatar (øst/nord) til WGS84 lat/lon i eitt vektorisert kall.
+    Tek imot både tal og tekst med desimalkomma. Returnerer (lat, lon) som NumPy-array.
+    """
+    ost = tal_fra_tekst(ost)
+    nord = tal_fra_tekst(nord)
+    transformer = Transformer.from_crs(src_epsg, 4326, always_xy=True)
+    lon, lat = transformer.transform(ost, nord)
+    return np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+
+
+def solhoyde_og_lyskategori_utm(tidspunkt, ost, nord):
+    """
+    Som solhoyde_og_lyskategori, men med solhøgde rekna for kvar kollisjon sin
+    eigen posisjon (UTM33 øst/nord) i staden for eitt fast punkt i Trøndelag.
+
+    Rader utan gyldig posisjon får NaN i solhøgde og None i lyskategori.
+    """
+    lat, lon = utm33_til_latlon(ost, nord)
+    return solhoyde_og_lyskategori(tidspunkt, lat, lon)
+
 
 def maaned_til_arstid(dato):
     m = dato.month
@@ -187,30 +355,23 @@ def lag_lysjustering(model, referanse="dag", damping=1, normaliser=False):
 
     return lys_justering
 
-# Felles NVDB-headers
-headers = {
-    "Accept": "application/json",
-    "User-Agent": "nvdb-wkt-fetcher/1.0",
-    "X-Client": "nvdb-wkt-fetcher",
-}
-
 # --- Konfigurasjon ---
 vegobjekt_540_id = 1024046936
 
 # Sett kilde-CRS her: UTM sone 33N (Trøndelag). Om nødvendig, bytt til 32632.
 src_epsg = 32633
 
-# Konstanter
+# Konstanter (HTTP-oppsett, takt og retry ligg i datauttrekk/nvdb_klient.py)
 VEGOBJEKT_TYPE_ID = 540
-REQUEST_TIMEOUT = 20.0
-RETRY_BACKOFF = [0.5, 1.0, 2.0]
-MAX_CONCURRENCY = 16
-
-#sem = asyncio.Semaphore(MAX_CONCURRENCY)
 
 # Cache: objekt_id -> wkt-streng
 wkt_cache: Dict[str, str] = {}
 
+# Cache: objekt_id -> ferdig reprojiserte (lat, lon)-punkt, array med form (n, 2)
+latlon_cache: Dict[str, np.ndarray] = {}
+
+_transformarar: Dict[int, Transformer] = {}
+
 def parse_linestring_wkt(wkt_text):
     w = wkt_text.strip()
     # Finn innholdet innenfor første par med parenteser
@@ -232,7 +393,21 @@ def parse_linestring_wkt(wkt_text):
         coords.append((x, y, z))
     return coords
 
-async def hent_wkt_for_objekt(client: httpx.AsyncClient, objekt_id: str, sem: asyncio.Semaphore ) -> str:
+def wkt_til_latlon(wkt_text, src_epsg=32633):
+    """
+    Parse WKT og reprojiser alle punkt i eitt kall.
+    Returnerer array med form (n, 2) med (lat, lon).
+    """
+    pts_xyz = parse_linestring_wkt(wkt_text)
+    if not pts_xyz:
+        return np.empty((0, 2))
+    if src_epsg not in _transformarar:
+        _transformarar[src_epsg] = Transformer.from_crs(src_epsg, 4326, always_xy=True)
+    xy = np.array([(x, y) for (x, y, _) in pts_xyz], dtype=float)
+    lon, lat = _transformarar[src_epsg].transform(xy[:, 0], xy[:, 1])
+    return np.column_stack([lat, lon])
+
+async def hent_wkt_for_objekt(klient: nvdb_klient.NvdbKlient, objekt_id: str) -> str:
     """
     Henter WKT-geometri for et vegobjekt (type 540) fra NVDB API LES.
     Returnerer tom streng dersom data mangler eller ikke finnes.
@@ -243,56 +418,36 @@ async def hent_wkt_for_objekt(client: httpx.AsyncClient, objekt_id: str, sem: as
     if objekt_id in wkt_cache:
         return wkt_cache[objekt_id]
 
-    url = f"https://nvdbapiles.atlas.vegvesen.no/vegobjekter/{VEGOBJEKT_TYPE_ID}/{objekt_id}"
-
-    attempts = len(RETRY_BACKOFF) + 1
-
-    for i in range(attempts):
-        try:
-            async with sem:
-                resp = await client.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-
-            if resp.status_code == 200:
-                data = resp.json()
-
-                # Primært: geometri.wkt (øverst i JSON)
-                geom = data.get("geometri", {})
-                wkt = geom.get("wkt")
-
-                # Sekundært fallback: lokasjon.geometri.wkt
-                if not wkt:
-                    lok = data.get("lokasjon", {})
-                    lok_geom = lok.get("geometri", {})
-                    wkt = lok_geom.get("wkt", "")
-
-                wkt = wkt or ""
-                wkt_cache[objekt_id] = wkt
-                return wkt
-
-            elif 500 <= resp.status_code < 600:
-                if i < attempts - 1:
-                    await asyncio.sleep(RETRY_BACKOFF[i])
-                    continue
-                else:
-                    return ""
-            else:
-                return ""
-
-        except (httpx.HTTPError, asyncio.TimeoutError):
-            if i < attempts - 1:
-                await asyncio.sleep(RETRY_BACKOFF[i])
-                continue
-            return ""
+    data = await klient.get_json(f"/vegobjekter/{VEGOBJEKT_TYPE_ID}/{objekt_id}")
+    if data is None:
+        return ""
 
-    return ""
+    # Primært: geometri.wkt, sekundært: lokasjon.geometri.wkt
+    wkt = nvdb_bulk.wkt_fra_objekt(data)
+    wkt_cache[objekt_id] = wkt
+    return wkt
 
 def lag_felles_kart(wkt_dict, risiko_dict, src_epsg=32633):
     """
     Lag enkelt Folium-kart med vegstrekningar farga etter risiko.
     Stabil versjon utan labels / DivIcon.
     """
+    geometri_dict = {}
+    for veg_id, wkt in wkt_dict.items():
+        if not wkt:
+            continue
+        # Ferdig reprojiserte punkt frå geometrilageret, elles parse og transformer
+        if str(veg_id) not in latlon_cache:
+            latlon_cache[str(veg_id)] = wkt_til_latlon(wkt, src_epsg)
+        geometri_dict[veg_id] = latlon_cache[str(veg_id)]
 
-    transformer = Transformer.from_crs(src_epsg, 4326, always_xy=True)
+    return lag_kart_fra_geometri(geometri_dict, risiko_dict)
+
+def lag_kart_fra_geometri(geometri_dict, risiko_dict, zoom=10):
+    """
+    Lag Folium-kartet frå ferdig reprojiserte geometriar (veg_id -> (lat, lon)-array),
+    t.d. frå hent_kartgeometri. Her blir det berre slått opp og farga, ikkje parsa.
+    """
 
     # Finn min/max risiko for fargeskala
     risikoar = [v for v in risiko_dict.values() if v is not None]
@@ -313,19 +468,12 @@ def lag_felles_kart(wkt_dict, risiko_dict, src_epsg=32633):
     m = None
     alle_punkt = []
 
-    for veg_id, wkt in wkt_dict.items():
-        if not wkt:
+    for veg_id, punkt in geometri_dict.items():
+        if punkt is None or len(punkt) == 0:
             continue
 
-        # Parse og transformer geometri
-        pts_xyz = parse_linestring_wkt(wkt)
-        lonlat = [transformer.transform(x, y) for (x, y, _) in pts_xyz]
-        latlon = [(lat, lon) for (lon, lat) in lonlat]
-
-        if not latlon:
-            continue
-
-        alle_punkt.extend(latlon)
+        latlon = [tuple(p) for p in np.asarray(punkt, dtype=float).tolist()]
+        alle_punkt.append(punkt)
 
         risiko = risiko_dict.get(veg_id)
         color = cmap(risiko) if risiko is not None else "gray"
@@ -333,7 +481,7 @@ def lag_felles_kart(wkt_dict, risiko_dict, src_epsg=32633):
         if m is None:
             m = folium.Map(
                 location=latlon[len(latlon) // 2],
-                zoom_start=10,
+                zoom_start=zoom,
                 tiles="OpenStreetMap"
             )
 
@@ -346,19 +494,186 @@ def lag_felles_kart(wkt_dict, risiko_dict, src_epsg=32633):
         ).add_to(m)
 
     if m and alle_punkt:
-        m.fit_bounds(alle_punkt)
+        alle = np.vstack(alle_punkt).astype(float)
+        m.fit_bounds([alle.min(axis=0).tolist(), alle.max(axis=0).tolist()])
         cmap.add_to(m)
 
     return m
 
-async def hent_alle_wkt(veg_ids):
-    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+# --------------------------------------------------
+# Ferdig forenkla og reprojiserte geometriflisar
+# --------------------------------------------------
+
+# Lagast av lag_geometriflisar.py, éi forenkling per zoomnivå
+GEOMETRIFLISAR = "data/veggeometri_flisar.npz"
 
-    async with httpx.AsyncClient() as client:
-        tasks = [
-            hent_wkt_for_objekt(client, str(vid), sem)
-            for vid in veg_ids
-        ]
-        wkts = await asyncio.gather(*tasks)
+# Douglas-Peucker-toleranse i meter per zoomnivå (om lag 1 pikselstorleik på 63°N)
+ZOOM_TOLERANSE = {8: 250.0, 10: 70.0, 12: 17.0, 14: 4.0}
+KART_ZOOM = 10
 
-    return dict(zip(veg_ids, wkts))
+_geometriflisar: Dict[str, tuple] = {}
+
+def forenkle_linje(xy, toleranse):
+    """
+    Douglas-Peucker-forenkling av ei linje (array med form (n, 2) i meter).
+    Endepunkta blir alltid behaldne.
+    """
+    n = len(xy)
+    if n <= 2 or toleranse <= 0:
+        return xy
+
+    behald = np.zeros(n, dtype=bool)
+    behald[0] = behald[-1] = True
+    stabel = [(0, n - 1)]
+    while stabel:
+        a, b = stabel.pop()
+        if b <= a + 1:
+            continue
+        s, e = xy[a], xy[b]
+        p = xy[a + 1:b]
+        d = e - s
+        lengd = np.hypot(d[0], d[1])
+        if lengd == 0:
+            avstand = np.hypot(p[:, 0] - s[0], p[:, 1] - s[1])
+        else:
+            avstand = np.abs(d[0] * (p[:, 1] - s[1]) - d[1] * (p[:, 0] - s[0])) / lengd
+        i = int(np.argmax(avstand))
+        if avstand[i] > toleranse:
+            k = a + 1 + i
+            behald[k] = True
+            stabel.append((a, k))
+            stabel.append((k, b))
+
+    return xy[behald]
+
+def lag_geometriflisar(wkt_dict, sti=GEOMETRIFLISAR, src_epsg=32633, zoom_toleranse=None):
+    """
+    Parse, forenkle (per zoomnivå) og reprojiser alle geometriar éin gong,
+    og lagre som kompakte NumPy-array i ei .npz-fil.
+
+    For kvart zoomnivå z: latlon_z (float32, (N, 2)) og start_z (offset per id).
+    """
+    zoom_toleranse = zoom_toleranse or ZOOM_TOLERANSE
+    if src_epsg not in _transformarar:
+        _transformarar[src_epsg] = Transformer.from_crs(src_epsg, 4326, always_xy=True)
+    transformer = _transformarar[src_epsg]
+
+    ids = []
+    linjer = []
+    for veg_id, wkt in wkt_dict.items():
+        nøkkel = nvdb_bulk.normaliser_id(veg_id)
+        if not wkt or not nøkkel:
+            continue
+        pts_xyz = parse_linestring_wkt(wkt)
+        if not pts_xyz:
+            continue
+        ids.append(int(nøkkel))
+        linjer.append(np.array([(x, y) for (x, y, _) in pts_xyz], dtype=float))
+
+    data = {
+        "ids": np.array(ids, dtype=np.int64),
+        "zoom": np.array(sorted(zoom_toleranse), dtype=np.int64),
+    }
+    for zoom, toleranse in zoom_toleranse.items():
+        forenkla = [forenkle_linje(xy, toleranse) for xy in linjer]
+        start = np.concatenate([[0], np.cumsum([len(xy) for xy in forenkla])]).astype(np.int64)
+        alle = np.vstack(forenkla) if forenkla else np.empty((0, 2))
+        # Alle punkt på eitt zoomnivå i eitt transform-kall
+        lon, lat = transformer.transform(alle[:, 0], alle[:, 1])
+        data[f"latlon_{zoom}"] = np.column_stack([lat, lon]).astype(np.float32)
+        data[f"start_{zoom}"] = start
+
+    np.savez_compressed(sti, **data)
+    return len(ids)
+
+def last_geometriflisar(sti=GEOMETRIFLISAR):
+    """
+    Les geometriflisane (caches per prosess, lesast på nytt om fila endrar seg).
+    Returnerer None dersom fila ikkje finst.
+    """
+    if not os.path.exists(sti):
+        return None
+    endra = os.path.getmtime(sti)
+    if sti in _geometriflisar and _geometriflisar[sti][0] == endra:
+        return _geometriflisar[sti][1]
+
+    with np.load(sti) as npz:
+        flisar = {k: npz[k] for k in npz.files}
+    flisar["indeks"] = {str(i): n for n, i in enumerate(flisar["ids"].tolist())}
+    _geometriflisar[sti] = (endra, flisar)
+    return flisar
+
+def flis_latlon(flisar, veg_id, zoom=KART_ZOOM):
+    """(lat, lon)-array for veg_id på næraste lagra zoomnivå, None om id-en manglar."""
+    n = flisar["indeks"].get(nvdb_bulk.normaliser_id(veg_id))
+    if n is None:
+        return None
+    z = min(flisar["zoom"].tolist(), key=lambda k: abs(k - zoom))
+    start = flisar[f"start_{z}"]
+    return flisar[f"latlon_{z}"][start[n]:start[n + 1]]
+
+async def hent_kartgeometri(veg_ids, zoom=KART_ZOOM):
+    """
+    Geometri for kartet: veg_id -> (lat, lon)-array.
+    Ferdige geometriflisar først; berre id-ar som manglar der går via
+    geometrilageret / NVDB (hent_alle_wkt).
+    """
+    flisar = last_geometriflisar()
+    ut = {}
+    manglar = []
+    for vid in veg_ids:
+        punkt = flis_latlon(flisar, vid, zoom) if flisar else None
+        if punkt is None:
+            manglar.append(vid)
+        else:
+            ut[vid] = punkt
+
+    if manglar:
+        wkt_dict = await hent_alle_wkt(manglar)
+        for vid, wkt in wkt_dict.items():
+            if not wkt:
+                ut[vid] = np.empty((0, 2))
+                continue
+            if str(vid) not in latlon_cache:
+                latlon_cache[str(vid)] = wkt_til_latlon(wkt)
+            ut[vid] = latlon_cache[str(vid)]
+
+    return ut
+
+async def hent_alle_wkt(veg_ids):
+    # Geometrilageret på disk først: varme kart treng ingen nettverkskall
+    lagra = geometri_lager.hent_geometriar(str(vid) for vid in veg_ids)
+    for vid, (wkt, latlon) in lagra.items():
+        wkt_cache[vid] = wkt
+        latlon_cache[vid] = latlon
+
+    manglar = [vid for vid in veg_ids if str(vid) not in lagra]
+    if manglar:
+        async with nvdb_klient.NvdbKlient() as klient:
+            # Hent alle geometriane i nokre få bulk-kall (ids=-filter);
+            # enkeltkall under blir berre gjort for id-ar som framleis manglar
+            await nvdb_bulk.hent_vegobjekter_bulk(VEGOBJEKT_TYPE_ID, manglar, klient=klient)
+            for vid in manglar:
+                nøkkel = nvdb_bulk.normaliser_id(vid)
+                if nøkkel in nvdb_bulk.wkt_cache:
+                    wkt_cache[str(vid)] = nvdb_bulk.wkt_cache[nøkkel]
+
+            tasks = [
+                hent_wkt_for_objekt(klient, str(vid))
+                for vid in manglar
+            ]
+            wkts = await asyncio.gather(*tasks)
+
+        # Parse og reprojiser nye geometriar éin gong, og lagre dei på disk
+        nye = []
+        for vid, wkt in zip(manglar, wkts):
+            if not wkt:
+                continue
+            latlon = wkt_til_latlon(wkt, src_epsg)
+            latlon_cache[str(vid)] = latlon
+            obj = nvdb_bulk.objekt_cache.get(nvdb_bulk.normaliser_id(vid)) or {}
+            versjon = (obj.get("metadata") or {}).get("versjon")
+            nye.append((str(vid), versjon, wkt, latlon))
+        geometri_lager.lagre_geometriar(nye)
+
+    return {vid: wkt_cache.get(str(vid), "") for vid in veg_ids}
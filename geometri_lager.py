@@ -0,0 +1,155 @@
+"""
+Vedvarande geometrilager for vegstrekningar (vegobjekt 540) på disk.
+
+wkt_cache i functions.py lever berre så lenge prosessen lever, så kvar
+omstart av appen (eller ny Streamlit-arbeidar) måtte hente dei same
+geometriane frå NVDB på nytt. Dette lageret er ei SQLite-fil som blir delt
+av alle sesjonar på same maskin:
+
+- nøkkel er (objekt_id, versjon) frå NVDB, og nyaste versjon blir brukt,
+- WKT blir lagra saman med ferdig parsa og reprojiserte (lat, lon)-punkt,
+- rader eldre enn TTL blir rekna som utgåtte og henta på nytt,
+- total storleik er avgrensa; minst nyleg brukte rader blir kasta først.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+GEOMETRI_DB = "data/geometri_cache.sqlite"
+TTL_SEKUND = 30 * 24 * 3600          # geometri endrar seg sjeldan
+MAKS_BYTE = 200 * 1024 * 1024        # øvre grense for wkt + koordinatar
+
+Geometri = Tuple[str, np.ndarray]    # (wkt, array med form (n, 2): lat, lon)
+
+
+def _kople(sti: str) -> sqlite3.Connection:
+    mappe = os.path.dirname(sti)
+    if mappe:
+        os.makedirs(mappe, exist_ok=True)
+    con = sqlite3.connect(sti, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS geometri (
+            objekt_id TEXT NOT NULL,
+            versjon   INTEGER NOT NULL,
+            wkt       TEXT NOT NULL,
+            latlon    BLOB NOT NULL,
+            storleik  INTEGER NOT NULL,
+            henta     REAL NOT NULL,
+            brukt     REAL NOT NULL,
+            PRIMARY KEY (objekt_id, versjon)
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS geometri_brukt ON geometri (brukt)")
+    return con
+
+
+def hent_geometriar(
+    objekt_ids: Iterable[str],
+    sti: str = GEOMETRI_DB,
+    ttl_sekund: float = TTL_SEKUND,
+) -> Dict[str, Geometri]:
+    """
+    Slå opp nyaste, ikkje utgåtte geometri for kvar objekt-id.
+    Id-ar som manglar eller er utgåtte er ikkje med i svaret.
+    """
+    ids = list(dict.fromkeys(str(i) for i in objekt_ids if i))
+    if not ids:
+        return {}
+
+    no = time.time()
+    ut: Dict[str, Geometri] = {}
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Geometrilager utilgjengeleg ({e}), hentar frå NVDB")
+        return {}
+    try:
+        for i in range(0, len(ids), 500):
+            bit = ids[i:i + 500]
+            plass = ",".join("?" * len(bit))
+            rader = con.execute(
+                f"""
+                SELECT objekt_id, wkt, latlon FROM geometri g
+                WHERE objekt_id IN ({plass})
+                  AND henta >= ?
+                  AND versjon = (SELECT MAX(versjon) FROM geometri WHERE objekt_id = g.objekt_id)
+                """,
+                (*bit, no - ttl_sekund),
+            ).fetchall()
+            for objekt_id, wkt, latlon in rader:
+                ut[objekt_id] = (wkt, np.frombuffer(latlon, dtype=np.float64).reshape(-1, 2))
+
+        if ut:
+            with con:
+                con.executemany(
+                    "UPDATE geometri SET brukt = ? WHERE objekt_id = ?",
+                    [(no, objekt_id) for objekt_id in ut],
+                )
+    finally:
+        con.close()
+    return ut
+
+
+def lagre_geometriar(
+    rader: Iterable[Tuple[str, Optional[int], str, np.ndarray]],
+    sti: str = GEOMETRI_DB,
+    maks_byte: int = MAKS_BYTE,
+) -> None:
+    """
+    Lagre (objekt_id, versjon, wkt, latlon) og kast eldre versjonar av same objekt.
+    Kastar minst nyleg brukte rader dersom lageret blir større enn maks_byte.
+    """
+    no = time.time()
+    verdiar: List[tuple] = []
+    for objekt_id, versjon, wkt, latlon in rader:
+        if not objekt_id or not wkt:
+            continue
+        blob = np.ascontiguousarray(latlon, dtype=np.float64).tobytes()
+        verdiar.append((str(objekt_id), int(versjon or 0), wkt, blob, len(wkt) + len(blob), no, no))
+    if not verdiar:
+        return
+
+    try:
+        con = _kople(sti)
+    except sqlite3.Error as e:
+        print(f"Geometrilager utilgjengeleg ({e}), lagrar ikkje")
+        return
+    try:
+        with con:
+            con.executemany(
+                "INSERT OR REPLACE INTO geometri VALUES (?, ?, ?, ?, ?, ?, ?)",
+                verdiar,
+            )
+            con.executemany(
+                "DELETE FROM geometri WHERE objekt_id = ? AND versjon < ?",
+                [(v[0], v[1]) for v in verdiar],
+            )
+            _kast_over_grense(con, maks_byte)
+    finally:
+        con.close()
+
+
+def _kast_over_grense(con: sqlite3.Connection, maks_byte: int) -> None:
+    total = con.execute("SELECT COALESCE(SUM(storleik), 0) FROM geometri").fetchone()[0]
+    if total <= maks_byte:
+        return
+    # Kast minst nyleg brukte til vi er under 90 % av grensa
+    mål = int(maks_byte * 0.9)
+    for objekt_id, versjon, storleik in con.execute(
+        "SELECT objekt_id, versjon, storleik FROM geometri ORDER BY brukt ASC"
+    ).fetchall():
+        if total <= mål:
+            break
+        con.execute("DELETE FROM geometri WHERE objekt_id = ? AND versjon = ?", (objekt_id, versjon))
+        total -= storleik
@@ -1,8 +1,12 @@
 import pandas as pd
 import functions as f
+from datauttrekk.fallvilt_lagring import les_fallvilt
 
 ###Last data
-df = pd.read_csv('data/Fallvilt_tidspunkter.csv', sep=";")
+df = les_fallvilt('data/Fallvilt_tidspunkter.csv', kolonner=[
+    "HendelsesDatoTid", "Art", "vegkategori", "ÅDT, total",
+    "Vegobjekt_540_id", "Vegobjekt_540_lengde", "UTM33 øst", "UTM33 nord",
+])
 
 ###Filtrer dynamisk 1 år tilbake
 df["HendelsesDatoTid"] = pd.to_datetime(df["HendelsesDatoTid"]).copy()
@@ -21,22 +25,15 @@ df=df[df['ÅDT, total']>100].copy()
 
 df["årstid"] = df["HendelsesDatoTid"].apply(f.maaned_til_arstid)
 
-df["lysforhold"] = df["HendelsesDatoTid"].apply(f.lyskategori_fra_tidspunkt)
-
-df["UTM33_øst_int"] = (
-    df["UTM33 øst"]
-    .astype(str)
-    .str.split(",", n=1)
-    .str[0].astype(int)
+# Solhøgde for kvar kollisjon sin eigen posisjon
+_, df["lysforhold"] = f.solhoyde_og_lyskategori_utm(
+    df["HendelsesDatoTid"], df["UTM33 øst"], df["UTM33 nord"]
 )
 
+df["UTM33_øst_int"] = f.heiltal_fra_tekst(df["UTM33 øst"])
 
-df["UTM_nord_int"] = (
-    df["UTM33 nord"]
-    .astype(str)
-    .str.split(",", n=1)
-    .str[0].astype(int)
-)
+
+df["UTM_nord_int"] = f.heiltal_fra_tekst(df["UTM33 nord"])
 
 ###TA bare med relevante kolonner videre
 df=df[['Vegobjekt_540_id', 'Art','ÅDT, total','Vegobjekt_540_lengde', 'UTM_nord_int', 'UTM33_øst_int', 'årstid','lysforhold']].copy()
@@ -0,0 +1,28 @@
+import os
+import asyncio
+import pandas as pd
+import functions as f
+
+###Forhandsberekning av kartgeometri: køyr etter lag_grunnfrekvens.py / lag_arstid_grunnfrekvens.py
+###Alle vegstrekningar (540) som kan visast på kartet blir parsa, forenkla per zoomnivå
+###og reprojiserte éin gong, så appen berre slår opp og fargar ferdige linjer.
+
+FREKVENS_CSV = [
+    "data/frekvens_script.csv",
+    "data/frekvens_årstid_script.csv",
+]
+
+###Finn alle aktuelle veg-id-ar
+veg_ids = set()
+for sti in FREKVENS_CSV:
+    if not os.path.exists(sti):
+        continue
+    ids = pd.read_csv(sti, usecols=["Vegobjekt_540_id"])["Vegobjekt_540_id"].dropna()
+    veg_ids.update(f.nvdb_bulk.normaliser_id(v) for v in ids)
+veg_ids.discard("")
+
+###Hent WKT (geometrilager først, så NVDB)
+wkt_dict = asyncio.run(f.hent_alle_wkt(sorted(veg_ids)))
+
+n = f.lag_geometriflisar(wkt_dict)
+print(f"🎈 Hurra! {n} vegstrekningar lagra i {f.GEOMETRIFLISAR} (zoom {sorted(f.ZOOM_TOLERANSE)})")
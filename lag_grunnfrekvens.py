@@ -1,40 +1,18 @@
+import os
+import sys
+import json
+import numpy as np
 import pandas as pd
 import functions as f
+from datauttrekk.fallvilt_lagring import les_fallvilt
 
-###Last data
-df = pd.read_csv('data/Fallvilt_tidspunkter.csv', sep=";")
-
-###Filtrer dynamisk 1 år tilbake
-df["HendelsesDatoTid"] = pd.to_datetime(df["HendelsesDatoTid"]).copy()
-slutt = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
-start = slutt - pd.DateOffset(years=1)
-
-df = df[
-    (df["HendelsesDatoTid"] >= start) &
-    (df["HendelsesDatoTid"] <= slutt)
-].copy()
-
-#Filtrer relevante veger og dyr
-df=df[df['Art'].isin(['Elg', 'Hjort', 'Rådyr'])].copy()  
-df=df[df['vegkategori'].isin(['E','F','K'])].copy()
-df=df[df['ÅDT, total']>100].copy()
-
-df["UTM33_øst_int"] = (
-    df["UTM33 øst"]
-    .astype(str)
-    .str.split(",", n=1)
-    .str[0].astype(int)
-)
-
-df["UTM_nord_int"] = (
-    df["UTM33 nord"]
-    .astype(str)
-    .str.split(",", n=1)
-    .str[0].astype(int)
-)
-
-###TA bare med relevante kolonner videre
-df=df[['Vegobjekt_540_id', 'Art','ÅDT, total','Vegobjekt_540_lengde', 'UTM_nord_int', 'UTM33_øst_int']].copy()
+INPUT_CSV = 'data/Fallvilt_tidspunkter.csv'
+OUTPUT_CSV = "data/frekvens_script.csv"
+
+# Tilstand for inkrementell modus (python lag_grunnfrekvens.py --inkrementell)
+TILSTAND_DIR = "data/grunnfrekvens_tilstand"
+
+NØKKEL = ["Vegobjekt_540_id", "Art"]
 
 kolonner = [
     "ÅDT, total", ##vi antar bare 1 verdi for hvert vegobjekt-id, men i fall det er ulikt tar vi gjennomsnitt
@@ -43,55 +21,330 @@ kolonner = [
     "UTM33_øst_int",##gjennomsnitt over posisjoner for kollision
 ]
 
-for col in kolonner:
-    df[f"{col}_avg"] = (
+
+def finn_vindauge():
+    ###Filtrer dynamisk 1 år tilbake
+    slutt = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    start = slutt - pd.DateOffset(years=1)
+    return start, slutt
+
+
+def filtrer_relevante(df):
+    #Filtrer relevante veger og dyr
+    df=df[df['Art'].isin(['Elg', 'Hjort', 'Rådyr'])].copy()
+    df=df[df['vegkategori'].isin(['E','F','K'])].copy()
+    df=df[df['ÅDT, total']>100].copy()
+    return df
+
+
+def ferdigstill(df):
+    """
+    Felles avslutning for full og inkrementell modus: terskel, frekvens,
+    årsrisiko og yrkessamanlikning. Skriv frekvens_script.csv.
+    """
+    ###For å lage en troverdig frekvens treng vi 3 eller fleire hendingar
+    df=df[df["antall_kollisjoner"] >=3].copy()
+
+    df["frekvens"] = (
+        df["antall_kollisjoner"]*100000 ####per 100 km per bil per år
+        /
+        (
+            df["ÅDT, total_avg"]
+            * 365
+            * df["Vegobjekt_540_lengde_avg"]
+        )
+    )
+
+    df["årsrisiko"] = df["frekvens"]*150  ###antatt 150000 km i gjennomsnitt for en bil
+
+
+    df=df[['Vegobjekt_540_id',
+           'Art',
+           'ÅDT, total_avg',
+           'Vegobjekt_540_lengde_avg',
+           'UTM_nord_int_avg',
+           'UTM33_øst_int_avg',
+           'antall_kollisjoner',
+           'frekvens', 'årsrisiko']].copy()
+
+    df=df.drop_duplicates()
+    df.dropna(inplace=True)
+
+
+    df["samanlikning_yrke"] = df["årsrisiko"].apply(
+        lambda x: f.map_arsrisiko_til_yrke(x)
+    )
+
+
+    df.to_csv(OUTPUT_CSV,encoding='utf-8', index=False)
+    print(f"🎈 Hurra! {len(df)} grunnfrekvensar lagra to .csv-file")
+
+
+def full_ombygging():
+    ###Last data
+    df = les_fallvilt(INPUT_CSV, kolonner=[
+        "HendelsesDatoTid", "Art", "vegkategori", "ÅDT, total",
+        "Vegobjekt_540_id", "Vegobjekt_540_lengde", "UTM33 øst", "UTM33 nord",
+    ])
+
+    df["HendelsesDatoTid"] = pd.to_datetime(df["HendelsesDatoTid"]).copy()
+    start, slutt = finn_vindauge()
+
+    df = df[
+        (df["HendelsesDatoTid"] >= start) &
+        (df["HendelsesDatoTid"] <= slutt)
+    ].copy()
+
+    df = filtrer_relevante(df)
+
+    df["UTM33_øst_int"] = f.heiltal_fra_tekst(df["UTM33 øst"])
+
+    df["UTM_nord_int"] = f.heiltal_fra_tekst(df["UTM33 nord"])
+
+    ###TA bare med relevante kolonner videre
+    df=df[['Vegobjekt_540_id', 'Art','ÅDT, total','Vegobjekt_540_lengde', 'UTM_nord_int', 'UTM33_øst_int']].copy()
+
+    for col in kolonner:
+        df[f"{col}_avg"] = (
+            df
+            .groupby(NØKKEL)[col]
+            .transform("mean")
+            .round(0)
+            .astype("Int64")
+        )
+
+    df["antall_kollisjoner"] = (
         df
-        .groupby(["Vegobjekt_540_id", "Art"])[col]
-        .transform("mean")
-        .round(0)
-        .astype("Int64")
+        .groupby(NØKKEL)
+        .transform("size")
     )
 
-df["antall_kollisjoner"] = (
-    df
-    .groupby(["Vegobjekt_540_id", "Art"])
-    .transform("size")
-)
+    ferdigstill(df)
+
+
+# --------------------------------------------------
+# Inkrementell modus
+# --------------------------------------------------
+#
+# Tilstanden held løpande summar per (Vegobjekt_540_id, Art) for kollisjonar
+# innanfor gjeldande vindauge (total.csv), pluss same summar per døgn
+# (dagleg.csv) slik at døgn som fell ut av vindauget kan trekkjast frå.
+# bidrag.csv held kva kvar Fallvilt-ID har lagt til i døgnbøttene. Ein
+# kollisjon som er endra (Art, tidspunkt, vegobjekt, ÅDT, ...) blir trekt frå
+# med det gamle bidraget og lagt til att med det nye; ein kollisjon som er
+# sletta frå registeret (eller ikkje lenger er relevant) blir trekt frå.
+
+SUM_KOLONNER = [f"sum_{col}" for col in kolonner] + [f"n_{col}" for col in kolonner]
+AGG_KOLONNER = ["antall_kollisjoner"] + SUM_KOLONNER
+BØTTE = ["dag", "midnatt"] + NØKKEL
+
 
+def _tilstand_fil(namn):
+    return os.path.join(TILSTAND_DIR, namn)
 
-###For å lage en troverdig frekvens treng vi 3 eller fleire hendingar
-df=df[df["antall_kollisjoner"] >=3].copy()
 
-df["frekvens"] = (
-    df["antall_kollisjoner"]*100000 ####per 100 km per bil per år
-    /
-    (
-        df["ÅDT, total_avg"]
-        * 365
-        * df["Vegobjekt_540_lengde_avg"]
+def last_tilstand():
+    """
+    Les tilstand frå TILSTAND_DIR. Tom tilstand dersom den ikkje finst, eller
+    dersom han er frå før bidrag.csv fanst (då blir alt bygd opp på nytt).
+    """
+    meta_fil = _tilstand_fil("meta.json")
+    if not os.path.exists(meta_fil) or not os.path.exists(_tilstand_fil("bidrag.csv")):
+        tom = pd.DataFrame(columns=NØKKEL + AGG_KOLONNER)
+        tom_dagleg = pd.DataFrame(columns=BØTTE + AGG_KOLONNER)
+        tom_bidrag = pd.DataFrame(columns=["Fallvilt-ID"] + BØTTE + AGG_KOLONNER)
+        return {"start": None, "slutt": None}, tom_dagleg, tom, tom_bidrag
+
+    with open(meta_fil, encoding="utf-8") as fil:
+        meta = json.load(fil)
+    meta = {k: (pd.Timestamp(v) if v else None) for k, v in meta.items()}
+
+    dagleg = pd.read_csv(_tilstand_fil("dagleg.csv"), encoding="utf-8", parse_dates=["dag"])
+    total = pd.read_csv(_tilstand_fil("total.csv"), encoding="utf-8")
+    bidrag = pd.read_csv(_tilstand_fil("bidrag.csv"), encoding="utf-8", parse_dates=["dag"])
+    return meta, dagleg, total, bidrag
+
+
+def lagre_tilstand(meta, dagleg, total, bidrag):
+    os.makedirs(TILSTAND_DIR, exist_ok=True)
+    dagleg.to_csv(_tilstand_fil("dagleg.csv"), encoding="utf-8", index=False)
+    total.to_csv(_tilstand_fil("total.csv"), encoding="utf-8", index=False)
+    bidrag.to_csv(_tilstand_fil("bidrag.csv"), encoding="utf-8", index=False)
+    # meta skrivast sist, så ein avbroten køyring ikkje ser ut som fullført
+    with open(_tilstand_fil("meta.json"), "w", encoding="utf-8") as fil:
+        json.dump({k: (v.isoformat() if v is not None else None) for k, v in meta.items()}, fil, indent=4)
+
+
+def i_vindauge(dagleg, start, slutt):
+    """
+    Maske for døgnbøtter innanfor [start, slutt].
+    start/slutt er midnatt, så berre kollisjonar nøyaktig kl. 00:00 på sluttdagen er med.
+    """
+    if start is None or slutt is None:
+        return np.zeros(len(dagleg), dtype=bool)
+    dag = dagleg["dag"]
+    return (
+        (dag >= start)
+        & ((dag < slutt) | ((dag == slutt) & dagleg["midnatt"].astype(bool)))
+    ).to_numpy()
+
+
+def lag_bidrag(df):
+    """Bidraget frå kvar kollisjon til døgnbøtta si (éi rad per Fallvilt-ID)."""
+    df = df.dropna(subset=NØKKEL + ["HendelsesDatoTid"]).copy()
+    df["dag"] = df["HendelsesDatoTid"].dt.normalize()
+    df["midnatt"] = df["HendelsesDatoTid"] == df["dag"]
+
+    df["UTM33_øst_int"] = f.heiltal_fra_tekst(df["UTM33 øst"])
+    df["UTM_nord_int"] = f.heiltal_fra_tekst(df["UTM33 nord"])
+
+    for col in kolonner:
+        df[f"sum_{col}"] = df[col]
+        df[f"n_{col}"] = df[col].notna().astype(int)
+    df["antall_kollisjoner"] = 1
+
+    return _kanonisk(df[["Fallvilt-ID"] + BØTTE + AGG_KOLONNER].drop_duplicates("Fallvilt-ID", keep="last"))
+
+
+def _kanonisk(bidrag):
+    """Faste typar, så bidrag frå fila og frå ny lesing kan samanliknast."""
+    return bidrag.astype({
+        "Fallvilt-ID": "int64",
+        "dag": "datetime64[ns]",
+        "midnatt": bool,
+        "Vegobjekt_540_id": "int64",
+        "Art": str,
+        **{c: "float64" for c in AGG_KOLONNER},
+    }).reset_index(drop=True)
+
+
+def _i_bøtter(df):
+    return df.groupby(BØTTE, as_index=False, observed=True)[AGG_KOLONNER].sum(min_count=0)
+
+
+def _summer(df):
+    return df.groupby(NØKKEL, as_index=False, observed=True)[AGG_KOLONNER].sum()
+
+
+def endra_bidrag(gamle, nye):
+    """
+    Endringa i døgnbøttene: nye og endra kollisjonar med det nye bidraget,
+    minus endra og sletta kollisjonar med det gamle. Returnerer (delta, tal endra id).
+    """
+    gamle, nye = _kanonisk(gamle), _kanonisk(nye)
+    hash_gamal = pd.Series(pd.util.hash_pandas_object(gamle.drop(columns="Fallvilt-ID"), index=False).to_numpy(),
+                           index=gamle["Fallvilt-ID"])
+    hash_ny = pd.Series(pd.util.hash_pandas_object(nye.drop(columns="Fallvilt-ID"), index=False).to_numpy(),
+                        index=nye["Fallvilt-ID"])
+    alle = hash_gamal.index.union(hash_ny.index)
+    endra = alle[hash_gamal.reindex(alle).to_numpy() != hash_ny.reindex(alle).to_numpy()]
+
+    pluss = nye[nye["Fallvilt-ID"].isin(endra)]
+    minus = gamle[gamle["Fallvilt-ID"].isin(endra)].copy()
+    minus[AGG_KOLONNER] = -minus[AGG_KOLONNER]
+    delar = [d for d in (pluss, minus) if not d.empty]
+    if not delar:
+        return pd.DataFrame(columns=BØTTE + AGG_KOLONNER), 0
+    return _i_bøtter(pd.concat(delar, ignore_index=True)), len(endra)
+
+
+def _som_id(verdiar):
+    return pd.to_numeric(verdiar, errors="coerce").astype("Int64")
+
+
+def les_endra_id(sti):
+    """Fallvilt-ID frå ei CSV-fil med kolonnen Fallvilt-ID (t.d. returverdien frå get_fallvilt.delta_synk)."""
+    return pd.read_csv(sti, sep=";", usecols=["Fallvilt-ID"], dtype=str, keep_default_na=False)["Fallvilt-ID"].tolist()
+
+
+def inkrementell_ombygging(endra_id=None):
+    """
+    Oppdater frekvensane frå lagra tilstand.
+
+    Utan endra_id blir heile historikken i INPUT_CSV lesen, og bidraget frå
+    kvar kollisjon rekna og hasha på nytt for å finne endringar. Arbeidet
+    veks då med historikken, ikkje med endringa, men fangar òg endringar som
+    kjem frå berikingsstega (ÅDT, vegobjekt) utan at registeret er endra.
+
+    Med endra_id (Fallvilt-ID som er nye eller endra, t.d. frå
+    get_fallvilt.delta_synk) blir berre desse radene rekna og hasha på nytt.
+    Sletta kollisjonar blir funne frå Fallvilt-ID-kolonnen åleine. Fila blir
+    framleis lesen (dei ni kolonnane under), så lesinga veks med historikken.
+    Endringar på andre rader blir ikkje fanga; køyr utan endra_id jamleg.
+    """
+    meta, dagleg, total, bidrag = last_tilstand()
+    start, slutt = finn_vindauge()
+    # Døgn før vindauget kan aldri kome inn att når vindauget flyttar seg framover
+    bidrag = bidrag[pd.to_datetime(bidrag["dag"]) >= start]
+
+    ###Last berre kolonnane vi treng; bidraga blir samanlikna med førre køyring
+    df = les_fallvilt(
+        INPUT_CSV,
+        kolonner=["Fallvilt-ID", "HendelsesDatoTid", "Art", "vegkategori",
+                 "ÅDT, total", "Vegobjekt_540_id", "Vegobjekt_540_lengde",
+                 "UTM33 øst", "UTM33 nord"],
     )
-)
+    urørt = bidrag.iloc[:0]
+    # Utan tidlegare tilstand må alt byggjast, uansett endra_id
+    if endra_id is not None and meta["start"] is not None:
+        endra_id = set(_som_id(pd.Series(list(endra_id), dtype=object)).dropna())
+        ider = _som_id(df["Fallvilt-ID"])
+        sletta = set(bidrag["Fallvilt-ID"]) - set(ider.dropna())
+        # Berre bidraga for endra og sletta id blir samanlikna; resten står urørt
+        df = df[ider.isin(endra_id)].copy()
+        berørt = bidrag["Fallvilt-ID"].isin(endra_id | sletta)
+        urørt, bidrag = bidrag[~berørt], bidrag[berørt]
+
+    df["HendelsesDatoTid"] = pd.to_datetime(df["HendelsesDatoTid"])
+    df = filtrer_relevante(df)
+    nye_bidrag = lag_bidrag(df)
+    nye_bidrag = nye_bidrag[nye_bidrag["dag"] >= start]
+
+    # Trekk frå døgn som har falle ut, legg til døgn som har kome inn i vindauget
+    var_med = i_vindauge(dagleg, meta["start"], meta["slutt"])
+    er_med = i_vindauge(dagleg, start, slutt)
+    ut = dagleg[var_med & ~er_med].copy()
+    ut[AGG_KOLONNER] = -ut[AGG_KOLONNER]
+    inn = dagleg[~var_med & er_med]
 
-df["årsrisiko"] = df["frekvens"]*150  ###antatt 150000 km i gjennomsnitt for en bil
+    # Nye, endra og sletta kollisjonar (innanfor vindauget for total)
+    delta, n_endra = endra_bidrag(bidrag, nye_bidrag)
+    delta_inn = delta[i_vindauge(delta, start, slutt)]
 
+    endringar = [d for d in (total, ut, inn, delta_inn) if not d.empty]
+    if endringar:
+        total = _summer(pd.concat(endringar, ignore_index=True))
+    total = total[total["antall_kollisjoner"] > 0]
 
-df=df[['Vegobjekt_540_id', 
-       'Art', 
-       'ÅDT, total_avg',
-       'Vegobjekt_540_lengde_avg', 
-       'UTM_nord_int_avg', 
-       'UTM33_øst_int_avg', 
-       'antall_kollisjoner', 
-       'frekvens', 'årsrisiko']].copy()
+    dagleg = dagleg[dagleg["dag"] >= start]
+    dagleg = pd.concat([d for d in (dagleg, delta) if not d.empty], ignore_index=True)
+    dagleg = _i_bøtter(dagleg)
+    dagleg = dagleg[dagleg["antall_kollisjoner"] > 0]
 
-df=df.drop_duplicates()
-df.dropna(inplace=True)
+    if not urørt.empty:
+        nye_bidrag = pd.concat([d for d in (_kanonisk(urørt), nye_bidrag) if not d.empty], ignore_index=True)
+    lagre_tilstand({"start": start, "slutt": slutt}, dagleg, total, nye_bidrag)
+    print(f"Inkrementell oppdatering: {n_endra} nye, endra eller sletta kollisjonar, "
+          f"{len(ut)} døgnbøtter ut og {len(inn)} inn av vindauget")
 
+    ut_df = total.copy()
+    for col in kolonner:
+        ut_df[f"{col}_avg"] = (
+            (ut_df[f"sum_{col}"] / ut_df[f"n_{col}"].replace(0, np.nan))
+            .round(0)
+            .astype("Int64")
+        )
+    ut_df["antall_kollisjoner"] = ut_df["antall_kollisjoner"].astype(int)
 
-df["samanlikning_yrke"] = df["årsrisiko"].apply(
-    lambda x: f.map_arsrisiko_til_yrke(x)
-)
+    ferdigstill(ut_df)
 
 
-df.to_csv("data/frekvens_script.csv",encoding='utf-8', index=False)
-print(f"🎈 Hurra! {len(df)} grunnfrekvensar lagra to .csv-file")
\ No newline at end of file
+if __name__ == "__main__":
+    # --inkrementell [--endra FIL]: FIL er ei CSV med Fallvilt-ID for nye og endra kollisjonar
+    if "--inkrementell" in sys.argv[1:]:
+        endra_id = None
+        if "--endra" in sys.argv[1:]:
+            endra_id = les_endra_id(sys.argv[sys.argv.index("--endra") + 1])
+        inkrementell_ombygging(endra_id)
+    else:
+        full_ombygging()
@@ -1,17 +1,20 @@
 import pandas as pd
 import numpy as np
-import statsmodels.formula.api as smf
-import statsmodels.api as sm
 from astral import LocationInfo
 from astral.sun import sun
 import pandas as pd
 from astral.sun import elevation
 from datetime import timedelta
 import functions as f
+from datauttrekk.fallvilt_lagring import les_fallvilt
 import json 
+import nb_modell
 
 
-df = pd.read_csv('data/Fallvilt_tidspunkter.csv', sep=";")
+df = les_fallvilt('data/Fallvilt_tidspunkter.csv', kolonner=[
+    "HendelsesDatoTid", "UkjentTidspunkt", "Art", "vegkategori", "ÅDT, total",
+    "Vegobjekt_105_id", "Vegobjekt_540_lengde", "UTM33 øst", "UTM33 nord",
+])
 
 df["HendelsesDatoTid"] = pd.to_datetime(df["HendelsesDatoTid"])
 
@@ -34,14 +37,18 @@ df=df[df['vegkategori'].isin(['E','F','K'])].copy()
 #df=df[df['ÅDT, total']>100].copy()
 
 
-df= df[df['UkjentTidspunkt']==False].copy()
+# UkjentTidspunkt er nullable boolean; rader utan verdi blir rekna som ukjende
+df= df[df['UkjentTidspunkt'].eq(False).fillna(False)].copy()
 
 
 # Representativ plassering for Trøndelag
-df["årstid"] = df["HendelsesDatoTid"].dt.month.apply(f.maaned_til_arstid)
+df["årstid"] = df["HendelsesDatoTid"].apply(f.maaned_til_arstid)
 df["årstid"] = df["årstid"].astype("category").copy()
 
-df["lyskategori"] = df["HendelsesDatoTid"].apply(f.lyskategori_fra_tidspunkt)
+# Solhøgde for kvar kollisjon sin eigen posisjon
+_, df["lyskategori"] = f.solhoyde_og_lyskategori_utm(
+    df["HendelsesDatoTid"], df["UTM33 øst"], df["UTM33 nord"]
+)
 df["lyskategori"] = df["lyskategori"].astype("category")
 
 
@@ -71,15 +78,17 @@ df_agg = (
 df_agg.drop_duplicates(inplace=True)
 
 
-model_nb = smf.glm(
-    formula="antall_kollisjoner ~ C(lyskategori)+C(årstid)",
-    data=df_agg,
-    family=sm.families.NegativeBinomial(alpha=0.1),
-    #family=sm.families.Poisson(),
-    offset=df_agg["log_eksponering"]
-).fit()
+# NB2 med alpha estimert frå data (var fast 0.1), startar frå koeffisientane til førre køyring
+model_nb = nb_modell.tilpass_kategorisk(
+    df_agg,
+    respons="antall_kollisjoner",
+    faktorar=["lyskategori", "årstid"],
+    offset="log_eksponering",
+    start=nb_modell.les_start(),
+)
+nb_modell.skriv_start(model_nb)
 
-summary_text = model_nb.summary().as_text()
+summary_text = model_nb.oppsummering()
 
 
 with open("log.txt", "a") as file:
@@ -0,0 +1,261 @@
+"""
+Negativ binomial-regresjon (NB2) for justeringsfaktorane i lag_justeringsfaktorer.py.
+
+Skriptet brukte statsmodels sin formel-GLM med NegativeBinomial(alpha=0.1):
+designmatrisa blei bygd på nytt gjennom patsy kvar køyring, og
+dispersjonen alpha var gjetta, ikkje estimert. Her:
+
+- designmatrise() byggjer matrisa direkte frå kategorikodane (konstantledd +
+  éin dummy per kategori utanom den første, same namn som statsmodels:
+  "C(årstid)[T.sommar]"), så lag_arstidsjustering/lag_lysjustering i
+  functions.py kan lese resultatet uendra,
+- tilpass_nb2() tilpassar NB2 (Var = mu + alpha*mu², log-link) med IRLS for
+  koeffisientane og Newton-steg på log(1/alpha) for dispersjonen, vekselvis
+  til begge står still (felles sannsyn-maksimum, same som profilsannsynet),
+- koeffisientane og alpha frå førre køyring (START_FIL) kan brukast som
+  startpunkt, så ei nattleg omtilpassing på nesten same data konvergerer på
+  nokre få iterasjonar.
+
+Sannsynet blir rekna utan gammafunksjonar: for heiltals-y er
+lgamma(y + theta) - lgamma(theta) = sum_{k<y} log(theta + k), og summen over
+alle rader blir ein sum over k vekta med talet på rader der y > k.
+"""
+
+import json
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------
+# Konfigurasjon
+# ---------------------------
+
+START_FIL = "nb_start.json"   # koeffisientar og alpha frå førre tilpassing
+MAKS_ITER = 100               # ytre iterasjonar (IRLS-steg + alpha-steg)
+TOLERANSE = 1e-8
+ALFA_MIN = 1e-8               # alpha mot 0 er Poisson-grensa
+ALFA_MAKS = 1e4
+
+
+# ---------------------------
+# Designmatrise
+# ---------------------------
+
+
+def designmatrise(df: pd.DataFrame, faktorar: Sequence[str]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    (X, namn, gyldig) frå kategorikolonnane `faktorar`. Første kategori (i
+    kategorirekkjefølgja, alfabetisk for astype("category")) er referanse.
+    Rader med manglande kategori er ikkje med (gyldig = False), som i patsy.
+    """
+    kodar = []
+    namn = ["Intercept"]
+    for faktor in faktorar:
+        kat = df[faktor].astype("category").cat.remove_unused_categories()
+        kodar.append((kat.cat.codes.to_numpy(), len(kat.cat.categories)))
+        namn += [f"C({faktor})[T.{k}]" for k in kat.cat.categories[1:]]
+
+    gyldig = np.logical_and.reduce([k >= 0 for k, _ in kodar]) if kodar else np.ones(len(df), dtype=bool)
+    X = np.zeros((int(gyldig.sum()), len(namn)))
+    X[:, 0] = 1.0
+    rad = np.arange(len(X))
+    kolonne = 1
+    for k, n_kat in kodar:
+        k = k[gyldig]
+        ikkje_ref = k > 0
+        X[rad[ikkje_ref], kolonne + k[ikkje_ref] - 1] = 1.0
+        kolonne += n_kat - 1
+    return X, namn, gyldig
+
+
+# ---------------------------
+# Sannsyn
+# ---------------------------
+
+
+def _over(y: np.ndarray) -> np.ndarray:
+    """n[k] = talet på rader med y > k, k = 0 .. max(y) - 1."""
+    y = y.astype(np.int64)
+    if len(y) == 0 or y.max() <= 0:
+        return np.zeros(0)
+    frekvens = np.bincount(y)
+    return frekvens[::-1].cumsum()[::-1][1:].astype(float)
+
+
+def _loglik(y: np.ndarray, mu: np.ndarray, theta: float, over: np.ndarray) -> float:
+    """NB2-log-sannsyn med theta = 1/alpha, stabil også når theta er stor."""
+    k = np.arange(len(over))
+    return float(
+        over @ (np.log1p(k / theta) - np.log1p(k))
+        - np.sum((theta + y) * np.log1p(mu / theta))
+        + np.sum(y * np.log(mu))
+    )
+
+
+def _theta_steg(y: np.ndarray, mu: np.ndarray, theta: float, over: np.ndarray) -> float:
+    """Eitt Newton-steg for theta (i log-skala, med halvering), koeffisientane faste."""
+    k = np.arange(len(over))
+    d1 = over @ (1 / (theta + k)) + np.sum((mu - y) / (theta + mu) - np.log1p(mu / theta))
+    d2 = (-over @ (1 / (theta + k) ** 2)
+          + np.sum(mu / (theta * (theta + mu)) - (mu - y) / (theta + mu) ** 2))
+    g = theta * d1
+    h = theta * theta * d2 + g
+    steg = -g / h if h < 0 else math.copysign(1.0, g)
+
+    lo, hi = math.log(1 / ALFA_MAKS), math.log(1 / ALFA_MIN)
+    før = _loglik(y, mu, theta, over)
+    t = math.log(theta)
+    for _ in range(30):
+        ny = math.exp(min(max(t + steg, lo), hi))
+        if _loglik(y, mu, ny, over) >= før:
+            return ny
+        steg /= 2
+    return theta
+
+
+# ---------------------------
+# Tilpassing
+# ---------------------------
+
+
+class NbResultat:
+    """
+    Resultat frå tilpass_nb2. `params` er ein pd.Series med same namn som
+    statsmodels, så lag_arstidsjustering/lag_lysjustering kan bruke han direkte.
+    """
+
+    def __init__(self, params: pd.Series, bse: pd.Series, alpha: float, llf: float,
+                 nobs: int, iterasjonar: int, alpha_estimert: bool):
+        self.params = params
+        self.bse = bse
+        self.alpha = alpha
+        self.llf = llf
+        self.nobs = nobs
+        self.iterasjonar = iterasjonar
+        self.alpha_estimert = alpha_estimert
+
+    def oppsummering(self) -> str:
+        """Koeffisienttabell i tekst (for log.txt)."""
+        z = self.params / self.bse
+        p = z.abs().map(lambda v: math.erfc(v / math.sqrt(2)))
+        linjer = [
+            "NB2-regresjon (nb_modell)",
+            f"Observasjonar: {self.nobs}   log-sannsyn: {self.llf:.3f}   iterasjonar: {self.iterasjonar}",
+            f"alpha: {self.alpha:.6g} ({'estimert' if self.alpha_estimert else 'fast'})",
+            f"{'':40s}{'coef':>10s}{'std err':>10s}{'z':>9s}{'P>|z|':>9s}",
+        ]
+        for namn in self.params.index:
+            linjer.append(
+                f"{namn:40s}{self.params[namn]:10.4f}{self.bse[namn]:10.4f}{z[namn]:9.3f}{p[namn]:9.3f}"
+            )
+        return "\n".join(linjer)
+
+    def til_start(self) -> Dict[str, object]:
+        return {"params": {k: float(v) for k, v in self.params.items()}, "alpha": float(self.alpha)}
+
+
+def tilpass_nb2(
+    y: np.ndarray,
+    X: np.ndarray,
+    namn: List[str],
+    offset: Optional[np.ndarray] = None,
+    alfa: Optional[float] = None,
+    start: Optional[Dict[str, object]] = None,
+    maks_iter: int = MAKS_ITER,
+) -> NbResultat:
+    """
+    NB2 med log-link. Med `alfa` er dispersjonen fast (som
+    sm.families.NegativeBinomial(alpha=alfa)); elles blir han estimert.
+    `start` ({"params": {namn: verdi}, "alpha": a}, t.d. frå les_start) gir
+    startverdiar; namn som manglar der startar på 0.
+    """
+    y = np.asarray(y, dtype=float)
+    offset = np.zeros(len(y)) if offset is None else np.asarray(offset, dtype=float)
+    over = _over(y)
+
+    params0 = (start or {}).get("params", {})
+    if params0:
+        beta = np.array([float(params0.get(n, 0.0)) for n in namn])
+    else:
+        # Konstantledd = log(rate) utan forklaringsvariablar
+        beta = np.zeros(len(namn))
+        beta[0] = math.log(max(y.sum(), 0.5) / np.exp(offset).sum())
+    a = alfa if alfa is not None else float((start or {}).get("alpha") or 0.1)
+    theta = 1 / min(max(a, ALFA_MIN), ALFA_MAKS)
+
+    iterasjonar = 0
+    for iterasjonar in range(1, maks_iter + 1):
+        # IRLS-steg for koeffisientane
+        eta = X @ beta + offset
+        mu = np.exp(eta)
+        w = mu / (1 + mu / theta)
+        z = eta - offset + (y - mu) / mu
+        XtW = X.T * w
+        ny_beta = np.linalg.solve(XtW @ X, XtW @ z)
+        endring = np.max(np.abs(ny_beta - beta), initial=0.0)
+        beta = ny_beta
+
+        # Newton-steg for dispersjonen
+        ny_theta = theta
+        if alfa is None:
+            ny_theta = _theta_steg(y, np.exp(X @ beta + offset), theta, over)
+        endring = max(endring, abs(math.log(ny_theta / theta)))
+        theta = ny_theta
+        if endring < TOLERANSE:
+            break
+
+    mu = np.exp(X @ beta + offset)
+    w = mu / (1 + mu / theta)
+    kov = np.linalg.inv((X.T * w) @ X)
+    return NbResultat(
+        params=pd.Series(beta, index=namn),
+        bse=pd.Series(np.sqrt(np.diag(kov)), index=namn),
+        alpha=1 / theta,
+        llf=_loglik(y, mu, theta, over),
+        nobs=len(y),
+        iterasjonar=iterasjonar,
+        alpha_estimert=alfa is None,
+    )
+
+
+def tilpass_kategorisk(
+    df: pd.DataFrame,
+    respons: str,
+    faktorar: Sequence[str],
+    offset: Optional[str] = None,
+    alfa: Optional[float] = None,
+    start: Optional[Dict[str, object]] = None,
+) -> NbResultat:
+    """
+    `respons ~ C(f1) + C(f2) + ...` med `offset`-kolonna som offset. Rader med
+    manglande kategori eller ikkje-endeleg respons/offset blir hoppa over.
+    """
+    X, namn, gyldig = designmatrise(df, faktorar)
+    y = df[respons].to_numpy(dtype=float)[gyldig]
+    off = df[offset].to_numpy(dtype=float)[gyldig] if offset else np.zeros(len(y))
+    ok = np.isfinite(y) & np.isfinite(off)
+    return tilpass_nb2(y[ok], X[ok], namn, off[ok], alfa=alfa, start=start)
+
+
+# ---------------------------
+# Varm start
+# ---------------------------
+
+
+def les_start(sti: str = START_FIL) -> Optional[Dict[str, object]]:
+    """Koeffisientar og alpha frå førre køyring, eller None."""
+    try:
+        with open(sti, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def skriv_start(resultat: NbResultat, sti: str = START_FIL) -> None:
+    tmp = sti + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(resultat.til_start(), f, ensure_ascii=False, indent=4)
+    os.replace(tmp, sti)
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import asyncio
 
-from functions import hent_alle_wkt, lag_felles_kart
+from functions import hent_kartgeometri, lag_kart_fra_geometri
 
 # --------------------------------------------------
 # Sideoppsett
@@ -122,10 +122,10 @@ if not veg_ids:
     st.stop()
 
 with st.spinner("Hentar veggeometri frå NVDB …"):
-    wkt_dict = asyncio.run(hent_alle_wkt(veg_ids))
+    geometri_dict = asyncio.run(hent_kartgeometri(veg_ids))
 
 # Dersom ingen geometriar
-if not any(wkt_dict.values()):
+if not any(len(g) for g in geometri_dict.values()):
     st.warning("Fann ingen gyldige veggeometriar for dette valet.")
     st.stop()
 
@@ -140,7 +140,7 @@ risiko_dict = dict(
 # Lag kart
 # --------------------------------------------------
 
-kart = lag_felles_kart(wkt_dict, risiko_dict)
+kart = lag_kart_fra_geometri(geometri_dict, risiko_dict)
 
 if kart is None:
     st.warning("Klarte ikkje å lage kart for dette valet.")
@@ -0,0 +1,61 @@
+"""
+Felles oppsett for testane.
+
+Skripta i datauttrekk/ importerer kvarandre som toppnivåmodular
+(`import nvdb_klient`), så mappa blir lagd til i sys.path her.
+
+`stub_server` startar ein lokal HTTP-server i ein eigen tråd. Testen gir ein
+funksjon svar(sti, query) -> (status, body), og får tilbake base-URL og lista
+over kall (sti, query). Body blir sendt som JSON.
+"""
+
+import json
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+
+import pytest
+
+ROT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATAUTTREKK = os.path.join(ROT, "datauttrekk")
+if DATAUTTREKK not in sys.path:
+    sys.path.insert(0, DATAUTTREKK)
+
+Svar = Callable[[str, Dict[str, str]], Tuple[int, Any]]
+
+
+@pytest.fixture
+def stub_server():
+    serverar = []
+
+    def _start(svar: Svar) -> Tuple[str, List[Tuple[str, Dict[str, str]]]]:
+        kall: List[Tuple[str, Dict[str, str]]] = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                kall.append((url.path, query))
+                status, body = svar(url.path, query)
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        serverar.append(server)
+        return f"http://127.0.0.1:{server.server_port}", kall
+
+    yield _start
+    for server in serverar:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,157 @@
+"""get_fallvilt mot ein lokal stub av fallvilt-API-et (base_url peikar på stuben)."""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import get_fallvilt as gf
+
+PAGE_SIZE = 10
+ALLE_ID = list(range(1, 48))       # 5 sider, siste side er ikkje full
+
+
+def _rad(i):
+    rad = {
+        "FallviltId": i,
+        "HendelsesDatoTid": f"2025-03-{i % 28 + 1:02d}T10:00:00",
+        "OppdatertDatoTid": f"2025-04-01T12:{i % 60:02d}:00",
+        "Art": ["Elg", "Rådyr", "Hjort"][i % 3],
+        "Kommune": {"KommuneNummer": "5001", "KommuneNavn": "Trondheim"},
+        "Latitude": 63.4 + i / 1000,
+        "Longitude": 10.4 + i / 1000,
+    }
+    # Råkolonnar som berre finst på nokre sider
+    if i > 35:
+        rad["Merknad"] = f"merknad {i}"
+    return rad
+
+
+@pytest.fixture
+def fallvilt_api(stub_server):
+    tilstand = {"feil_side": None, "rader": {i: _rad(i) for i in ALLE_ID}}
+
+    def svar(sti, query):
+        if sti != "/api/v0/fallvilt":
+            return 404, {}
+        side = int(query["page"])
+        if side == tilstand["feil_side"]:
+            tilstand["feil_side"] = None
+            return 400, {"feil": "avbrot"}
+        n = int(query["pageSize"])
+        id_ar = sorted(tilstand["rader"])[(side - 1) * n:side * n]
+        return 200, [tilstand["rader"][i] for i in id_ar]
+
+    base_url, kall = stub_server(svar)
+    return base_url + "/api/v0/fallvilt", kall, tilstand
+
+
+def _sider(kall):
+    return sorted(int(q["page"]) for _, q in kall)
+
+
+def test_avbroten_og_gjenopptatt_henting(fallvilt_api, tmp_path):
+    url, kall, tilstand = fallvilt_api
+    mappe = str(tmp_path / "sider")
+
+    tilstand["feil_side"] = 3
+    with pytest.raises(RuntimeError):
+        gf.paginate_concurrent(mappe, page_size=PAGE_SIZE, max_workers=2, base_url=url)
+    with open(os.path.join(mappe, gf.CHECKPOINT_FIL), encoding="utf-8") as fil:
+        ferdige_før = set(json.load(fil)["ferdige"])
+    assert ferdige_før and 3 not in ferdige_før
+
+    kall.clear()
+    antal = gf.paginate_concurrent(mappe, page_size=PAGE_SIZE, max_workers=2, base_url=url)
+    assert antal == 5
+    # Ferdige sider blir ikkje henta igjen
+    assert not ferdige_før & set(_sider(kall))
+    assert 3 in _sider(kall)
+
+    kall.clear()
+    alle = gf.paginate_all(page_size=PAGE_SIZE, base_url=url)
+    assert list(gf.les_sider(mappe)) == alle
+
+
+def test_ny_parametrar_startar_på_nytt(fallvilt_api, tmp_path):
+    url, kall, _ = fallvilt_api
+    mappe = str(tmp_path / "sider")
+    gf.paginate_concurrent(mappe, page_size=PAGE_SIZE, base_url=url)
+    kall.clear()
+    gf.paginate_concurrent(mappe, fra_dato="2025-02-01", page_size=PAGE_SIZE, base_url=url)
+    assert _sider(kall)[:5] == [1, 2, 3, 4, 5]
+
+
+def test_sider_til_csv_lik_heil_fil(fallvilt_api, tmp_path):
+    url, _, _ = fallvilt_api
+    mappe = str(tmp_path / "sider")
+    gf.paginate_concurrent(mappe, page_size=PAGE_SIZE, base_url=url)
+
+    side_csv = str(tmp_path / "sider.csv")
+    heil_csv = str(tmp_path / "heil.csv")
+    assert gf.sider_til_csv(mappe, side_csv) == len(ALLE_ID)
+    gf.to_csv_custom(gf.paginate_all(page_size=PAGE_SIZE, base_url=url), heil_csv)
+
+    with open(side_csv, encoding="utf-8") as a, open(heil_csv, encoding="utf-8") as b:
+        assert a.read() == b.read()
+    df = pd.read_csv(side_csv, sep=";")
+    assert list(df.columns[-len(gf.DESIRED):]) == gf.DESIRED
+    assert df["Merknad"].notna().sum() == len([i for i in ALLE_ID if i > 35])
+
+
+def test_delta_synk_med_duplikat_i_lagra_fil(fallvilt_api, tmp_path):
+    url, _, tilstand = fallvilt_api
+    out_csv = str(tmp_path / "fallvilt.csv")
+    synk_fil = str(tmp_path / "synk.json")
+
+    # Lagra fil frå ei full henting der id 5 kom med to gonger
+    rader = gf.paginate_all(page_size=PAGE_SIZE, base_url=url)
+    gf.to_csv_custom(rader + [rader[4]], out_csv)
+
+    tilstand["rader"][5] = dict(_rad(5), Art="Elg", OppdatertDatoTid="2025-05-01T00:00:00")
+    tilstand["rader"][100] = _rad(100)
+    endra = gf.delta_synk(out_csv, synk_fil=synk_fil, start_dato="2025-01-01",
+                          page_size=PAGE_SIZE, base_url=url)
+    assert sorted(endra, key=int) == ["5", "100"]
+
+    ut = pd.read_csv(out_csv, sep=";", dtype=str, keep_default_na=False)
+    assert ut["Fallvilt-ID"].is_unique
+    assert ut.loc[ut["Fallvilt-ID"] == "5", "Art"].tolist() == ["Elg"]
+    assert len(ut) == len(ALLE_ID) + 1
+
+
+def _pyproj_utm33(lat, lon):
+    pyproj = pytest.importorskip("pyproj")
+    transformer = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:32633", always_xy=True)
+    return transformer.transform(lon, lat)
+
+
+@pytest.mark.parametrize("lat, lon, toleranse", [
+    ((62.2, 65.5), (8.0, 14.5), 0.01),    # Trøndelag: millimeter
+    ((58.0, 71.0), (4.5, 31.0), 1.0),     # heile landet, opptil 11 grader frå sentralmeridianen
+])
+def test_utm33_lik_pyproj(lat, lon, toleranse):
+    la, lo = np.meshgrid(np.linspace(*lat, 25), np.linspace(*lon, 25))
+    la, lo = la.ravel(), lo.ravel()
+    x, y = gf.wgs84_to_utm33_array(la, lo)
+    venta_x, venta_y = _pyproj_utm33(la, lo)
+    np.testing.assert_allclose(x, venta_x, rtol=0, atol=toleranse)
+    np.testing.assert_allclose(y, venta_y, rtol=0, atol=toleranse)
+
+
+def test_utm33_ugyldige_verdiar_og_series():
+    lat = pd.Series(["63.43", "63,5", None, "abc", 63.1, "64.0"], index=[10, 11, 12, 13, 14, 15])
+    lon = pd.Series([10.39, 10.5, 10.4, 10.4, float("nan"), "12.25"], index=lat.index)
+    x, y = gf.wgs84_to_utm33_array(lat, lon)
+
+    # Tekst blir tolka, men desimalkomma, None, ikkje-tal og NaN gir NaN i begge
+    gyldig = np.array([True, False, False, False, False, True])
+    assert np.array_equal(np.isfinite(x), gyldig) and np.array_equal(np.isfinite(y), gyldig)
+    venta_x, venta_y = _pyproj_utm33(np.array([63.43, 64.0]), np.array([10.39, 12.25]))
+    np.testing.assert_allclose(x[gyldig], venta_x, rtol=0, atol=0.01)
+    np.testing.assert_allclose(y[gyldig], venta_y, rtol=0, atol=0.01)
+
+    # Skalarversjonen gir same svar som éi rad i array-versjonen
+    assert gf.wgs84_to_utm33(63.43, 10.39) == (x[0], y[0])
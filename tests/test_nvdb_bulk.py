@@ -0,0 +1,151 @@
+"""nvdb_bulk mot ein lokal NVDB-stub (nvdb_klient.NVDB_LES_URL peikar på stuben)."""
+
+import asyncio
+
+import pandas as pd
+import pytest
+
+import combined_vegobjekter_enrichment as cve
+import nvdb_bulk
+import nvdb_klient
+
+SIDE = 3                                           # objekt per side i stuben
+I_NVDB = {str(i) for i in range(1000, 1250)}      # id-ar som finst
+IKKJE_I_BULK = {"1003", "1107"}                    # finst, men kjem ikkje i ids=-svaret
+
+
+def _objekt(i: str):
+    return {
+        "id": int(i),
+        "metadata": {"versjon": 2},
+        "geometri": {"wkt": f"LINESTRING Z (300000 7000000 1, {300000 + int(i)} 7000100 2)"},
+        "lokasjon": {"lengde": float(int(i) % 500)},
+        "egenskaper": [{"navn": "ÅDT, total", "verdi": int(i) % 5000}, {"navn": "Tom", "verdi": None}],
+    }
+
+
+def _svar(base_url):
+    def svar(sti, query):
+        if sti == "/vegobjekter/api/v4/vegobjekter/540":
+            treff = [i for i in query["ids"].split(",") if i in I_NVDB - IKKJE_I_BULK]
+            start = int(query.get("start", "0"))
+            bit = treff[start:start + SIDE]
+            neste = dict(query, start=str(start + SIDE))
+            href = f"{base_url()}{sti}?" + "&".join(f"{k}={v}" for k, v in neste.items())
+            return 200, {"objekter": [_objekt(i) for i in bit],
+                         "metadata": {"returnert": len(bit), "neste": {"href": href}}}
+        if sti.startswith("/vegobjekter/540/"):
+            i = sti.rsplit("/", 1)[1]
+            return (200, _objekt(i)) if i in I_NVDB else (404, {})
+        return 404, {}
+    return svar
+
+
+@pytest.fixture
+def nvdb(stub_server, monkeypatch):
+    for cache in (nvdb_bulk.objekt_cache, nvdb_bulk.wkt_cache, nvdb_bulk.lengde_cache,
+                  nvdb_bulk.egenskap_cache, cve.lengde_cache):
+        cache.clear()
+    url = {}
+    base_url, kall = stub_server(_svar(lambda: url["base"]))
+    url["base"] = base_url
+    monkeypatch.setattr(nvdb_klient, "NVDB_LES_URL", base_url)
+    return kall
+
+
+def _hent(ids):
+    async def _køyr():
+        # Utan takt mot stuben; base-URL-en kjem frå NVDB_LES_URL
+        async with nvdb_klient.NvdbKlient(rate_per_sekund=0) as klient:
+            return await nvdb_bulk.hent_vegobjekter_bulk(540, ids, klient=klient)
+    return asyncio.run(_køyr())
+
+
+def test_batchar_paginering_og_cachar(nvdb):
+    ids = [str(i) for i in range(1000, 1250)] + ["1000.0", "", "nan"]
+    svar = _hent(ids)
+
+    # 250 unike id-ar -> batchar på 100, 100 og 50 (første side av kvar batch har ids=)
+    første_sider = [q for sti, q in nvdb if "start" not in q]
+    assert sorted(len(q["ids"].split(",")) for q in første_sider) == [50, 100, 100]
+    assert all(q["inkluder"] == nvdb_bulk.INKLUDER for q in første_sider)
+
+    # Alle sidene er følgde via metadata.neste.href (pluss éi tom side per batch)
+    venta = set(I_NVDB) - IKKJE_I_BULK
+    assert set(svar) == venta
+    treff_per_batch = [len([i for i in q["ids"].split(",") if i in venta]) for q in første_sider]
+    assert len(nvdb) == sum(-(-n // SIDE) + 1 for n in treff_per_batch)
+
+    assert nvdb_bulk.wkt_cache["1042"] == _objekt("1042")["geometri"]["wkt"]
+    assert nvdb_bulk.lengde_cache["1042"] == "42.0"
+    assert nvdb_bulk.egenskap_cache["1042"] == {"ÅDT, total": "1042", "Tom": ""}
+    assert not IKKJE_I_BULK & set(nvdb_bulk.objekt_cache)
+
+
+def test_cache_gir_ingen_nye_kall(nvdb):
+    _hent(["1001", "1002"])
+    før = len(nvdb)
+    svar = _hent(["1001", "1002"])
+    assert set(svar) == {"1001", "1002"}
+    assert len(nvdb) == før
+
+
+def test_enkeltoppslag_for_id_ar_bulk_ikkje_gav(nvdb):
+    df = pd.DataFrame({
+        "ÅDT, total": "", "Fartsgrense": "",
+        cve.id_540_col: ["1001", "1003", "1107", "9999", "", "1001"],
+    })
+
+    async def _køyr():
+        async with nvdb_klient.NvdbKlient(rate_per_sekund=0) as klient:
+            return await cve.berik(klient, df)
+
+    ut = asyncio.run(_køyr())
+    assert ut[cve.lengde_col_name].tolist() == ["1.0", "3.0", "107.0", "", "", "1.0"]
+
+    # Enkeltkall berre for id-ane bulk-kallet ikkje returnerte
+    enkelt = sorted(sti.rsplit("/", 1)[1] for sti, _ in nvdb if sti.startswith("/vegobjekter/540/"))
+    assert enkelt == ["1003", "1107", "9999"]
+
+
+def test_feila_side_blir_ikkje_cacha_som_tom_sekvens(stub_server, monkeypatch):
+    nvdb_bulk.stedfesting_cache.clear()
+    tilstand = {"feil": True}
+
+    def svar(sti, query):
+        if "veglenkesekvens" not in query:
+            return 404, {}
+        vls = [v.split("@")[1] for v in query["veglenkesekvens"].split(",")]
+        side = int(query.get("side", "0"))
+        if "2" in vls and side == 1 and tilstand["feil"]:
+            return 400, {}
+        objekter = [] if side else [
+            {"id": 7000 + int(v), "lokasjon": {"stedfestinger": [
+                {"veglenkesekvensid": int(v), "startposisjon": 0.2, "sluttposisjon": 0.1}]}}
+            for v in vls if v != "3"
+        ]
+        neste = dict(query, side=str(side + 1))
+        href = f"{url['base']}{sti}?" + "&".join(f"{k}={v}" for k, v in neste.items())
+        return 200, {"objekter": objekter, "metadata": {"returnert": len(objekter), "neste": {"href": href}}}
+
+    url = {}
+    url["base"], kall = stub_server(svar)
+    monkeypatch.setattr(nvdb_klient, "NVDB_LES_URL", url["base"])
+
+    def _køyr(ids):
+        async def _k():
+            async with nvdb_klient.NvdbKlient(rate_per_sekund=0) as klient:
+                return await nvdb_bulk.hent_for_veglenkesekvensar(klient, 105, ids, vls_per_request=2)
+        return asyncio.run(_k())
+
+    # Batchar [1, 2] og [3, 4]; andre side for batchen med 2 feilar
+    ut = _køyr(["1", "2", "3", "4"])
+    assert ut == {"3": [], "4": [(0.1, 0.2, "7004")]}
+    assert set(nvdb_bulk.stedfesting_cache[105]) == {"3", "4"}
+
+    # Neste kall prøver berre den feila batchen på nytt
+    tilstand["feil"] = False
+    kall.clear()
+    ut = _køyr(["1", "2", "3", "4"])
+    assert ut["1"] == [(0.1, 0.2, "7001")] and ut["2"] == [(0.1, 0.2, "7002")]
+    assert {q["veglenkesekvens"] for _, q in kall} == {"0-1@1,0-1@2"}
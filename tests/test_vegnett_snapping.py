@@ -0,0 +1,77 @@
+"""vegnett_snapping.snapp samanlikna med svar frå /posisjon (stubba) for same punkt."""
+
+import pytest
+
+import enrich_fallvilt_with_nvdb_position as pos
+import vegnett_snapping as vs
+
+VEGSYSTEM = {"vegkategori": "E", "fase": "V", "nummer": 6}
+STREKNING = {"strekning": 1, "delstrekning": 1, "arm": False, "adskilte_løp": "Nei",
+             "trafikantgruppe": "K", "retning": "MED"}
+
+SEGMENT = [
+    {   # Vanleg strekning
+        "veglenkesekvensid": 111, "startposisjon": 0.2, "sluttposisjon": 0.4, "kommune": 5001,
+        "geometri": {"wkt": "LINESTRING Z (270000 7040000 10, 270200 7040000 20)", "srid": 5973},
+        "vegsystemreferanse": {
+            "vegsystem": VEGSYSTEM,
+            "strekning": dict(STREKNING, fra_meter=100, til_meter=300),
+            "kortform": "EV6 S1D1 m100-300",
+        },
+    },
+    {   # Sideanlegg: strekninga har berre tilknytingsmeteren, delen har eigen meterverdi
+        "veglenkesekvensid": 222, "startposisjon": 0.0, "sluttposisjon": 1.0, "kommune": 5001,
+        "geometri": {"wkt": "LINESTRING Z (271000 7041000 5, 271000 7041050 5)", "srid": 5973},
+        "vegsystemreferanse": {
+            "vegsystem": VEGSYSTEM,
+            "strekning": dict(STREKNING, meter=120),
+            "sideanlegg": {"sideanlegg": 1, "sideanleggsdel": 1, "fra_meter": 0, "til_meter": 50},
+            "kortform": "EV6 S1D1 m120 SD1 m0-50",
+        },
+    },
+]
+
+
+def _posisjon_svar(kortform, strekning, vls, relpos, wkt, avstand):
+    """Første treff i eit /posisjon-svar, slik NVDB returnerer det."""
+    return {
+        "vegsystemreferanse": {"vegsystem": VEGSYSTEM, "strekning": strekning, "kortform": kortform},
+        "veglenkesekvens": {"veglenkesekvensid": vls, "relativPosisjon": relpos, "kortform": f"{relpos}@{vls}"},
+        "geometri": {"wkt": wkt, "srid": 5973},
+        "kommune": 5001,
+        "avstand": avstand,
+    }
+
+
+PUNKT = [
+    ((270050.0, 7040010.0), _posisjon_svar(
+        "EV6 S1D1 m150", dict(STREKNING, meter=150), 111, 0.25, "POINT Z (270050 7040000 12.5)", 10)),
+    ((271003.0, 7041020.0), _posisjon_svar(
+        "EV6 S1D1 m120 SD1 m20", dict(STREKNING, meter=120), 222, 0.4, "POINT Z (271000 7041020 5)", 3)),
+]
+
+TEKST = ["vegsystemreferanse.kortform", "vegkategori", "fase", "vegnr", "strekning", "delstrekning",
+         "arm", "adskilte_løp", "trafikantgruppe", "retning", "veglenkesekvensid",
+         "geometri.srid", "kommune (treff)"]
+TAL = ["meter", "relativPosisjon", "avstand_vegnettet_m"]
+
+
+@pytest.fixture(scope="module")
+def indeks():
+    return vs.bygg_indeks(vs.vegnett_fra_segment(SEGMENT))
+
+
+@pytest.mark.parametrize("punkt, svar", PUNKT, ids=["strekning", "sideanlegg"])
+def test_snapp_lik_posisjon(indeks, punkt, svar):
+    snappa = vs.snapp(indeks, [punkt[0]], [punkt[1]]).iloc[0]
+    venta = pos.extract_fields(svar)
+    for kolonne in TEKST:
+        assert str(snappa[kolonne]) == str(venta[kolonne]), kolonne
+    for kolonne in TAL:
+        assert float(snappa[kolonne]) == pytest.approx(float(venta[kolonne]), abs=1e-6), kolonne
+
+
+def test_utan_treff_gir_tomme_kolonnar(indeks):
+    ut = vs.snapp(indeks, [100000.0, float("nan")], [6000000.0, 7040000.0])
+    assert (ut == "").all().all()
+    assert list(ut.columns) == pos.NEW_COLS
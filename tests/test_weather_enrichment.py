@@ -0,0 +1,165 @@
+"""Bulk-vêrhentinga i weather_enrichment med frost_get bytt ut med ein lokal stub."""
+
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+# weather_enrichment krev Frost-nøklar ved import; stuben brukar dei ikkje
+os.environ.setdefault("clientID", "test")
+os.environ.setdefault("clientSecret", "test")
+
+import vaer_lager
+import weather_enrichment as we
+
+# Dagar der stasjonen manglar P1D (rå timesdata blir brukt i staden)
+UTAN_P1D = {("SN1", "2020-01-12")}
+# Dag der Frost gir to P1D-rader for same dato; den siste skal vinne
+DUPLIKAT = ("SN1", "2020-01-10")
+
+
+def _p1d_verdi(station, dato, element):
+    return float(int(dato[-2:]) + list(we.P1D_KOLONNER).index(element) / 10 + (station == "SN3"))
+
+
+def _dagar(referencetime):
+    fra, til = referencetime.split("/")
+    return [d.strftime("%Y-%m-%d") for d in pd.date_range(fra[:10], til[:10], inclusive="left")]
+
+
+def _frost_get(kall):
+    def frost_get(url, params):
+        kall.append(dict(params))
+        station, element = params["sources"], params["elements"].split(",")
+        data = []
+        if params["elements"] == we.RAW_ELEMENTS:
+            dato = params["referencetime"][:10]
+            for time, temp in [(0, -2.0), (12, 4.0)]:
+                data.append({
+                    "referenceTime": f"{dato}T{time:02d}:00:00.000Z",
+                    "observations": [
+                        {"elementId": "air_temperature", "value": temp, "unit": "degC"},
+                        {"elementId": "precipitation_amount", "value": 0.5, "unit": "mm"},
+                    ],
+                })
+            return {"data": data}
+        for dato in _dagar(params["referencetime"]):
+            if element == we.SNOW_ELEMENTS:
+                # Eit lågare prioritert snøelement først i svaret
+                data.append({"referenceTime": f"{dato}T06:00:00.000Z", "observations": [
+                    {"elementId": "surface_snow_thickness", "value": 99, "unit": "cm"},
+                    {"elementId": "snow_depth", "value": int(dato[-2:]), "unit": "cm"},
+                ]})
+                continue
+            if (station, dato) in UTAN_P1D:
+                continue
+            obs = [{"elementId": e, "value": _p1d_verdi(station, dato, e), "unit": "degC"} for e in element]
+            if (station, dato) == DUPLIKAT:
+                data.append({"referenceTime": f"{dato}T00:00:00.000Z", "observations": [
+                    dict(o, value=-99.0) for o in obs
+                ]})
+            data.append({"referenceTime": f"{dato}T00:00:00.000Z", "observations": obs})
+        return {"data": data}
+    return frost_get
+
+
+@pytest.fixture
+def frost(monkeypatch, tmp_path):
+    # Vêrlageret (relativ sti) blir oppretta i tmp_path, utan opne tilkoplingar frå før
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vaer_lager, "_lokal", threading.local())
+    monkeypatch.setattr(we, "raw_cache", {})
+
+    kall = []
+    monkeypatch.setattr(we, "frost_get", _frost_get(kall))
+    return kall
+
+
+def test_datovindauge():
+    datoer = ["2020-01-05", "2020-01-01", "2020-01-03", "2020-01-03", "2020-01-20"]
+    assert we.datovindauge(datoer, vindu_dager=7) == [
+        ("2020-01-01", "2020-01-06"),
+        ("2020-01-20", "2020-01-21"),
+    ]
+    assert we.datovindauge([], vindu_dager=7) == []
+
+
+def test_hent_vaer_bulk(frost):
+    par = pd.DataFrame({
+        "station":      ["SN1", "SN1", "SN1", "SN1", "SN3", ""],
+        "snow_station": ["SN2", "SN2", "SN2", "",    "SN2", "SN2"],
+        "dato": ["2020-01-10", "2020-01-12", "2021-06-01", "2020-01-10", "2020-01-10", "2020-01-11"],
+    })
+    ut = we.hent_vaer_bulk(par).set_index(["station", "snow_station", "dato"])
+
+    # SN1 har datoar meir enn BULK_VINDU_DAGER frå kvarandre -> to P1D-vindauge
+    p1d = sorted((k["sources"], k["referencetime"]) for k in frost
+                 if k["elements"] == ",".join(we.P1D_KOLONNER))
+    assert p1d == [
+        ("SN1", "2020-01-10/2020-01-13"),
+        ("SN1", "2021-06-01/2021-06-02"),
+        ("SN3", "2020-01-10/2020-01-11"),
+    ]
+    snø = sorted(k["referencetime"] for k in frost if k["elements"] == ",".join(we.SNOW_ELEMENTS))
+    assert snø == ["2020-01-10/2020-01-13", "2021-06-01/2021-06-02"]
+
+    # Pivot av P1D, siste rad vinn for duplikat
+    rad = ut.loc[("SN1", "SN2", "2020-01-10")]
+    for element, kolonne in we.P1D_KOLONNER.items():
+        assert rad[kolonne] == f"{_p1d_verdi('SN1', '2020-01-10', element)} degC"
+    assert ut.loc[("SN3", "SN2", "2020-01-10"), "mean_temperature"] == "11.2 degC"
+
+    # Snødybde frå snøstasjonen, snow_depth før surface_snow_thickness
+    assert rad["snow_depth"] == "10 cm"
+    assert rad["weather_station_id"] == "SN1"
+    assert ut.loc[("SN1", "", "2020-01-10"), "snow_depth"] == ""
+    assert ut.loc[("SN1", "", "2020-01-10"), "max_temperature"] == rad["max_temperature"]
+    assert ut.loc[("", "SN2", "2020-01-11"), "snow_depth"] == "11 cm"
+    assert ut.loc[("", "SN2", "2020-01-11"), "mean_temperature"] == ""
+
+    # Rå timesdata berre for dagen utan P1D
+    raa = [(k["sources"], k["referencetime"][:10]) for k in frost if k["elements"] == we.RAW_ELEMENTS]
+    assert raa == [("SN1", "2020-01-12")]
+    fallback = ut.loc[("SN1", "SN2", "2020-01-12")]
+    assert fallback["max_temperature"] == "4.0 degC"
+    assert fallback["min_temperature"] == "-2.0 degC"
+    assert fallback["total_precipitation"] == "1.0 mm"
+    assert fallback["max_wind_speed"] == ""
+    assert fallback["snow_depth"] == "12 cm"
+
+    # Alt ligg i lageret: ny køyring gjer ingen kall
+    frost.clear()
+    igjen = we.hent_vaer_bulk(par).set_index(["station", "snow_station", "dato"])
+    assert frost == []
+    pd.testing.assert_frame_equal(igjen.loc[ut.index], ut)
+
+
+def test_radvis_arv_frå_seinare_chunk(monkeypatch, tmp_path):
+    inn, ut = tmp_path / "inn.csv", tmp_path / "ut.csv"
+    inn.write_text(
+        "Fallvilt-ID;Kommune;Dato;UTM33 øst;UTM33 nord\n"
+        "1;Trondheim;01.02.2024;;\n"                   # arvar frå id 4, som ligg i ein seinare chunk
+        "2;Trondheim;02.02.2024;270000;7040000\n"
+        "3;Malvik;01.02.2024;;\n"                      # ingen rad å arve frå
+        "4;Trondheim;01.02.2024;280000;7035000\n"
+        "5;Trondheim;01.02.2024;290000;7036000\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(we, "INPUT_CSV", str(inn))
+    monkeypatch.setattr(we, "OUTPUT_CSV", str(ut))
+    monkeypatch.setattr(we, "get_daily_weather", lambda lon, lat, dato: {
+        "mean_temperature": f"{lon:.4f} degC", "weather_station_id": f"SN{lat:.4f}"})
+
+    def køyr(chunk_size):
+        monkeypatch.setattr(we, "CHUNK_SIZE", chunk_size)
+        we.main(ny=True)
+        return pd.read_csv(ut, sep=";", dtype=str, keep_default_na=False).set_index("Fallvilt-ID")
+
+    df = køyr(2)
+    vaer = ["mean_temperature", "weather_station_id"]
+    assert df.loc["1", vaer].tolist() == df.loc["4", vaer].tolist()
+    assert df.loc["1", "weather_station_id"] != df.loc["5", "weather_station_id"]
+    assert df.loc["3", vaer].tolist() == ["", ""]
+    # Same vêr uansett kvar chunkgrensene går
+    pd.testing.assert_frame_equal(df[vaer], køyr(100)[vaer])